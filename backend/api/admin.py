@@ -2,7 +2,10 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.utils import timezone
 
-from .models import AIChatMessage, AIChatSession, Conversation, CounselorProfile, CustomUser, Message, MoodNote, UserAchievement
+from .models import (
+    AIChatMessage, AIChatSession, AIChatSummaryJob, Conversation, CounselorProfile, CustomUser, Message, MoodNote,
+    NoteAnalysisJob, UserAchievement,
+)
 
 
 @admin.register(CustomUser)
@@ -23,6 +26,22 @@ class MoodNoteAdmin(admin.ModelAdmin):
     list_per_page = 50
 
 
+@admin.register(NoteAnalysisJob)
+class NoteAnalysisJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'note', 'status', 'attempts', 'created_at', 'finished_at')
+    list_filter = ('status',)
+    readonly_fields = ('created_at', 'started_at', 'finished_at')
+    list_per_page = 50
+
+
+@admin.register(AIChatSummaryJob)
+class AIChatSummaryJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'session', 'status', 'attempts', 'created_at', 'finished_at')
+    list_filter = ('status',)
+    readonly_fields = ('created_at', 'started_at', 'finished_at')
+    list_per_page = 50
+
+
 @admin.register(CounselorProfile)
 class CounselorProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'license_number', 'specialty', 'status', 'created_at')
@@ -11,6 +11,13 @@ class ApiConfig(AppConfig):
 
     def ready(self):
         import os
+        from django.conf import settings
+        if getattr(settings, 'JIEBA_PRELOAD', False):
+            try:
+                from api.services.ai_engine import init_jieba
+                init_jieba()
+            except Exception as e:
+                logger.warning('jieba preload failed: %s', e)
         if not os.getenv('DJANGO_DEBUG', 'False').lower() in ('true', '1', 'yes'):
             if not os.getenv('REDIS_URL'):
                 logger.warning(
@@ -1,9 +1,13 @@
 import asyncio
+import logging
+import time
 
 from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
 from django.contrib.auth.models import AnonymousUser
 
+logger = logging.getLogger(__name__)
+
 HEARTBEAT_INTERVAL = 30  # seconds
 
 
@@ -235,3 +239,155 @@ class NotificationConsumer(HeartbeatMixin, AuthMixin, AsyncJsonWebsocketConsumer
 
     async def notify(self, event):
         await self.send_json(event['data'])
+
+
+class AIChatConsumer(HeartbeatMixin, AuthMixin, AsyncJsonWebsocketConsumer):
+    """Streams AI chat replies token by token for one of the user's AI chat sessions.
+
+    Client sends {"type": "message", "content": "..."}; the server answers with
+    ``ai_chat.user_message``, a run of ``ai_chat.delta`` frames, then
+    ``ai_chat.done`` carrying the persisted assistant message. A stream cut off
+    part-way is saved with a truncation marker and announced by an
+    ``ai_chat.error`` frame (code ``stream_interrupted``) before ``done``. The REST
+    ``ai-chat/sessions/<id>/messages/`` endpoint remains the non-streaming fallback.
+    """
+
+    async def connect(self):
+        self.session_id = self.scope['url_route']['kwargs']['session_id']
+        self._authenticated = False
+        self._generating = False
+
+        # Accept connection first (needed for first-message auth)
+        await self.accept()
+
+        user = self.scope.get('user')
+        if self.is_authenticated():
+            if not await self.check_session(user.id, self.session_id):
+                await self.send_json({'error': 'Session not found'})
+                await self.close()
+                return
+            self._authenticated = True
+            await self.start_heartbeat()
+
+    async def disconnect(self, close_code):
+        await self.stop_heartbeat()
+
+    async def receive_json(self, content):
+        if content.get('type') == 'pong':
+            return
+
+        if not self._authenticated:
+            if content.get('type') == 'auth':
+                if not await self.authenticate_via_message(content):
+                    return
+                user = self.scope['user']
+                if not await self.check_session(user.id, self.session_id):
+                    await self.send_json({'error': 'Session not found'})
+                    await self.close()
+                    return
+                self._authenticated = True
+                await self.start_heartbeat()
+                await self.send_json({'type': 'auth_ok'})
+                return
+            else:
+                await self.send_json({'error': 'Authentication required'})
+                await self.close()
+                return
+
+        if content.get('type') != 'message':
+            return
+        from .services.ai_chat import MAX_AI_CHAT_MESSAGE_LENGTH
+        text = (content.get('content') or '').strip()
+        if not text:
+            await self.send_json({'type': 'ai_chat.error', 'code': 'message_empty'})
+            return
+        if len(text) > MAX_AI_CHAT_MESSAGE_LENGTH:
+            await self.send_json({'type': 'ai_chat.error', 'code': 'message_too_long'})
+            return
+        if self._generating:
+            await self.send_json({'type': 'ai_chat.error', 'code': 'reply_in_progress'})
+            return
+        # Same per-user quota as the REST endpoint, so the socket is not a way around it
+        wait = await self.throttle_wait(self.scope['user'])
+        if wait is not None:
+            await self.send_json({'type': 'ai_chat.error', 'code': 'throttled', 'retry_after': wait})
+            return
+
+        self._generating = True
+        try:
+            headers = dict(self.scope.get('headers') or [])
+            lang = content.get('lang') or headers.get(b'accept-language', b'').decode('latin-1')
+            await self.stream_reply(text, lang)
+        finally:
+            self._generating = False
+
+    async def stream_reply(self, text, lang):
+        from .services.ai_chat import TRUNCATED_MARKERS, StreamInterrupted, _get_lang, stream_ai_response
+
+        lang = _get_lang(lang)
+        user_msg, history, summary = await self.save_user_message(self.scope['user'].id, self.session_id, text)
+        await self.send_json({'type': 'ai_chat.user_message', 'message': user_msg})
+
+        started = time.monotonic()
+        ttft = None
+        parts = []
+        interrupted = False
+        try:
+            async for delta in stream_ai_response(history, lang, summary):
+                if ttft is None:
+                    ttft = time.monotonic() - started
+                parts.append(delta)
+                await self.send_json({'type': 'ai_chat.delta', 'delta': delta})
+        except StreamInterrupted:
+            interrupted = True
+
+        # Keep what was streamed, marked as cut off (StreamInterrupted implies some text)
+        reply = ''.join(parts).strip()
+        if interrupted:
+            reply += TRUNCATED_MARKERS[lang]
+        ai_msg = await self.save_ai_message(self.session_id, reply)
+        logger.info(
+            'AI chat stream session=%s ttft=%.0f ms total=%.0f ms interrupted=%s',
+            self.session_id, (ttft or 0) * 1000, (time.monotonic() - started) * 1000, interrupted,
+        )
+        if interrupted:
+            await self.send_json({'type': 'ai_chat.error', 'code': 'stream_interrupted'})
+        await self.send_json({'type': 'ai_chat.done', 'message': ai_msg})
+        await self.queue_summary(self.session_id)
+
+    @database_sync_to_async
+    def throttle_wait(self, user):
+        """Seconds until ``user`` may send again under AIChatThrottle, or None if allowed now."""
+        from types import SimpleNamespace
+        from .throttles import AIChatThrottle
+        throttle = AIChatThrottle()
+        if throttle.allow_request(SimpleNamespace(user=user), None):
+            return None
+        return round(throttle.wait() or 0)
+
+    @database_sync_to_async
+    def check_session(self, user_id, session_id):
+        from .models import AIChatSession
+        return AIChatSession.objects.filter(id=session_id, user_id=user_id, is_active=True).exists()
+
+    @database_sync_to_async
+    def save_user_message(self, user_id, session_id, text):
+        from .models import AIChatSession
+        from .serializers import AIChatMessageSerializer
+        from .services.ai_chat import load_context, save_user_message
+        session = AIChatSession.objects.get(id=session_id, user_id=user_id, is_active=True)
+        user_msg = save_user_message(session, text)
+        return AIChatMessageSerializer(user_msg).data, load_context(session), session.summary
+
+    @database_sync_to_async
+    def save_ai_message(self, session_id, text):
+        from .models import AIChatMessage
+        from .serializers import AIChatMessageSerializer
+        ai_msg = AIChatMessage.objects.create(session_id=session_id, role='assistant', content=text)
+        return AIChatMessageSerializer(ai_msg).data
+
+    @database_sync_to_async
+    def queue_summary(self, session_id):
+        from .models import AIChatSession
+        from .services.analysis_queue import enqueue_summary
+        enqueue_summary(AIChatSession.objects.get(id=session_id))
@@ -0,0 +1,125 @@
+import random
+import subprocess
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+_IMPORT_PROBE = (
+    'import resource, time; t = time.perf_counter(); import {modules}; '
+    'print(time.perf_counter() - t, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)'
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the NumPy/stdlib analytics kernels against the pandas/scipy implementations '
+        'they replace, across input sizes (checks that both give the same output)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            default=[3, 10, 30, 100, 1000, 10_000, 100_000],
+            help='Input rows per run (default: 3 10 30 100 1000 10000 100000)',
+        )
+        parser.add_argument(
+            '--budget',
+            type=float,
+            default=0.5,
+            help='Seconds of timed calls per size and implementation (default: 0.5)',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Random seed for the synthetic inputs (default: 42)',
+        )
+
+    def handle(self, *args, **options):
+        self._report_imports()
+
+        import pandas as pd
+        from django.test import override_settings
+        from scipy import stats
+
+        from api.services import analytics_kernels
+
+        def pandas_pearson(x, y):
+            r, p = stats.pearsonr(pd.Series(x), pd.Series(y))
+            return round(float(r), 3), round(float(p), 4)
+
+        def kernel_pearson(x, y):
+            r, p = analytics_kernels.pearsonr(x, y)
+            return round(r, 3), round(p, 4)
+
+        def pandas_heatmap(x, y):
+            df = pd.DataFrame({'temperature': x, 'sentiment': y})
+            temp_bins = pd.cut(df['temperature'], bins=5, labels=False)
+            sent_bins = pd.cut(df['sentiment'], bins=5, labels=False)
+            counts = df.assign(temp_bin=temp_bins, sent_bin=sent_bins)\
+                .groupby(['temp_bin', 'sent_bin']).size().reset_index(name='count')
+            return [tuple(int(v) for v in row) for row in counts.itertuples(index=False)]
+
+        def kernel_heatmap(x, y):
+            return analytics_kernels.binned_counts(x, y, bins=5)
+
+        def pandas_daily_mean(days, scores):
+            df = pd.DataFrame({'date': days, 'sentiment_score': scores})
+            grouped = df.groupby('date')['sentiment_score'].mean().round(2)
+            return {day: float(val) for day, val in grouped.items()}
+
+        def kernel_daily_mean(days, scores):
+            sums = {}
+            for day, score in zip(days, scores):
+                total, n = sums.get(day, (0.0, 0))
+                sums[day] = (total + score, n + 1)
+            return {day: round(total / n, 2) for day, (total, n) in sorted(sums.items())}
+
+        rng = random.Random(options['seed'])
+        self.stdout.write(
+            f'{"rows":>8}  {"kernel":<12}{"pandas/scipy µs":>16}{"numpy/stdlib µs":>17}{"speed-up":>10}'
+        )
+        # Always time the NumPy path, whatever ANALYTICS_SCIPY_MIN_ROWS is set to
+        with override_settings(ANALYTICS_SCIPY_MIN_ROWS=0):
+            for size in options['sizes']:
+                x = [rng.uniform(5, 35) for _ in range(size)]
+                y = [max(-1.0, min(1.0, (t - 20) / 30 + rng.gauss(0, 0.4))) for t in x]
+                days = [rng.randrange(365) for _ in range(size)]
+                for label, old, new, args in (
+                    ('pearson', pandas_pearson, kernel_pearson, (y, x)),
+                    ('heatmap', pandas_heatmap, kernel_heatmap, (x, y)),
+                    ('daily mean', pandas_daily_mean, kernel_daily_mean, (days, y)),
+                ):
+                    if old(*args) != new(*args):
+                        self.stderr.write(self.style.ERROR(f'{label} at {size} rows: outputs differ'))
+                        continue
+                    old_us = self._time(old, args, options['budget'])
+                    new_us = self._time(new, args, options['budget'])
+                    self.stdout.write(
+                        f'{size:>8}  {label:<12}{old_us:>16,.1f}{new_us:>17,.1f}{old_us / new_us:>9.1f}x'
+                    )
+
+    def _report_imports(self):
+        """Cold import time and peak RSS of a fresh interpreter for each dependency set."""
+        for modules in ('numpy', 'numpy, pandas, scipy.stats'):
+            out = subprocess.run(
+                [sys.executable, '-c', _IMPORT_PROBE.format(modules=modules)],
+                capture_output=True, text=True, check=True,
+            ).stdout.split()
+            seconds, rss_kb = float(out[0]), int(out[1])
+            self.stdout.write(f'import {modules}: {seconds * 1000:.0f} ms, peak RSS {rss_kb / 1024:.0f} MB')
+
+    @staticmethod
+    def _time(func, args, budget) -> float:
+        """Mean microseconds per call over about ``budget`` seconds."""
+        calls = 0
+        start = time.perf_counter()
+        while True:
+            func(*args)
+            calls += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= budget:
+                return elapsed / calls * 1e6
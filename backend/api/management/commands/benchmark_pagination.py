@@ -0,0 +1,107 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare OFFSET + COUNT(*) page-number pagination with keyset pagination of the journal '
+        'feed at a deep page for one heavy synthetic user (everything is rolled back afterwards)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--notes',
+            type=int,
+            default=12_000,
+            help='Synthetic notes for the benchmark user (default: 12000)',
+        )
+        parser.add_argument(
+            '--page',
+            type=int,
+            default=500,
+            help='1-based page to fetch (default: 500)',
+        )
+        parser.add_argument(
+            '--page-size',
+            type=int,
+            default=20,
+            help='Rows per page (default: 20)',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=10,
+            help='Timed runs per strategy (default: 10)',
+        )
+
+    def handle(self, *args, **options):
+        from django.db import transaction
+
+        try:
+            with transaction.atomic():
+                self._run(options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _run(self, options):
+        from datetime import timedelta
+
+        from django.utils import timezone
+        from rest_framework.request import Request
+        from rest_framework.test import APIRequestFactory
+
+        from api.models import CustomUser, MoodNote
+        from api.services.rollups import create_notes
+        from api.views import NotePagination
+
+        size, page = options['page_size'], options['page']
+        offset = (page - 1) * size
+        if offset >= options['notes']:
+            self.stderr.write(self.style.ERROR(f'--notes must exceed {offset} to reach page {page}'))
+            return
+
+        user = CustomUser.objects.create_user(username='__pagination_benchmark__', password=None)
+        now = timezone.now()
+        for start in range(0, options['notes'], 5000):
+            create_notes([
+                MoodNote(user=user, encrypted_content='x', search_text='', is_pinned=i % 500 == 0)
+                for i in range(start, min(start + 5000, options['notes']))
+            ])
+        # auto_now_add stamps every row with the same time; spread them over buckets of 100
+        qs = MoodNote.objects.filter(user=user, is_deleted=False)
+        ids = list(qs.order_by('pk').values_list('pk', flat=True))
+        for start in range(0, len(ids), 100):
+            qs.filter(pk__in=ids[start:start + 100]).update(created_at=now - timedelta(minutes=start))
+
+        ordering = NotePagination.ordering
+        offset_timings, keyset_timings = [], []
+        for _ in range(options['repeat']):
+            t0 = time.perf_counter()
+            qs.count()
+            offset_rows = list(qs.order_by(*ordering)[offset:offset + size])
+            offset_timings.append(time.perf_counter() - t0)
+
+        # Cursor of the last row on the previous page, as a client holding the `next` link would send it
+        paginator = NotePagination()
+        paginator.fields = ordering
+        cursor = paginator.encode_cursor(qs.order_by(*ordering)[offset - 1]) if offset else ''
+        factory = APIRequestFactory()
+        for _ in range(options['repeat']):
+            request = Request(factory.get('/api/notes/', {'cursor': cursor, 'page_size': size} if cursor else {}))
+            t0 = time.perf_counter()
+            keyset_rows = NotePagination().paginate_queryset(qs, request)
+            keyset_timings.append(time.perf_counter() - t0)
+
+        same = [n.pk for n in offset_rows] == [n.pk for n in keyset_rows]
+        self.stdout.write(f'{options["notes"]} notes, page {page} of {size}:')
+        self.stdout.write(f'  OFFSET + COUNT(*): median {statistics.median(offset_timings) * 1000:8.2f} ms')
+        self.stdout.write(f'  keyset cursor:     median {statistics.median(keyset_timings) * 1000:8.2f} ms')
+        if not same:
+            self.stderr.write(self.style.ERROR('Keyset page differs from the OFFSET page'))
@@ -0,0 +1,116 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+
+class _Rollback(Exception):
+    pass
+
+
+_WORDS = [
+    '今天', '心情', '焦慮', '睡不著', '工作', '壓力', '朋友', '散步', '放鬆', '家人', '考試', '開心',
+    '難過', '運動', '咖啡', '下雨', '會議', '加班', '晚餐', '音樂', 'happy', 'tired', 'coffee', 'meeting',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark note keyword search backends on synthetic notes for one throwaway user '
+        '(everything is rolled back afterwards)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--notes',
+            type=int,
+            default=100_000,
+            help='Synthetic notes for the benchmark user (default: 100000)',
+        )
+        parser.add_argument(
+            '--words',
+            type=int,
+            default=30,
+            help='Words per synthetic note (default: 30)',
+        )
+        parser.add_argument(
+            '--queries',
+            nargs='+',
+            default=['焦慮', '睡不著', '壓力 工作', 'coffee'],
+            help='Queries to time',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Timed runs per query and backend (default: 5)',
+        )
+
+    def handle(self, *args, **options):
+        from django.db import transaction
+
+        try:
+            with transaction.atomic():
+                self._run(options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _run(self, options):
+        from django.db import connection
+
+        from api.models import CustomUser, MoodNote, NoteSearchToken
+        from api.services import search_backends
+        from api.services.encryption import encryption_service
+        from api.services.rollups import create_notes
+        from api.services.search_index import index_terms, term_hash
+
+        rng = random.Random(42)
+        user = CustomUser.objects.create_user(username='__search_benchmark__', password=None)
+        # Ciphertext content is irrelevant to search; one token for every row keeps setup fast
+        placeholder = encryption_service.encrypt('benchmark')
+
+        started = time.perf_counter()
+        texts = [
+            ' '.join(rng.choice(_WORDS) for _ in range(options['words'])) for _ in range(options['notes'])
+        ]
+        batch = 2000
+        token_rows = 0
+        for start in range(0, len(texts), batch):
+            notes = create_notes([
+                MoodNote(user=user, encrypted_content=placeholder, search_text=text[:500])
+                for text in texts[start:start + batch]
+            ])
+            tokens = [
+                NoteSearchToken(note=note, token_hash=term_hash(user.pk, term))
+                for note, text in zip(notes, texts[start:start + batch])
+                for term in index_terms(text)
+            ]
+            token_rows += len(tokens)
+            NoteSearchToken.objects.bulk_create(tokens, batch_size=5000)
+        self.stdout.write(
+            f'Seeded {len(texts)} notes and {token_rows} search tokens in {time.perf_counter() - started:.1f}s '
+            f'({connection.vendor})'
+        )
+
+        backends = [search_backends.BlindIndexSearchBackend(), search_backends.LikeSearchBackend()]
+        if connection.vendor == 'postgresql':
+            backends.append(search_backends.PostgresTrigramSearchBackend())
+        elif connection.vendor == 'sqlite' and search_backends._sqlite_fts_available():
+            backends.append(search_backends.SqliteFTSSearchBackend())
+
+        base = MoodNote.objects.filter(user=user, is_deleted=False)
+        for query in options['queries']:
+            for backend in backends:
+                timings = []
+                for _ in range(options['repeat']):
+                    t0 = time.perf_counter()
+                    qs = backend.search(base, user.pk, query)
+                    total = qs.count()
+                    page = list(qs[:20])
+                    timings.append(time.perf_counter() - t0)
+                self.stdout.write(
+                    f'{query!r:>14} {backend.name:>17}: {total:>7} hits, first page of {len(page)}, '
+                    f'median {statistics.median(timings) * 1000:8.1f} ms'
+                )
@@ -0,0 +1,84 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+_FILLER = [
+    '今天', '早上', '和朋友', '去公司', '吃了午餐', '下雨', '回家', '晚上', '想了很久',
+    '覺得', '有點', '非常', '一直', '還是', '工作', '家人', '同事', '週末', '天氣',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark local sentiment scoring: per-text jieba path vs the approximate '
+        'ai_engine.analyze_batch, with the rate at which their scores agree'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--notes',
+            type=int,
+            default=5000,
+            help='Number of synthetic notes to score (default: 5000)',
+        )
+        parser.add_argument(
+            '--length',
+            type=int,
+            default=60,
+            help='Phrases per synthetic note (default: 60)',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Random seed for the synthetic corpus (default: 42)',
+        )
+
+    def handle(self, *args, **options):
+        from api.services.ai_engine import (
+            _NEGATIVE_WORDS, _POSITIVE_WORDS, _STRESS_WORDS, ai_engine, init_jieba,
+        )
+
+        rng = random.Random(options['seed'])
+        vocab = _FILLER * 4 + sorted(_POSITIVE_WORDS | _NEGATIVE_WORDS | _STRESS_WORDS)
+        texts = [
+            '，'.join(rng.choice(vocab) for _ in range(options['length']))
+            for _ in range(options['notes'])
+        ]
+        chars = sum(len(t) for t in texts)
+        self.stdout.write(f'Corpus: {len(texts)} notes, {chars} characters')
+
+        init_jieba()  # keep dictionary load out of the timing
+        ai_engine.analyze_batch(texts[:1])  # compile the automaton
+
+        start = time.perf_counter()
+        per_text = [ai_engine._analyze_sentiment_local(ai_engine._segment_text(t)) for t in texts]
+        per_text_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batch = ai_engine.analyze_batch(texts)
+        batch_s = time.perf_counter() - start
+
+        same_score = sum(
+            1 for i, r in enumerate(per_text)
+            if r['sentiment_score'] == batch['sentiment_score'][i]
+        )
+        same_stress = sum(
+            1 for i, r in enumerate(per_text)
+            if r['stress_index'] == batch['stress_index'][i]
+        )
+
+        self.stdout.write(
+            f'Per-text (jieba + set lookup): {per_text_s:.3f}s  '
+            f'{len(texts) / per_text_s:,.0f} notes/s'
+        )
+        self.stdout.write(
+            f'analyze_batch (automaton):     {batch_s:.3f}s  '
+            f'{len(texts) / batch_s:,.0f} notes/s'
+        )
+        self.stdout.write(
+            f'Agreement: sentiment {same_score / len(texts):.1%}, '
+            f'stress {same_stress / len(texts):.1%}'
+        )
+        self.stdout.write(self.style.SUCCESS(f'Speed-up: {per_text_s / batch_s:.1f}x'))
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Prebuild the versioned jieba prefix-dictionary cache (with the mental-health user dictionary)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output-dir',
+            default=settings.JIEBA_CACHE_DIR,
+            help='Directory to write the cache file into (default: JIEBA_CACHE_DIR)',
+        )
+
+    def handle(self, *args, **options):
+        import time
+
+        from api.services.ai_engine import build_jieba_cache
+
+        started = time.perf_counter()
+        path = build_jieba_cache(options['output_dir'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {path} in {time.perf_counter() - started:.2f}s'
+        ))
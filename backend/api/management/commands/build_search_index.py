@@ -0,0 +1,68 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        'Populate the blind keyword index (NoteSearchToken) from the full text of existing notes. '
+        'Safe to rerun: only differing hashes are written.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Notes decrypted and indexed per batch (default: 200)',
+        )
+        parser.add_argument(
+            '--user',
+            type=int,
+            default=None,
+            help='Only index notes of this user id',
+        )
+        parser.add_argument(
+            '--missing',
+            action='store_true',
+            help='Only index notes that have no index rows yet (cheap enough to run on every deploy)',
+        )
+
+    def handle(self, *args, **options):
+        from django.db import close_old_connections, transaction
+        from django.utils.html import strip_tags
+
+        from api.models import MoodNote
+        from api.services.search_index import index_note
+
+        qs = MoodNote.objects.all()
+        if options['user']:
+            qs = qs.filter(user_id=options['user'])
+        if options['missing']:
+            qs = qs.filter(search_tokens__isnull=True)
+        qs = qs.only('id', 'user_id', 'encrypted_content', 'encrypted_blob').order_by('pk')
+
+        last_id = 0
+        indexed = failed = 0
+        started = time.monotonic()
+        while True:
+            notes = list(qs.filter(pk__gt=last_id)[:options['batch_size']])
+            if not notes:
+                break
+            MoodNote.prefetch_content(notes)
+            with transaction.atomic():
+                for note in notes:
+                    plaintext = note.content
+                    if plaintext == '[Decryption failed]':
+                        failed += 1
+                        continue
+                    index_note(note, strip_tags(plaintext))
+                    indexed += 1
+            last_id = notes[-1].pk
+            self.stdout.write(
+                f'up to note #{last_id}: {indexed} indexed, {failed} undecryptable '
+                f'({indexed / max(time.monotonic() - started, 1e-9):.0f} notes/s)'
+            )
+            close_old_connections()
+
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} notes ({failed} could not be decrypted)'))
@@ -0,0 +1,134 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        'Convert legacy text-token MoodNote ciphertexts to the compact binary format '
+        '(MoodNote.encrypted_blob) in small, throttled batches, with a size/throughput report. '
+        'Converted rows drop out of the scan, so an interrupted run simply resumes when rerun.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Rows locked, converted and written per transaction (default: 500)',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.05,
+            help='Seconds to pause between batches to limit load on the primary DB (default: 0.05)',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=None,
+            help='Stop after this many rows (default: all legacy rows)',
+        )
+        parser.add_argument(
+            '--report',
+            action='store_true',
+            help='Only measure the size the binary format would take; write nothing',
+        )
+
+    def handle(self, *args, **options):
+        from django.db import close_old_connections
+
+        from api.models import MoodNote
+
+        self._stopping = False
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+
+        stats = {
+            'scanned': 0, 'converted': 0, 'compressed': 0, 'undecryptable': 0,
+            'text_bytes': 0, 'binary_bytes': 0, 'plain_bytes': 0,
+        }
+        legacy = MoodNote.objects.filter(encrypted_blob__isnull=True).exclude(encrypted_content='')
+        self.stdout.write(f'{legacy.count()} notes still in the text format')
+
+        last_id = 0
+        started = time.monotonic()
+        while not self._stopping:
+            batch_size = options['batch_size']
+            if options['limit'] is not None:
+                batch_size = min(batch_size, options['limit'] - stats['scanned'])
+                if batch_size <= 0:
+                    break
+            ids = list(
+                legacy.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            self._convert_batch(ids, stats, write=not options['report'])
+            last_id = ids[-1]
+
+            elapsed = max(time.monotonic() - started, 1e-9)
+            self.stdout.write(
+                f'up to note #{last_id}: {stats["scanned"]} scanned, {stats["converted"]} converted '
+                f'({stats["scanned"] / elapsed:.0f} rows/s, {stats["plain_bytes"] / elapsed / 1e6:.1f} MB/s plaintext)'
+            )
+            close_old_connections()
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self._print_report(stats, options['report'])
+        if self._stopping:
+            self.stdout.write(self.style.WARNING(f'Stopped after note #{last_id}; rerun to resume'))
+
+    def _convert_batch(self, ids, stats, write):
+        from django.db import transaction
+
+        from api.models import MoodNote
+        from api.services.encryption import encryption_service
+
+        with transaction.atomic():
+            # Locking keeps a concurrent note edit from being overwritten with the old content
+            qs = MoodNote.objects.filter(pk__in=ids, encrypted_blob__isnull=True)
+            if write:
+                qs = qs.select_for_update()
+            notes = list(qs.only('id', 'user_id', 'encrypted_content', 'encrypted_blob'))
+            converted = []
+            for note in notes:
+                stats['scanned'] += 1
+                token = note.encrypted_content
+                plaintext = encryption_service.decrypt(token, user_id=note.user_id)
+                if plaintext == '[Decryption failed]':
+                    stats['undecryptable'] += 1
+                    continue
+                # Keep the row's key scheme; `rotate_encryption --envelope` moves master-key rows
+                user_id = note.user_id if encryption_service.is_envelope(token) else None
+                blob = encryption_service.encrypt_binary(plaintext, user_id=user_id)
+                stats['text_bytes'] += len(token.encode('utf-8'))
+                stats['binary_bytes'] += len(blob)
+                stats['plain_bytes'] += len(plaintext.encode('utf-8'))
+                if blob[1] & encryption_service.FLAG_ZLIB:
+                    stats['compressed'] += 1
+                note.set_ciphertext(blob)
+                converted.append(note)
+            if write and converted:
+                MoodNote.objects.bulk_update(converted, ['encrypted_content', 'encrypted_blob'])
+        stats['converted'] += len(converted)
+
+    def _print_report(self, stats, report_only):
+        text, binary = stats['text_bytes'], stats['binary_bytes']
+        saved = 1 - binary / text if text else 0.0
+        verb = 'would take' if report_only else 'now take'
+        self.stdout.write(
+            f'  {stats["converted"]} rows: {text} bytes as text tokens, {binary} bytes {verb} '
+            f'in the binary format ({saved:.0%} smaller); {stats["compressed"]} compressed'
+        )
+        if stats['undecryptable']:
+            self.stdout.write(self.style.WARNING(
+                f'  {stats["undecryptable"]} rows could not be decrypted and were left as they are'
+            ))
+        if not report_only and not self._stopping:
+            self.stdout.write(self.style.SUCCESS(f'Converted {stats["converted"]} of {stats["scanned"]} rows'))
+
+    def _request_stop(self, signum, frame):
+        self._stopping = True
@@ -1,15 +1,75 @@
+import hashlib
 import os
+from concurrent.futures import ProcessPoolExecutor
 
 from django.conf import settings
 from django.core.management.base import BaseCommand
 
 
+def _extract_pdf_text(path: str) -> str:
+    """Runs in a worker process — pypdf extraction is CPU-bound."""
+    from pypdf import PdfReader
+    reader = PdfReader(path)
+    return '\n'.join(page.extract_text() or '' for page in reader.pages)
+
+
+def chunk_hash(source: str, text: str) -> str:
+    """Content hash of one chunk; also used as its ChromaDB id."""
+    return hashlib.sha256(f'{source}\0{text}'.encode('utf-8')).hexdigest()
+
+
+def compute_delta(wanted: list[str], existing: set[str]) -> dict:
+    """Split chunk hashes into new / unchanged / stale relative to the stored collection."""
+    wanted_set = set(wanted)
+    return {
+        'new': [h for h in wanted if h not in existing],
+        'unchanged': [h for h in wanted if h in existing],
+        'stale': sorted(existing - wanted_set),
+    }
+
+
 class Command(BaseCommand):
-    help = 'Load .txt and .pdf files from knowledge_base/ into ChromaDB'
+    help = (
+        'Sync .txt and .pdf files from knowledge_base/ into ChromaDB (only new or changed '
+        'chunks are embedded, stale ones deleted) and rebuild the offline BM25 index'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--skip-chroma',
+            action='store_true',
+            help='Only build the BM25 index (no embedding calls unless --embed-index)',
+        )
+        parser.add_argument(
+            '--embed-index',
+            action='store_true',
+            help='Store chunk embeddings in the BM25 index for hybrid re-ranking '
+                 '(reused from ChromaDB unless --skip-chroma)',
+        )
+        parser.add_argument(
+            '--index-dir',
+            default=settings.KB_INDEX_DIR,
+            help='Directory for the BM25 index (default: KB_INDEX_DIR)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report new / unchanged / stale chunks without embedding or writing anything',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Chunks per embedding request (default: 100)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Processes for PDF text extraction (default: CPU count)',
+        )
 
     def handle(self, *args, **options):
-        from langchain_chroma import Chroma
-        from langchain_openai import OpenAIEmbeddings
         from langchain_text_splitters import RecursiveCharacterTextSplitter
         from langchain.schema import Document
 
@@ -18,43 +78,130 @@ class Command(BaseCommand):
             self.stderr.write(self.style.ERROR(f'knowledge_base/ not found at {kb_dir}'))
             return
 
-        documents = []
+        documents = self._load_documents(kb_dir, options['workers'], Document)
+        if not documents:
+            self.stderr.write(self.style.WARNING('No documents found in knowledge_base/'))
+            return
+
+        # Split into chunks; identical chunks within a source collapse onto one hash
+        splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+        chunks = {}
+        for chunk in splitter.split_documents(documents):
+            h = chunk_hash(chunk.metadata.get('source', ''), chunk.page_content)
+            chunk.metadata['content_hash'] = h
+            chunks.setdefault(h, chunk)
+        hashes = list(chunks)
+        self.stdout.write(f'Split into {len(hashes)} chunks')
 
-        for filename in os.listdir(kb_dir):
+        from api.services.kb_index import build_kb_index, index_content_digest
+        digest = hashlib.sha256(
+            ('\n'.join(hashes) + f'\nembeddings={options["embed_index"]}').encode('utf-8')
+        ).hexdigest()
+
+        vectors = None
+        if not options['skip_chroma']:
+            vectors = self._sync_chroma(chunks, options)
+            if options['dry_run']:
+                return
+        elif options['dry_run']:
+            self.stdout.write('Dry run — ChromaDB skipped, BM25 index not written')
+            return
+
+        if index_content_digest(options['index_dir']) == digest:
+            self.stdout.write(f'BM25 index in {options["index_dir"]} is up to date')
+            return
+        if options['skip_chroma'] and options['embed_index']:
+            vectors = self._embed_for_index(chunks, options)
+        terms = build_kb_index(
+            [(chunks[h].page_content, chunks[h].metadata.get('source', '')) for h in hashes],
+            options['index_dir'],
+            embeddings=vectors,
+            content_digest=digest,
+            chunk_hashes=hashes,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Built BM25 index ({len(hashes)} chunks, {terms} terms'
+            f'{", with embeddings" if vectors is not None else ""}) in {options["index_dir"]}'
+        ))
+
+    def _embed_for_index(self, chunks, options):
+        """Embeddings for every chunk, reusing the current index's vectors and embedding only new chunks."""
+        from api.services.kb_index import stored_embeddings
+
+        by_hash = stored_embeddings(options['index_dir'])
+        missing = [h for h in chunks if h not in by_hash]
+        self.stdout.write(f'Index embeddings: {len(missing)} new, {len(chunks) - len(missing)} reused')
+        if missing:
+            from langchain_openai import OpenAIEmbeddings
+            embeddings = OpenAIEmbeddings(openai_api_key=settings.OPENAI_API_KEY)
+            batch_size = options['batch_size']
+            for start in range(0, len(missing), batch_size):
+                batch = missing[start:start + batch_size]
+                by_hash.update(zip(batch, embeddings.embed_documents([chunks[h].page_content for h in batch])))
+        return [by_hash[h] for h in chunks]
+
+    def _load_documents(self, kb_dir, workers, Document):
+        documents = []
+        pdfs = []
+        for filename in sorted(os.listdir(kb_dir)):
             filepath = os.path.join(kb_dir, filename)
             if filename.endswith('.txt'):
                 with open(filepath, 'r', encoding='utf-8') as f:
                     text = f.read()
                 documents.append(Document(page_content=text, metadata={'source': filename}))
                 self.stdout.write(f'Loaded: {filename}')
-
             elif filename.endswith('.pdf'):
-                try:
-                    from pypdf import PdfReader
-                    reader = PdfReader(filepath)
-                    text = '\n'.join(page.extract_text() or '' for page in reader.pages)
-                    documents.append(Document(page_content=text, metadata={'source': filename}))
-                    self.stdout.write(f'Loaded: {filename}')
-                except Exception as e:
-                    self.stderr.write(self.style.WARNING(f'Failed to load {filename}: {e}'))
+                pdfs.append(filename)
 
-        if not documents:
-            self.stderr.write(self.style.WARNING('No documents found in knowledge_base/'))
-            return
+        if pdfs:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {
+                    filename: pool.submit(_extract_pdf_text, os.path.join(kb_dir, filename))
+                    for filename in pdfs
+                }
+                for filename, future in futures.items():
+                    try:
+                        text = future.result()
+                        documents.append(Document(page_content=text, metadata={'source': filename}))
+                        self.stdout.write(f'Loaded: {filename}')
+                    except Exception as e:
+                        self.stderr.write(self.style.WARNING(f'Failed to load {filename}: {e}'))
+        return documents
 
-        # Split into chunks
-        splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-        chunks = splitter.split_documents(documents)
-        self.stdout.write(f'Split into {len(chunks)} chunks')
+    def _sync_chroma(self, chunks, options):
+        """Embed only new chunks and delete stale ones; returns all embeddings when ``--embed-index``."""
+        from langchain_chroma import Chroma
+        from langchain_openai import OpenAIEmbeddings
 
-        # Store in ChromaDB
         embeddings = OpenAIEmbeddings(openai_api_key=settings.OPENAI_API_KEY)
-        vectorstore = Chroma.from_documents(
-            documents=chunks,
-            embedding=embeddings,
+        vectorstore = Chroma(
             persist_directory=settings.CHROMA_PERSIST_DIR,
+            embedding_function=embeddings,
             collection_name='psychology_kb',
         )
+        existing = set(vectorstore.get(include=[])['ids'])
+        delta = compute_delta(list(chunks), existing)
+        self.stdout.write(
+            f'ChromaDB delta: {len(delta["new"])} new, {len(delta["unchanged"])} unchanged, '
+            f'{len(delta["stale"])} stale'
+        )
+        if options['dry_run']:
+            return None
+
+        if delta['stale']:
+            vectorstore.delete(ids=delta['stale'])
+        batch_size = options['batch_size']
+        for start in range(0, len(delta['new']), batch_size):
+            batch = delta['new'][start:start + batch_size]
+            vectorstore.add_documents([chunks[h] for h in batch], ids=batch)
+            self.stdout.write(f'Embedded {start + len(batch)}/{len(delta["new"])} new chunks')
         self.stdout.write(self.style.SUCCESS(
-            f'Successfully loaded {len(chunks)} chunks into ChromaDB'
+            f'ChromaDB synced: {len(chunks)} chunks in psychology_kb'
         ))
+
+        if not options['embed_index']:
+            return None
+        ids = list(chunks)
+        stored = vectorstore.get(ids=ids, include=['embeddings'])
+        by_id = dict(zip(stored['ids'], stored['embeddings']))
+        return [by_id[h] for h in ids]
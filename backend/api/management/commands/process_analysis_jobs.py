@@ -0,0 +1,72 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        'Run queued note AI analysis jobs (NoteAnalysisJob), pushing results over WebSocket, '
+        'and AI chat summary refreshes (AIChatSummaryJob)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Drain the queue and exit instead of polling forever',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Seconds to sleep when the queue is empty (default: 1.0)',
+        )
+        parser.add_argument(
+            '--max-jobs',
+            type=int,
+            default=0,
+            help='Exit after processing this many jobs (0 = unlimited)',
+        )
+
+    def handle(self, *args, **options):
+        from django.db import close_old_connections
+
+        from api.models import AIChatSummaryJob
+        from api.services.analysis_queue import claim_next_job, run_job, run_summary_job
+
+        self._stopping = False
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+
+        processed = 0
+        max_jobs = options['max_jobs']
+        while not self._stopping:
+            close_old_connections()
+            # Note analysis first: its results are pushed to a waiting client
+            job = claim_next_job() or claim_next_job(AIChatSummaryJob)
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+
+            started = time.monotonic()
+            if isinstance(job, AIChatSummaryJob):
+                job = run_summary_job(job)
+                target = f'session={job.session_id}'
+            else:
+                job = run_job(job)
+                target = f'note={job.note_id}'
+            processed += 1
+            self.stdout.write(
+                f'Job #{job.pk} {target} -> {job.status} '
+                f'({(time.monotonic() - started) * 1000:.0f} ms)'
+            )
+            if max_jobs and processed >= max_jobs:
+                break
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} job(s)'))
+
+    def _request_stop(self, signum, frame):
+        self._stopping = True
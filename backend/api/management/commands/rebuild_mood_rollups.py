@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute MoodDailyRollup rows from the notes of each user. '
+        'Rollups are maintained on every note write; run this after bulk data fixes or to repair drift.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help='Users rebuilt per transaction (default: 50)',
+        )
+        parser.add_argument(
+            '--user',
+            type=int,
+            default=None,
+            help='Only rebuild the rollups of this user id',
+        )
+
+    def handle(self, *args, **options):
+        from django.contrib.auth import get_user_model
+        from django.db import close_old_connections
+
+        from api.services.rollups import rebuild_rollups
+
+        users = get_user_model().objects.order_by('pk')
+        if options['user']:
+            users = users.filter(pk=options['user'])
+
+        last_id = 0
+        user_count = rows = 0
+        started = time.monotonic()
+        while True:
+            ids = list(users.filter(pk__gt=last_id).values_list('pk', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            rows += rebuild_rollups(ids)
+            user_count += len(ids)
+            last_id = ids[-1]
+            self.stdout.write(
+                f'up to user #{last_id}: {user_count} users, {rows} daily rows '
+                f'({user_count / max(time.monotonic() - started, 1e-9):.0f} users/s)'
+            )
+            close_old_connections()
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} daily rollups for {user_count} users'))
@@ -0,0 +1,238 @@
+import json
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def _init_worker():
+    import django
+    django.setup()
+    from api.services.ai_engine import init_jieba
+    init_jieba()
+
+
+def _score_local(text: str) -> tuple:
+    """Local keyword tier (same jieba path as AIEngine.analyze's fallback). Runs in a worker process."""
+    from api.services.ai_engine import AIEngine
+    scores = AIEngine._analyze_sentiment_local(AIEngine._segment_text(text))
+    return scores['sentiment_score'], scores['stress_index']
+
+
+class Command(BaseCommand):
+    help = (
+        'Re-run sentiment/stress scoring over existing notes (e.g. after a lexicon or model change), '
+        'in id order with a resumable checkpoint'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tier',
+            choices=['local', 'openai'],
+            default='local',
+            help='local = keyword scoring in a process pool (scores only); '
+                 'openai = full AIEngine.analyze with bounded concurrency (scores + feedback)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Notes fetched, scored and written per chunk (default: 500)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Processes for the local tier (0 = score in this process; default: CPU count)',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=4,
+            help='Concurrent OpenAI analyses for the openai tier (default: 4)',
+        )
+        parser.add_argument(
+            '--use-cache',
+            action='store_true',
+            help='openai tier: reuse cached analyses of identical text instead of re-running the LLM '
+                 '(off by default, since a rescore is meant to pick up prompt or model changes)',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            default=os.path.join(settings.BASE_DIR, 'rescore_checkpoint.json'),
+            help='Checkpoint file recording the last processed note id',
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Ignore an existing checkpoint and start from the first note',
+        )
+        parser.add_argument(
+            '--user',
+            type=int,
+            default=None,
+            help='Only rescore notes of this user id',
+        )
+
+    def handle(self, *args, **options):
+        from django.db import close_old_connections
+
+        from api.models import MoodNote
+
+        self._stopping = False
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+
+        tier = options['tier']
+        if tier == 'openai' and not settings.OPENAI_API_KEY:
+            raise CommandError('OPENAI_API_KEY is not set; use --tier local')
+
+        checkpoint = self._load_checkpoint(options['checkpoint'], tier, options['restart'])
+        if checkpoint['last_id']:
+            self.stdout.write(f'Resuming after note #{checkpoint["last_id"]}')
+
+        qs = MoodNote.objects.filter(is_deleted=False, pk__gt=checkpoint['last_id'])
+        if options['user']:
+            qs = qs.filter(user_id=options['user'])
+        qs = qs.order_by('pk').only(
+            'id', 'user_id', 'local_date', 'encrypted_content', 'encrypted_blob',
+            'sentiment_score', 'stress_index', 'ai_feedback',
+        )
+
+        if tier == 'local':
+            workers = options['workers']
+            executor = (
+                ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) if workers > 0 else None
+            )
+        else:
+            executor = ThreadPoolExecutor(max_workers=options['concurrency'])
+
+        started = time.monotonic()
+        run_processed = 0
+        chunk = []
+        try:
+            for note in qs.iterator(chunk_size=options['chunk_size']):
+                chunk.append(note)
+                if len(chunk) >= options['chunk_size']:
+                    run_processed += self._process_chunk(chunk, tier, executor, checkpoint, options)
+                    chunk = []
+                    self._report(checkpoint, run_processed, started)
+                    close_old_connections()
+                    if self._stopping:
+                        break
+            if chunk and not self._stopping:
+                run_processed += self._process_chunk(chunk, tier, executor, checkpoint, options)
+                self._report(checkpoint, run_processed, started)
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+        if self._stopping:
+            self.stdout.write(self.style.WARNING(
+                f'Stopped after note #{checkpoint["last_id"]}; rerun to resume'
+            ))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Rescored {checkpoint["updated"]} of {checkpoint["processed"]} notes '
+            f'({checkpoint["failed"]} failed)'
+        ))
+
+    def _process_chunk(self, notes, tier, executor, checkpoint, options) -> int:
+        from django.db import transaction
+
+        from api.models import MoodNote
+        from api.services import rollups
+        from api.services.analytics import invalidate_user_cache
+        from api.services.encryption import encryption_service
+
+        texts = encryption_service.decrypt_many(
+            [n.ciphertext for n in notes], user_ids=[n.user_id for n in notes],
+        )
+        scorable = [
+            (note, text) for note, text in zip(notes, texts)
+            if text and text != '[Decryption failed]'
+        ]
+        failed = len(notes) - len(scorable)
+
+        updated = []
+        if tier == 'local':
+            score_texts = [text for _, text in scorable]
+            if executor is None:
+                results = map(_score_local, score_texts)
+            else:
+                results = executor.map(_score_local, score_texts, chunksize=max(1, len(score_texts) // 32))
+            for (note, _), (score, stress) in zip(scorable, results):
+                if (note.sentiment_score, note.stress_index) != (score, stress):
+                    note.sentiment_score, note.stress_index = score, stress
+                    updated.append(note)
+            fields = ['sentiment_score', 'stress_index']
+        else:
+            from api.services.ai_engine import ai_engine
+            use_cache = options['use_cache']
+            results = executor.map(
+                lambda pair: ai_engine.analyze(pair[1], use_cache=use_cache, user_id=pair[0].user_id), scorable,
+            )
+            for (note, _), result in zip(scorable, results):
+                # LLM unreachable for this note — keep its stored analysis for a later run
+                if result['analysis_mode'] == 'local':
+                    failed += 1
+                    continue
+                note.sentiment_score = result['sentiment_score']
+                note.stress_index = result['stress_index']
+                note.ai_feedback = result['ai_feedback']
+                updated.append(note)
+            fields = ['sentiment_score', 'stress_index', 'ai_feedback']
+
+        if updated:
+            with transaction.atomic():
+                old = rollups.locked_states(MoodNote.objects.filter(pk__in=[n.pk for n in updated]))
+                MoodNote.objects.bulk_update(updated, fields, batch_size=options['chunk_size'])
+                rollups.apply_changes(
+                    (old[n.pk], rollups.note_state(n, old[n.pk], fields)) for n in updated if n.pk in old
+                )
+            days_by_user = {}
+            for n in updated:
+                days_by_user.setdefault(n.user_id, set()).add(n.local_date)
+            for user_id, days in days_by_user.items():
+                invalidate_user_cache(user_id, days)
+
+        checkpoint['last_id'] = notes[-1].pk
+        checkpoint['processed'] += len(notes)
+        checkpoint['updated'] += len(updated)
+        checkpoint['failed'] += failed
+        self._save_checkpoint(options['checkpoint'], checkpoint)
+        return len(notes)
+
+    def _report(self, checkpoint, run_processed, started):
+        elapsed = time.monotonic() - started
+        rate = run_processed / elapsed if elapsed > 0 else 0.0
+        self.stdout.write(
+            f'up to note #{checkpoint["last_id"]}: {checkpoint["processed"]} processed, '
+            f'{checkpoint["updated"]} updated, {checkpoint["failed"]} failed — {rate:.0f} notes/s'
+        )
+
+    @staticmethod
+    def _load_checkpoint(path, tier, restart) -> dict:
+        fresh = {'tier': tier, 'last_id': 0, 'processed': 0, 'updated': 0, 'failed': 0}
+        if restart or not os.path.exists(path):
+            return fresh
+        with open(path, encoding='utf-8') as f:
+            saved = json.load(f)
+        if saved.get('tier') != tier:
+            raise CommandError(
+                f'Checkpoint {path} is for the {saved.get("tier")} tier; pass --restart to discard it'
+            )
+        return {**fresh, **saved}
+
+    @staticmethod
+    def _save_checkpoint(path, checkpoint):
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, path)
+
+    def _request_stop(self, signum, frame):
+        self._stopping = True
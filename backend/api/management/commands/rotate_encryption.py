@@ -0,0 +1,251 @@
+import hashlib
+import json
+import os
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        'Rewrap per-user data keys and re-encrypt legacy MoodNote ciphertexts under the '
+        'primary ENCRYPTION_KEY (first key) in small, throttled batches with a resumable checkpoint'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Rows locked, rotated and written per transaction (default: 500)',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.05,
+            help='Seconds to pause between batches to limit load on the primary DB (default: 0.05)',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            default=os.path.join(settings.BASE_DIR, 'rotate_encryption_checkpoint.json'),
+            help='Checkpoint file recording the last processed note id',
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Ignore an existing checkpoint and start from the first note',
+        )
+        parser.add_argument(
+            '--report',
+            action='store_true',
+            help='Only count rows under each key; write nothing',
+        )
+        parser.add_argument(
+            '--envelope',
+            action='store_true',
+            help="Move legacy notes onto their owner's data key instead of the primary master key",
+        )
+
+    def handle(self, *args, **options):
+        from django.db import close_old_connections
+
+        from api.models import MoodNote
+        from api.services.encryption import encryption_service
+
+        self._stopping = False
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+
+        report_only = options['report']
+        key_count = encryption_service.key_count
+        if key_count == 1 and not report_only and not options['envelope']:
+            self.stdout.write('Only one key configured — nothing to rotate')
+            return
+
+        self._rewrap_data_keys(options['batch_size'], report_only)
+
+        checkpoint = (
+            self._fresh_checkpoint(key_count) if report_only
+            else self._load_checkpoint(options['checkpoint'], key_count, options['restart'])
+        )
+        if checkpoint['last_id']:
+            self.stdout.write(f'Resuming after note #{checkpoint["last_id"]}')
+
+        started = time.monotonic()
+        while not self._stopping:
+            ids = list(
+                MoodNote.objects.filter(pk__gt=checkpoint['last_id'])
+                .order_by('pk').values_list('pk', flat=True)[:options['batch_size']]
+            )
+            if not ids:
+                break
+            if report_only:
+                self._count_batch(ids, checkpoint)
+            else:
+                self._rotate_batch(ids, checkpoint, options['envelope'])
+            checkpoint['last_id'] = ids[-1]
+            if not report_only:
+                self._save_checkpoint(options['checkpoint'], checkpoint)
+
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f'up to note #{checkpoint["last_id"]}: {checkpoint["scanned"]} scanned, '
+                f'{checkpoint["rotated"]} rotated ({checkpoint["scanned"] / max(elapsed, 1e-9):.0f} rows/s)'
+            )
+            close_old_connections()
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self._print_key_report(checkpoint, report_only)
+        if self._stopping:
+            self.stdout.write(self.style.WARNING(
+                f'Stopped after note #{checkpoint["last_id"]}; rerun to resume'
+            ))
+
+    def _rewrap_data_keys(self, batch_size, report_only):
+        """Rewrap every per-user data key not yet under the primary key (one short row per user)."""
+        from django.contrib.auth import get_user_model
+
+        from api.services.encryption import encryption_service
+
+        User = get_user_model()
+        users = User.objects.exclude(wrapped_data_key='').only('id', 'wrapped_data_key').order_by('pk')
+        total = stale = 0
+        pending = []
+        for user in users.iterator(chunk_size=batch_size):
+            total += 1
+            if encryption_service.key_index(user.wrapped_data_key) == 0:
+                continue
+            stale += 1
+            if not report_only:
+                user.wrapped_data_key = encryption_service.rewrap(user.wrapped_data_key)
+                pending.append(user)
+            if len(pending) >= batch_size:
+                User.objects.bulk_update(pending, ['wrapped_data_key'])
+                pending = []
+        if pending:
+            User.objects.bulk_update(pending, ['wrapped_data_key'])
+        verb = 'to rewrap' if report_only else 'rewrapped'
+        self.stdout.write(f'Data keys: {total} users, {stale} {verb}')
+
+    def _rotate_batch(self, ids, checkpoint, envelope=False):
+        """Lock the batch, rotate rows not yet under the primary key and write them back.
+
+        With ``envelope``, every legacy row is instead re-encrypted under its owner's data key.
+        """
+        from django.db import transaction
+
+        from api.models import MoodNote
+        from api.services.encryption import encryption_service
+
+        with transaction.atomic():
+            # Locking keeps a concurrent note edit from being overwritten with rotated old content
+            notes = list(
+                MoodNote.objects.select_for_update().filter(pk__in=ids)
+                .only('id', 'user_id', 'encrypted_content', 'encrypted_blob')
+            )
+            rotated = []
+            for note in notes:
+                token = note.ciphertext
+                idx = self._tally(token, checkpoint)
+                if idx is None:
+                    continue
+                if envelope:
+                    plaintext = encryption_service.decrypt(token)
+                    note.set_ciphertext(encryption_service.encrypt_for_storage(plaintext, user_id=note.user_id))
+                    rotated.append(note)
+                elif idx:
+                    note.set_ciphertext(encryption_service.rotate(token))
+                    rotated.append(note)
+            if rotated:
+                MoodNote.objects.bulk_update(rotated, ['encrypted_content', 'encrypted_blob'])
+        checkpoint['rotated'] += len(rotated)
+
+    def _count_batch(self, ids, checkpoint):
+        from api.models import MoodNote
+
+        rows = MoodNote.objects.filter(pk__in=ids).values_list('encrypted_content', 'encrypted_blob')
+        for text_token, blob in rows:
+            self._tally(bytes(blob) if blob is not None else text_token, checkpoint)
+
+    @staticmethod
+    def _tally(token, checkpoint):
+        from api.services.encryption import encryption_service
+
+        checkpoint['scanned'] += 1
+        if not token:
+            checkpoint['empty'] += 1
+            return None
+        if encryption_service.is_envelope(token):
+            # Under a per-user data key; master rotation only rewraps that key
+            checkpoint['envelope'] += 1
+            return None
+        idx = encryption_service.key_index(token)
+        if idx is None:
+            checkpoint['undecryptable'] += 1
+        else:
+            checkpoint['found_by_key'][idx] += 1
+        return idx
+
+    def _print_key_report(self, checkpoint, report_only):
+        found = checkpoint['found_by_key']
+        for idx, count in enumerate(found):
+            remaining = count if report_only or idx == 0 else 0
+            label = 'primary' if idx == 0 else 'retired'
+            self.stdout.write(f'  key {idx} ({label}): {count} rows found, {remaining} remaining')
+        if checkpoint['envelope']:
+            self.stdout.write(f'  {checkpoint["envelope"]} rows under per-user data keys')
+        if checkpoint['undecryptable']:
+            self.stdout.write(self.style.WARNING(
+                f'  {checkpoint["undecryptable"]} rows decrypt with no configured key'
+            ))
+        if report_only:
+            return
+        if self._stopping:
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Rotated {checkpoint["rotated"]} of {checkpoint["scanned"]} rows; '
+            'keys after the first can be removed from ENCRYPTION_KEY once every '
+            'environment has finished rotating'
+        ))
+
+    @staticmethod
+    def _primary_fingerprint() -> str:
+        primary = settings.ENCRYPTION_KEY.split(',')[0].strip()
+        return hashlib.sha256(primary.encode('utf-8')).hexdigest()[:16]
+
+    def _fresh_checkpoint(self, key_count) -> dict:
+        return {
+            'primary': self._primary_fingerprint(),
+            'last_id': 0,
+            'scanned': 0,
+            'rotated': 0,
+            'empty': 0,
+            'envelope': 0,
+            'undecryptable': 0,
+            'found_by_key': [0] * key_count,
+        }
+
+    def _load_checkpoint(self, path, key_count, restart) -> dict:
+        fresh = self._fresh_checkpoint(key_count)
+        if restart or not os.path.exists(path):
+            return fresh
+        with open(path, encoding='utf-8') as f:
+            saved = json.load(f)
+        if saved.get('primary') != fresh['primary'] or len(saved.get('found_by_key', [])) != key_count:
+            raise CommandError(
+                f'Checkpoint {path} was written for a different ENCRYPTION_KEY; pass --restart to discard it'
+            )
+        return {**fresh, **saved}
+
+    @staticmethod
+    def _save_checkpoint(path, checkpoint):
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, path)
+
+    def _request_stop(self, signum, frame):
+        self._stopping = True
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.1 on 2026-10-16 21:10
+
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+from django.conf import settings
+from django.db import migrations, models
+from django.utils.crypto import salted_hmac
+
+
+# Frozen copies of the EncryptionService decrypt and content_digest of this
+# migration's time (plain Fernet tokens in encrypted_content), so later changes
+# to api.services.encryption cannot alter what this data migration does.
+
+def _decrypt(multi, token):
+    try:
+        return multi.decrypt(token.encode('utf-8')).decode('utf-8')
+    except InvalidToken:
+        return None
+
+
+def _content_digest(plaintext):
+    return salted_hmac('heartbox.content', plaintext, algorithm='sha256').hexdigest()
+
+
+def populate_content_digest(apps, schema_editor):
+    """Fill content_digest for existing notes by decrypting content."""
+    MoodNote = apps.get_model('api', 'MoodNote')
+    keys = [k.strip() for k in (settings.ENCRYPTION_KEY or '').split(',') if k.strip()]
+    if not keys:
+        return
+    multi = MultiFernet([Fernet(k.encode('utf-8')) for k in keys])
+
+    batch = []
+    for note in MoodNote.objects.only('id', 'encrypted_content').iterator(chunk_size=500):
+        plaintext = _decrypt(multi, note.encrypted_content)
+        if plaintext is None:
+            continue
+        note.content_digest = _content_digest(plaintext)
+        batch.append(note)
+        if len(batch) >= 500:
+            MoodNote.objects.bulk_update(batch, ['content_digest'])
+            batch = []
+    if batch:
+        MoodNote.objects.bulk_update(batch, ['content_digest'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0033_note_analysis_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='moodnote',
+            name='content_digest',
+            field=models.CharField(blank=True, default='', help_text='Keyed HMAC-SHA256 of the plaintext content', max_length=64),
+        ),
+        migrations.RunPython(populate_content_digest, migrations.RunPython.noop),
+    ]
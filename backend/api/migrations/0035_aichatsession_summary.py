@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-16 22:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0034_moodnote_content_digest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aichatsession',
+            name='summary',
+            field=models.TextField(blank=True, default='', help_text='Rolling summary of messages older than the context window'),
+        ),
+        migrations.AddField(
+            model_name='aichatsession',
+            name='summarized_through',
+            field=models.BigIntegerField(default=0, help_text='ID of the newest message folded into summary'),
+        ),
+    ]
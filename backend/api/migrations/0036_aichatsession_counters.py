@@ -0,0 +1,49 @@
+# Generated by Django 5.2.1 on 2026-10-16 22:30
+
+from django.db import migrations, models
+
+
+def backfill_counters(apps, schema_editor):
+    """Populate message_count / last_message_* from existing messages in one UPDATE."""
+    from django.db.models import Count, IntegerField, OuterRef, Subquery
+    from django.db.models.functions import Coalesce, Substr
+
+    AIChatSession = apps.get_model('api', 'AIChatSession')
+    AIChatMessage = apps.get_model('api', 'AIChatMessage')
+
+    counts = (
+        AIChatMessage.objects.filter(session=OuterRef('pk'))
+        .order_by().values('session').annotate(c=Count('id')).values('c')
+    )
+    latest = AIChatMessage.objects.filter(session=OuterRef('pk')).order_by('-created_at', '-id')
+    AIChatSession.objects.update(
+        message_count=Coalesce(Subquery(counts, output_field=IntegerField()), 0),
+        last_message_at=Subquery(latest.values('created_at')[:1]),
+        last_message_preview=Coalesce(Substr(Subquery(latest.values('content')[:1]), 1, 80), models.Value('')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0035_aichatsession_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aichatsession',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='aichatsession',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='aichatsession',
+            name='last_message_preview',
+            field=models.CharField(blank=True, default='', max_length=80),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-16 23:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0036_aichatsession_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='wrapped_data_key',
+            field=models.TextField(blank=True, default='', help_text='Per-user Fernet data key, encrypted by ENCRYPTION_KEY'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-16 23:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0037_customuser_wrapped_data_key'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='moodnote',
+            name='encrypted_content',
+            field=models.TextField(blank=True, default='', help_text='AES-256 encrypted journal content (legacy text token)'),
+        ),
+        migrations.AddField(
+            model_name='moodnote',
+            name='encrypted_blob',
+            field=models.BinaryField(blank=True, help_text='Encrypted journal content in the versioned binary format (header + token, optionally zlib)', null=True),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.1 on 2026-10-17 00:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0038_moodnote_encrypted_blob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NoteSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token_hash', models.CharField(max_length=32)),
+                ('note', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='api.moodnote')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('note', 'token_hash'), name='searchtoken_note_hash_uniq')],
+                'indexes': [models.Index(fields=['token_hash', 'note'], name='searchtoken_hash_note')],
+            },
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.1 on 2026-10-17 00:40
+
+from django.db import migrations
+
+POSTGRES_FORWARD = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS moodnote_search_trgm ON api_moodnote USING gin (search_text gin_trgm_ops)',
+]
+POSTGRES_REVERSE = ['DROP INDEX IF EXISTS moodnote_search_trgm']
+
+# External-content FTS5 table over api_moodnote.search_text, kept in sync by triggers
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS moodnote_fts USING fts5("
+    "search_text, content='api_moodnote', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS moodnote_fts_ai AFTER INSERT ON api_moodnote BEGIN "
+    "INSERT INTO moodnote_fts(rowid, search_text) VALUES (new.id, new.search_text); END",
+    "CREATE TRIGGER IF NOT EXISTS moodnote_fts_ad AFTER DELETE ON api_moodnote BEGIN "
+    "INSERT INTO moodnote_fts(moodnote_fts, rowid, search_text) VALUES ('delete', old.id, old.search_text); END",
+    "CREATE TRIGGER IF NOT EXISTS moodnote_fts_au AFTER UPDATE OF search_text ON api_moodnote BEGIN "
+    "INSERT INTO moodnote_fts(moodnote_fts, rowid, search_text) VALUES ('delete', old.id, old.search_text); "
+    "INSERT INTO moodnote_fts(rowid, search_text) VALUES (new.id, new.search_text); END",
+    "INSERT INTO moodnote_fts(moodnote_fts) VALUES ('rebuild')",
+]
+SQLITE_REVERSE = [
+    'DROP TRIGGER IF EXISTS moodnote_fts_ai',
+    'DROP TRIGGER IF EXISTS moodnote_fts_ad',
+    'DROP TRIGGER IF EXISTS moodnote_fts_au',
+    'DROP TABLE IF EXISTS moodnote_fts',
+]
+
+
+def _run(schema_editor, statements):
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def create_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        _run(schema_editor, POSTGRES_FORWARD)
+    elif vendor == 'sqlite':
+        import sqlite3
+        # The trigram tokenizer needs SQLite 3.34+; older builds fall back to LIKE search
+        if sqlite3.sqlite_version_info >= (3, 34, 0):
+            _run(schema_editor, SQLITE_FORWARD)
+
+
+def drop_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        _run(schema_editor, POSTGRES_REVERSE)
+    elif vendor == 'sqlite':
+        _run(schema_editor, SQLITE_REVERSE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0039_notesearchtoken'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.1 on 2026-10-17 01:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_note_tags(apps, schema_editor):
+    """Materialize metadata['tags'] of every live note into NoteTag."""
+    MoodNote = apps.get_model('api', 'MoodNote')
+    NoteTag = apps.get_model('api', 'NoteTag')
+
+    batch = []
+    notes = MoodNote.objects.filter(is_deleted=False).values_list('id', 'user_id', 'metadata')
+    for note_id, user_id, metadata in notes.iterator(chunk_size=2000):
+        tags = metadata.get('tags') if isinstance(metadata, dict) else None
+        if not isinstance(tags, list):
+            continue
+        for tag in {str(t).strip()[:100] for t in tags if str(t).strip()}:
+            batch.append(NoteTag(user_id=user_id, note_id=note_id, tag=tag))
+        if len(batch) >= 5000:
+            NoteTag.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        NoteTag.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0041_keyset_pagination_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NoteTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tag', models.CharField(max_length=100)),
+                ('note', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='note_tags', to='api.moodnote')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='note_tags', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('note', 'tag'), name='notetag_note_tag_uniq')],
+                'indexes': [models.Index(fields=['user', 'tag'], name='notetag_user_tag')],
+            },
+        ),
+        migrations.RunPython(backfill_note_tags, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.1 on 2026-10-17 02:20
+
+import zoneinfo
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_local_date(apps, schema_editor):
+    """Stamp every existing note with its created_at date in TIME_ZONE (no user has a zone yet)."""
+    MoodNote = apps.get_model('api', 'MoodNote')
+    tz = zoneinfo.ZoneInfo(settings.TIME_ZONE)
+
+    batch = []
+    notes = MoodNote.objects.filter(local_date__isnull=True).only('id', 'created_at')
+    for note in notes.iterator(chunk_size=2000):
+        note.local_date = timezone.localdate(note.created_at, tz)
+        batch.append(note)
+        if len(batch) >= 2000:
+            MoodNote.objects.bulk_update(batch, ['local_date'])
+            batch = []
+    if batch:
+        MoodNote.objects.bulk_update(batch, ['local_date'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0042_notetag'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='timezone',
+            field=models.CharField(blank=True, default='', help_text='IANA time zone for day boundaries (blank = TIME_ZONE)', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='moodnote',
+            name='local_date',
+            field=models.DateField(blank=True, editable=False, help_text="created_at as a calendar date in the author's time zone", null=True),
+        ),
+        migrations.RunPython(backfill_local_date, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='moodnote',
+            index=models.Index(fields=['user', 'local_date'], name='moodnote_user_local_date'),
+        ),
+    ]
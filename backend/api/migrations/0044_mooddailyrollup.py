@@ -0,0 +1,80 @@
+# Generated by Django 5.2.1 on 2026-10-17 03:05
+
+from collections import Counter, defaultdict
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_rollups(apps, schema_editor):
+    """Aggregate every live note into its (user, local_date) rollup row."""
+    MoodNote = apps.get_model('api', 'MoodNote')
+    MoodDailyRollup = apps.get_model('api', 'MoodDailyRollup')
+
+    days = defaultdict(lambda: {
+        'count': 0, 'sentiment_sum': 0.0, 'sentiment_n': 0, 'stress_sum': 0, 'stress_n': 0,
+        'tag_counts': Counter(), 'activity_counts': Counter(),
+    })
+    notes = MoodNote.objects.filter(is_deleted=False, local_date__isnull=False).values_list(
+        'user_id', 'local_date', 'sentiment_score', 'stress_index', 'metadata',
+    )
+    for user_id, local_date, sentiment, stress, metadata in notes.iterator(chunk_size=2000):
+        day = days[user_id, local_date]
+        day['count'] += 1
+        if sentiment is not None:
+            day['sentiment_sum'] += sentiment
+            day['sentiment_n'] += 1
+        if stress is not None:
+            day['stress_sum'] += stress
+            day['stress_n'] += 1
+        meta = metadata if isinstance(metadata, dict) else {}
+        tags = meta.get('tags')
+        if isinstance(tags, list):
+            day['tag_counts'].update({str(t).strip()[:100] for t in tags if str(t).strip()})
+        activities = meta.get('activities')
+        if isinstance(activities, list):
+            day['activity_counts'].update(str(a) for a in activities)
+
+    MoodDailyRollup.objects.bulk_create(
+        [
+            MoodDailyRollup(
+                user_id=user_id, date=local_date,
+                **{**day, 'tag_counts': dict(day['tag_counts']), 'activity_counts': dict(day['activity_counts'])},
+            )
+            for (user_id, local_date), day in days.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0043_moodnote_local_date'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MoodDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(help_text="Note local_date (the author's calendar day)")),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('sentiment_sum', models.FloatField(default=0.0)),
+                ('sentiment_n', models.PositiveIntegerField(default=0)),
+                ('stress_sum', models.IntegerField(default=0)),
+                ('stress_n', models.PositiveIntegerField(default=0)),
+                ('tag_counts', models.JSONField(blank=True, default=dict)),
+                ('activity_counts', models.JSONField(blank=True, default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mood_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['date'],
+                'constraints': [models.UniqueConstraint(fields=('user', 'date'), name='rollup_user_date_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
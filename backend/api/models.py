@@ -1,9 +1,11 @@
 import uuid
+import zoneinfo
 
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.utils import timezone as dj_timezone
 from django.utils.html import strip_tags
 
 
@@ -11,23 +13,54 @@ class CustomUser(AbstractUser):
     bio = models.TextField(blank=True, default='')
     avatar = models.ImageField(upload_to='avatars/', null=True, blank=True)
     token_version = models.PositiveIntegerField(default=0)
+    wrapped_data_key = models.TextField(blank=True, default='', help_text='Per-user Fernet data key, encrypted by ENCRYPTION_KEY')
+    timezone = models.CharField(
+        max_length=64, blank=True, default='',
+        help_text='IANA time zone for day boundaries (blank = TIME_ZONE)',
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-date_joined', '-id'], name='user_date_joined'),
+        ]
 
     def __str__(self):
         return self.username
 
+    @property
+    def tzinfo(self):
+        """The user's time zone, falling back to ``TIME_ZONE`` when unset or unknown."""
+        try:
+            return zoneinfo.ZoneInfo(self.timezone or settings.TIME_ZONE)
+        except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+            return zoneinfo.ZoneInfo(settings.TIME_ZONE)
+
+    def localdate(self, value=None):
+        """Calendar date of ``value`` (default: now) in the user's time zone."""
+        return dj_timezone.localdate(value, self.tzinfo)
+
 
 class MoodNote(models.Model):
+    ANALYSIS_STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
         related_name='notes',
     )
-    encrypted_content = models.TextField(help_text='AES-256 encrypted journal content')
+    encrypted_content = models.TextField(blank=True, default='', help_text='AES-256 encrypted journal content (legacy text token)')
+    encrypted_blob = models.BinaryField(
+        null=True, blank=True,
+        help_text='Encrypted journal content in the versioned binary format (header + token, optionally zlib)',
+    )
     sentiment_score = models.FloatField(
         null=True, blank=True,
         validators=[MinValueValidator(-1.0), MaxValueValidator(1.0)],
@@ -39,12 +72,18 @@ class MoodNote(models.Model):
         help_text='0 (calm) to 10 (extreme stress)',
     )
     ai_feedback = models.TextField(blank=True, default='')
+    analysis_status = models.CharField(max_length=10, choices=ANALYSIS_STATUS_CHOICES, default='done')
     search_text = models.TextField(blank=True, default='', help_text='Plaintext index (first 500 chars) for DB-level search')
+    content_digest = models.CharField(max_length=64, blank=True, default='', help_text='Keyed HMAC-SHA256 of the plaintext content')
     is_pinned = models.BooleanField(default=False)
     is_deleted = models.BooleanField(default=False)
     deleted_at = models.DateTimeField(null=True, blank=True)
     metadata = models.JSONField(default=dict, blank=True, help_text='weather, temperature, location, tags')
     created_at = models.DateTimeField(auto_now_add=True)
+    local_date = models.DateField(
+        null=True, blank=True, editable=False,
+        help_text="created_at as a calendar date in the author's time zone",
+    )
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
@@ -54,6 +93,10 @@ class MoodNote(models.Model):
             models.Index(fields=['user', 'sentiment_score'], name='moodnote_user_sentiment'),
             models.Index(fields=['user', 'search_text'], name='moodnote_user_search'),
             models.Index(fields=['user', 'is_deleted'], name='moodnote_user_deleted'),
+            # Keyset pagination of the journal feed: (-is_pinned, -created_at, -id)
+            models.Index(fields=['user', 'is_deleted', '-is_pinned', '-created_at', '-id'], name='moodnote_user_feed'),
+            # Streaks, calendar and weekly/period reports bucket by the author's local day
+            models.Index(fields=['user', 'local_date'], name='moodnote_user_local_date'),
         ]
 
     def __str__(self):
@@ -62,26 +105,151 @@ class MoodNote(models.Model):
     # --- Encryption helpers ---
 
     _raw_content = None
+    # (ciphertext, plaintext) of the last decryption — reused while the token is unchanged
+    _plaintext_cache = None
+    content_changed = False
 
     def set_content(self, plaintext: str):
-        """Stage plaintext content to be encrypted on save."""
+        """Stage plaintext content to be encrypted on save.
+
+        Sets ``content_changed`` when the text differs from what is stored
+        (compared by keyed digest, so no decryption is needed).
+        """
+        from api.services.encryption import content_digest
+        digest = content_digest(plaintext)
+        self.content_changed = digest != self.content_digest
+        self.content_digest = digest
         self._raw_content = plaintext
+        self._plaintext_cache = None
+
+    def assign_local_date(self):
+        """Set ``local_date`` from created_at in the author's time zone, if not set yet."""
+        if self.local_date is None:
+            # New notes: created_at is stamped by auto_now_add inside the save, microseconds after now()
+            self.local_date = self.user.localdate(self.created_at or dj_timezone.now())
 
     def save(self, *args, **kwargs):
-        if self._raw_content is not None:
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            self.assign_local_date()
+        from api.services.rollups import ROLLUP_FIELDS
+
+        tags_affected = update_fields is None or bool({'metadata', 'is_deleted'} & set(update_fields))
+        rollup_affected = update_fields is None or bool(ROLLUP_FIELDS & set(update_fields))
+        plaintext = self._raw_content
+        if plaintext is None and not rollup_affected:
+            return super().save(*args, **kwargs)
+
+        from django.db import transaction
+
+        from api.services import rollups
+
+        if plaintext is not None:
             from api.services.encryption import encryption_service
-            self.encrypted_content = encryption_service.encrypt(self._raw_content)
-            self.search_text = strip_tags(self._raw_content)[:500]
+            self.set_ciphertext(encryption_service.encrypt_for_storage(plaintext, user_id=self.user_id))
+            self.search_text = strip_tags(plaintext)[:500]
+            self._plaintext_cache = (self.ciphertext, plaintext)
             self._raw_content = None
-        super().save(*args, **kwargs)
+        created = self._state.adding
+        with transaction.atomic():
+            old_state = None
+            if rollup_affected and not created:
+                old_state = rollups.locked_states(MoodNote.objects.filter(pk=self.pk)).get(self.pk)
+            super().save(*args, **kwargs)
+            if plaintext is not None:
+                from api.services.search_index import index_note
+                index_note(self, strip_tags(plaintext), created=created)
+            if tags_affected:
+                self.sync_tags(created=created)
+            if rollup_affected:
+                rollups.apply_changes([(old_state, rollups.note_state(self, old_state, update_fields))])
+
+    def delete(self, *args, **kwargs):
+        from django.db import transaction
+
+        from api.services import rollups
+
+        with transaction.atomic():
+            old_state = rollups.locked_states(MoodNote.objects.filter(pk=self.pk)).get(self.pk)
+            result = super().delete(*args, **kwargs)
+            rollups.apply_changes([(old_state, None)])
+        return result
+
+    # --- Tags ---
+
+    @staticmethod
+    def tags_from_metadata(metadata) -> set[str]:
+        """Normalized tags from ``metadata['tags']``."""
+        tags = metadata.get('tags') if isinstance(metadata, dict) else None
+        if not isinstance(tags, list):
+            return set()
+        return {str(t).strip()[:NoteTag.MAX_LENGTH] for t in tags if str(t).strip()}
+
+    def tag_names(self) -> set[str]:
+        return self.tags_from_metadata(self.metadata)
+
+    def sync_tags(self, created: bool = False):
+        """Make this note's ``NoteTag`` rows match its metadata (none while it is in the trash)."""
+        wanted = set() if self.is_deleted else self.tag_names()
+        existing = set() if created else set(
+            NoteTag.objects.filter(note=self).values_list('tag', flat=True)
+        )
+        if existing - wanted:
+            NoteTag.objects.filter(note=self, tag__in=existing - wanted).delete()
+        if wanted - existing:
+            NoteTag.objects.bulk_create(
+                [NoteTag(user_id=self.user_id, note=self, tag=tag) for tag in wanted - existing],
+                ignore_conflicts=True,
+            )
+
+    @property
+    def ciphertext(self) -> str | bytes:
+        """Stored ciphertext in whichever format the row uses (binary blob or legacy text token)."""
+        if self.encrypted_blob is not None:
+            return bytes(self.encrypted_blob)
+        return self.encrypted_content
+
+    def set_ciphertext(self, token: str | bytes):
+        """Store ``token`` in the column matching its format and clear the other one."""
+        if isinstance(token, bytes):
+            self.encrypted_blob, self.encrypted_content = token, ''
+        else:
+            self.encrypted_blob, self.encrypted_content = None, token
 
     @property
     def content(self) -> str:
-        """Decrypt and return content."""
-        if not self.encrypted_content:
+        """Decrypt and return content (memoized per instance until the ciphertext changes)."""
+        if self._raw_content is not None:
+            return self._raw_content
+        token = self.ciphertext
+        if not token:
             return ''
+        cached = self._plaintext_cache
+        if cached is not None and cached[0] == token:
+            return cached[1]
+        from api.services.encryption import encryption_service
+        plaintext = encryption_service.decrypt(token, user_id=self.user_id)
+        self._plaintext_cache = (token, plaintext)
+        return plaintext
+
+    @staticmethod
+    def prefetch_content(notes) -> list:
+        """Decrypt many notes in one ``decrypt_many`` call and memoize each plaintext."""
         from api.services.encryption import encryption_service
-        return encryption_service.decrypt(self.encrypted_content)
+        notes = list(notes)
+        pending = []
+        for note in notes:
+            if note._raw_content is not None:
+                continue
+            token = note.ciphertext
+            if token and (note._plaintext_cache is None or note._plaintext_cache[0] != token):
+                pending.append((note, token))
+        plaintexts = encryption_service.decrypt_many(
+            [token for _, token in pending], user_ids=[n.user_id for n, _ in pending],
+        )
+        for (note, token), plaintext in zip(pending, plaintexts):
+            note._plaintext_cache = (token, plaintext)
+        return notes
 
     @property
     def content_preview(self) -> str:
@@ -92,6 +260,125 @@ class MoodNote(models.Model):
         return full[:100] + '...'
 
 
+class MoodDailyRollup(models.Model):
+    """Sums of one user's live notes on one local day, maintained by ``api.services.rollups``."""
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='mood_rollups',
+    )
+    date = models.DateField(help_text="Note local_date (the author's calendar day)")
+    count = models.PositiveIntegerField(default=0)
+    sentiment_sum = models.FloatField(default=0.0)
+    sentiment_n = models.PositiveIntegerField(default=0)
+    stress_sum = models.IntegerField(default=0)
+    stress_n = models.PositiveIntegerField(default=0)
+    tag_counts = models.JSONField(default=dict, blank=True)
+    activity_counts = models.JSONField(default=dict, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['date']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date'], name='rollup_user_date_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} {self.date}: {self.count} notes'
+
+    @property
+    def avg_sentiment(self):
+        return self.sentiment_sum / self.sentiment_n if self.sentiment_n else None
+
+    @property
+    def avg_stress(self):
+        return self.stress_sum / self.stress_n if self.stress_n else None
+
+
+class NoteTag(models.Model):
+    """One tag of a live note, materialized from ``MoodNote.metadata['tags']`` for indexed tag queries."""
+
+    MAX_LENGTH = 100
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='note_tags',
+    )
+    note = models.ForeignKey(
+        MoodNote,
+        on_delete=models.CASCADE,
+        related_name='note_tags',
+    )
+    tag = models.CharField(max_length=MAX_LENGTH)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['note', 'tag'], name='notetag_note_tag_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'tag'], name='notetag_user_tag'),
+        ]
+
+    def __str__(self):
+        return f'#{self.tag} on note {self.note_id}'
+
+
+class NoteSearchToken(models.Model):
+    """Keyed hash of one term of a note's full text (blind keyword index, see services/search_index)."""
+
+    note = models.ForeignKey(
+        MoodNote,
+        on_delete=models.CASCADE,
+        related_name='search_tokens',
+    )
+    token_hash = models.CharField(max_length=32)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['note', 'token_hash'], name='searchtoken_note_hash_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['token_hash', 'note'], name='searchtoken_hash_note'),
+        ]
+
+    def __str__(self):
+        return f'SearchToken note={self.note_id} {self.token_hash[:8]}'
+
+
+class NoteAnalysisJob(models.Model):
+    """Queued AI analysis for a note, processed by `process_analysis_jobs`."""
+
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    note = models.ForeignKey(
+        MoodNote,
+        on_delete=models.CASCADE,
+        related_name='analysis_jobs',
+    )
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='analysisjob_status_created'),
+        ]
+
+    def __str__(self):
+        return f'AnalysisJob #{self.pk} note={self.note_id} ({self.status})'
+
+
 class CounselorProfile(models.Model):
     """Counselor profile that requires admin verification."""
 
@@ -213,6 +500,7 @@ class Notification(models.Model):
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['user', 'is_read', '-created_at'], name='notif_user_read'),
+            models.Index(fields=['user', '-created_at', '-id'], name='notif_user_created'),
         ]
 
     def __str__(self):
@@ -297,6 +585,8 @@ class Booking(models.Model):
         ordering = ['-date', '-start_time']
         indexes = [
             models.Index(fields=['counselor', 'date', 'status'], name='booking_counselor_date'),
+            models.Index(fields=['user', '-created_at', '-id'], name='booking_user_created'),
+            models.Index(fields=['counselor', '-created_at', '-id'], name='booking_counselor_created'),
         ]
 
     def __str__(self):
@@ -320,6 +610,9 @@ class Feedback(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='feedback_created'),
+        ]
 
     def __str__(self):
         return f'{self.user.username} — {self.rating}★ ({self.created_at:%Y-%m-%d})'
@@ -359,6 +652,12 @@ class AIChatSession(models.Model):
     title = models.CharField(max_length=100, default='New Chat')
     is_active = models.BooleanField(default=True)
     is_pinned = models.BooleanField(default=False)
+    summary = models.TextField(blank=True, default='', help_text='Rolling summary of messages older than the context window')
+    summarized_through = models.BigIntegerField(default=0, help_text='ID of the newest message folded into summary')
+    # Denormalized from AIChatMessage, maintained by AIChatMessage.save()/delete()
+    message_count = models.PositiveIntegerField(default=0)
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    last_message_preview = models.CharField(max_length=80, blank=True, default='')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -395,6 +694,72 @@ class AIChatMessage(models.Model):
     def __str__(self):
         return f'{self.role}: {self.content[:50]}'
 
+    def save(self, *args, **kwargs):
+        """New messages bump the session's counter and preview in the same transaction."""
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+        from django.db import transaction
+        from django.db.models import F
+        from django.utils import timezone
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            preview = self.content[:80]
+            AIChatSession.objects.filter(pk=self.session_id).update(
+                message_count=F('message_count') + 1,
+                last_message_at=self.created_at,
+                last_message_preview=preview,
+                updated_at=timezone.now(),
+            )
+        if AIChatMessage.session.is_cached(self):
+            self.session.message_count += 1
+            self.session.last_message_at = self.created_at
+            self.session.last_message_preview = preview
+
+    def delete(self, *args, **kwargs):
+        from django.db import transaction
+        from django.db.models import F
+
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            last = (
+                AIChatMessage.objects.filter(session_id=self.session_id)
+                .order_by('-created_at', '-id').values('content', 'created_at').first()
+            )
+            AIChatSession.objects.filter(pk=self.session_id, message_count__gt=0).update(
+                message_count=F('message_count') - 1,
+                last_message_at=last['created_at'] if last else None,
+                last_message_preview=last['content'][:80] if last else '',
+            )
+        return result
+
+
+class AIChatSummaryJob(models.Model):
+    """Queued rolling-summary refresh for an AI chat session, processed by `process_analysis_jobs`."""
+
+    STATUS_CHOICES = NoteAnalysisJob.STATUS_CHOICES
+
+    session = models.ForeignKey(
+        AIChatSession,
+        on_delete=models.CASCADE,
+        related_name='summary_jobs',
+    )
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='summaryjob_status_created'),
+        ]
+
+    def __str__(self):
+        return f'SummaryJob #{self.pk} session={self.session_id} ({self.status})'
+
 
 class UserAchievement(models.Model):
     user = models.ForeignKey(
@@ -0,0 +1,125 @@
+"""Keyset (cursor) pagination for list endpoints that are scrolled deep."""
+import base64
+import json
+from datetime import date, datetime
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Forward-only pagination over a unique, non-null ordering such as ('-created_at', '-id').
+
+    Each page is one range query that starts after the previous page's last
+    row (``created_at < x OR (created_at = x AND id < y)``). It does not need
+    COUNT(*) or OFFSET, so page 500 costs the same as page 1. The ``next``
+    link carries an opaque cursor, and ``?count=1`` adds the total.
+
+    A view can vary the ordering per request by defining
+    ``get_keyset_ordering(queryset)`` (returning None keeps ``ordering``).
+    Ordering keys may be annotations, e.g. a float search rank, but must
+    never be NULL.
+    """
+
+    ordering = ('-created_at', '-id')
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        get_ordering = getattr(view, 'get_keyset_ordering', None)
+        self.fields = tuple((get_ordering(queryset) if get_ordering else None) or self.ordering)
+        self.page_size = self.get_page_size(request)
+
+        self.count = None
+        if request.query_params.get(self.count_query_param) in ('1', 'true'):
+            self.count = queryset.count()
+
+        queryset = queryset.order_by(*self.fields)
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            queryset = queryset.filter(self._after(cursor, queryset))
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_page_size(self, request) -> int:
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def _after(self, values, queryset):
+        """Q for rows strictly after ``values`` in ``self.fields`` order."""
+        from django.db.models import Q
+
+        q = Q()
+        equal = {}
+        for field, value in zip(self.fields, values):
+            name = field.lstrip('-')
+            value = self._to_python(queryset, name, value)
+            q |= Q(**equal, **{f'{name}__{"lt" if field.startswith("-") else "gt"}': value})
+            equal[name] = value
+        return q
+
+    @staticmethod
+    def _to_python(queryset, name, value):
+        """Cursor value back to the Python type of the model field or annotation it came from."""
+        from django.core.exceptions import ValidationError
+
+        annotation = queryset.query.annotations.get(name)
+        field = annotation.output_field if annotation is not None else queryset.model._meta.get_field(name)
+        try:
+            return field.to_python(value)
+        except (ValidationError, TypeError):
+            raise NotFound(KeysetPagination.invalid_cursor_message)
+
+    def encode_cursor(self, row) -> str:
+        values = []
+        for field in self.fields:
+            value = getattr(row, field.lstrip('-'))
+            values.append(value.isoformat() if isinstance(value, (datetime, date)) else value)
+        return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+        except (ValueError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.fields) or None in values:
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        body = {'next': self.get_next_link(), 'results': data}
+        if self.count is not None:
+            body['count'] = self.count
+        return Response(body)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'count': {'type': 'integer'},
+                'results': schema,
+            },
+        }
@@ -5,4 +5,5 @@ from . import consumers
 websocket_urlpatterns = [
     re_path(r'ws/chat/(?P<conv_id>\d+)/$', consumers.ChatConsumer.as_asgi()),
     re_path(r'ws/notifications/$', consumers.NotificationConsumer.as_asgi()),
+    re_path(r'ws/ai-chat/(?P<session_id>\d+)/$', consumers.AIChatConsumer.as_asgi()),
 ]
@@ -1,4 +1,5 @@
 import logging
+import zoneinfo
 
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
@@ -33,12 +34,20 @@ class UserProfileSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = User
-        fields = ('id', 'username', 'email', 'bio', 'avatar', 'is_counselor', 'is_staff', 'created_at', 'updated_at')
+        fields = (
+            'id', 'username', 'email', 'bio', 'avatar', 'timezone',
+            'is_counselor', 'is_staff', 'created_at', 'updated_at',
+        )
         read_only_fields = ('id', 'username', 'is_staff', 'created_at', 'updated_at')
 
     def get_is_counselor(self, obj):
         return hasattr(obj, 'counselor_profile') and obj.counselor_profile.is_approved
 
+    def validate_timezone(self, value):
+        if value and value not in zoneinfo.available_timezones():
+            raise serializers.ValidationError('Unknown time zone.')
+        return value
+
 
 class MoodNoteSerializer(serializers.ModelSerializer):
     """Full serializer — write accepts plaintext `content`, read returns decrypted."""
@@ -50,10 +59,13 @@ class MoodNoteSerializer(serializers.ModelSerializer):
         model = MoodNote
         fields = (
             'id', 'content', 'decrypted_content',
-            'sentiment_score', 'stress_index', 'ai_feedback',
+            'sentiment_score', 'stress_index', 'ai_feedback', 'analysis_status',
             'is_pinned', 'metadata', 'attachments', 'created_at', 'updated_at',
         )
-        read_only_fields = ('id', 'sentiment_score', 'stress_index', 'ai_feedback', 'created_at', 'updated_at')
+        read_only_fields = (
+            'id', 'sentiment_score', 'stress_index', 'ai_feedback', 'analysis_status',
+            'created_at', 'updated_at',
+        )
 
     def get_attachments(self, obj):
         return NoteAttachmentSerializer(obj.attachments.all(), many=True).data
@@ -83,10 +95,19 @@ class MoodNoteListSerializer(serializers.ModelSerializer):
         model = MoodNote
         fields = (
             'id', 'content_preview',
-            'sentiment_score', 'stress_index',
+            'sentiment_score', 'stress_index', 'analysis_status',
             'is_pinned', 'metadata', 'created_at',
         )
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        search = self.context.get('search')
+        if search:
+            from .services.search_backends import snippet_offsets
+            data['search_rank'] = getattr(instance, 'search_rank', None)
+            data['search_snippet'] = snippet_offsets(instance.search_text, search)
+        return data
+
 
 # ===== Counselor =====
 
@@ -258,6 +279,15 @@ class FeedbackSerializer(serializers.ModelSerializer):
 
 # ===== Shared Notes =====
 
+class SharedNoteListSerializer(serializers.ListSerializer):
+    """Decrypts all shared notes of a page in one bulk call before per-row serialization."""
+
+    def to_representation(self, data):
+        items = list(data.all() if hasattr(data, 'all') else data)
+        MoodNote.prefetch_content(s.note for s in items)
+        return super().to_representation(items)
+
+
 class SharedNoteSerializer(serializers.ModelSerializer):
     note_preview = serializers.CharField(source='note.content_preview', read_only=True)
     note_content = serializers.SerializerMethodField()
@@ -274,6 +304,7 @@ class SharedNoteSerializer(serializers.ModelSerializer):
                   'sentiment_score', 'stress_index', 'is_anonymous', 'shared_at',
                   'note_created_at', 'note_tags', 'note_ai_feedback')
         read_only_fields = fields
+        list_serializer_class = SharedNoteListSerializer
 
     def get_author(self, obj):
         if obj.is_anonymous:
@@ -303,28 +334,18 @@ class AIChatMessageSerializer(serializers.ModelSerializer):
 
 
 class AIChatSessionSerializer(serializers.ModelSerializer):
-    message_count = serializers.SerializerMethodField()
     last_message_preview = serializers.SerializerMethodField()
 
     class Meta:
         model = AIChatSession
-        fields = ('id', 'title', 'is_active', 'is_pinned', 'message_count', 'last_message_preview', 'created_at', 'updated_at')
-        read_only_fields = ('id', 'created_at', 'updated_at')
-
-    def get_message_count(self, obj):
-        # Use annotation if available, otherwise fallback to query
-        if hasattr(obj, '_message_count'):
-            return obj._message_count
-        return obj.messages.count()
+        fields = (
+            'id', 'title', 'is_active', 'is_pinned', 'message_count', 'last_message_preview',
+            'last_message_at', 'created_at', 'updated_at',
+        )
+        read_only_fields = ('id', 'message_count', 'last_message_at', 'created_at', 'updated_at')
 
     def get_last_message_preview(self, obj):
-        # Use annotation if available, otherwise fallback to query
-        if hasattr(obj, '_last_message_preview'):
-            return obj._last_message_preview
-        last_msg = obj.messages.order_by('-created_at').first()
-        if last_msg:
-            return last_msg.content[:80]
-        return None
+        return obj.last_message_preview or None
 
 
 class UserAchievementSerializer(serializers.ModelSerializer):
@@ -2,7 +2,7 @@ from django.utils import timezone
 
 from api.models import (
     AIChatSession, Booking, Conversation, Feedback, Message, MoodNote,
-    NoteAttachment, SharedNote, UserAchievement,
+    NoteAttachment, NoteTag, SharedNote, UserAchievement,
 )
 
 ACHIEVEMENT_DEFINITIONS = {
@@ -230,12 +230,8 @@ def _get_note_count(user):
 
 
 def _get_longest_streak(user):
-    dates = list(
-        MoodNote.objects.filter(user=user, is_deleted=False)
-        .values_list('created_at__date', flat=True)
-        .distinct()
-        .order_by('-created_at__date')[:366]
-    )
+    from api.services.rollups import active_dates
+    dates = active_dates(user)
     if not dates:
         return 0
     sorted_dates = sorted(set(dates))
@@ -315,12 +311,8 @@ def _get_ai_analyzed_count(user):
 
 def _has_weekend_pair(user):
     """Check if the user has written notes on both Saturday and Sunday of the same week."""
-    dates = list(
-        MoodNote.objects.filter(user=user, is_deleted=False)
-        .values_list('created_at__date', flat=True)
-        .distinct()
-        .order_by('created_at__date')
-    )
+    from api.services.rollups import daily_rows
+    dates = list(daily_rows(user).values_list('date', flat=True))
     # Group by ISO week
     weeks = {}
     for d in dates:
@@ -331,13 +323,8 @@ def _has_weekend_pair(user):
 
 
 def _get_distinct_tag_count(user):
-    """Count distinct tags across all notes (only recent 500 for performance)."""
-    tags = set()
-    for meta in MoodNote.objects.filter(user=user, is_deleted=False).order_by('-created_at').values_list('metadata', flat=True)[:500]:
-        if meta and isinstance(meta, dict):
-            for tag in (meta.get('tags') or []):
-                tags.add(tag)
-    return len(tags)
+    """Count distinct tags across all live notes (COUNT DISTINCT on the NoteTag index)."""
+    return NoteTag.objects.filter(user=user).values('tag').distinct().count()
 
 
 def _get_weather_note_count(user):
@@ -383,7 +370,7 @@ def _get_progress(user):
     }
 
     has_weekend = _has_weekend_pair(user)
-    distinct_months = MoodNote.objects.filter(user=user, is_deleted=False).dates('created_at', 'month').count()
+    distinct_months = user.mood_rollups.dates('date', 'month').count()
     mood_buckets = _get_distinct_mood_buckets(user)
     tag_count = _get_distinct_tag_count(user)
     weather_count = _get_weather_note_count(user)
@@ -1,9 +1,12 @@
 import logging
+import time
 
 from django.conf import settings
 
 logger = logging.getLogger(__name__)
 
+MAX_AI_CHAT_MESSAGE_LENGTH = 2000
+
 # Trilingual system prompts for the AI chat companion
 SYSTEM_PROMPTS = {
     'zh-TW': (
@@ -56,6 +59,17 @@ FALLBACK_RESPONSES = {
     'ja': '申し訳ございません、現在一時的に応答できません。後ほどもう一度お試しいただくか、思いを書き留めてから改めてお話しましょう。',
 }
 
+# Appended to a streamed reply that was cut off part-way
+TRUNCATED_MARKERS = {
+    'zh-TW': '……（回覆中斷）',
+    'en': '… (reply interrupted)',
+    'ja': '……（応答が中断されました）',
+}
+
+
+class StreamInterrupted(Exception):
+    """The completion stream failed after part of the reply had been yielded."""
+
 
 def _get_lang(accept_language):
     """Extract language preference from Accept-Language header."""
@@ -70,43 +84,229 @@ def _get_lang(accept_language):
 
 
 def analyze_user_message(text):
-    """Quick local sentiment analysis for a user message (no API call)."""
+    """Quick local sentiment analysis for a user message (no API call).
+
+    Uses the jieba path rather than ``analyze_batch``: for one short message
+    segmentation is cheap, and it keeps single-character terms such as 好 from
+    matching inside longer words (好像).
+    """
     from api.services.ai_engine import AIEngine
-    words = AIEngine._segment_text(text)
-    return AIEngine._analyze_sentiment_local(words)
+    return AIEngine._analyze_sentiment_local(AIEngine._segment_text(text))
 
 
-def generate_ai_response(session_messages, lang='zh-TW'):
-    """
-    Generate an AI response given conversation history.
-    Uses OpenAI Chat API with the last 20 messages for context.
-    Falls back to a canned response if OpenAI is unavailable.
-    """
+def save_user_message(session, content):
+    """Store a user turn (with local sentiment) and bump the session; titles new sessions."""
+    from api.models import AIChatMessage, AIChatSession
+
+    sentiment = analyze_user_message(content)
+    user_msg = AIChatMessage.objects.create(
+        session=session,
+        role='user',
+        content=content,
+        sentiment_score=sentiment['sentiment_score'],
+        stress_index=sentiment['stress_index'],
+    )
+
+    # Auto-set session title from first message (saving the message already bumped updated_at)
+    if AIChatSession.objects.filter(pk=session.pk, message_count=1).update(title=content[:50]):
+        session.title = content[:50]
+    return user_msg
+
+
+def estimate_tokens(text):
+    """Rough token count without a tokenizer: ~1 per CJK character, ~4 other characters per token."""
+    wide = sum(1 for ch in text if ord(ch) >= 0x2E80)
+    return wide + (len(text) - wide + 3) // 4 + 4  # + per-message overhead
+
+
+def load_context(session):
+    """Newest AI_CHAT_CONTEXT_MESSAGES messages of the session, oldest first (one bounded query)."""
+    recent = list(
+        session.messages.order_by('-created_at', '-id')[:settings.AI_CHAT_CONTEXT_MESSAGES]
+    )
+    recent.reverse()
+    return recent
+
+
+def _build_messages(session_messages, lang, summary=''):
+    """System prompt + session summary + as many of the newest messages as fit the token budget."""
     system_prompt = SYSTEM_PROMPTS.get(lang, SYSTEM_PROMPTS['zh-TW'])
+    head = [{'role': 'system', 'content': system_prompt}]
+    if summary:
+        head.append({'role': 'system', 'content': f'Summary of the earlier conversation:\n{summary}'})
 
-    # Build messages list: system + last 20 messages
-    messages = [{'role': 'system', 'content': system_prompt}]
-    recent = session_messages[-20:]
-    for msg in recent:
-        messages.append({
+    budget = settings.AI_CHAT_CONTEXT_TOKEN_BUDGET - sum(estimate_tokens(m['content']) for m in head)
+    turns = []
+    for msg in reversed(session_messages[-settings.AI_CHAT_CONTEXT_MESSAGES:]):
+        cost = estimate_tokens(msg.content)
+        if turns and cost > budget:
+            break
+        budget -= cost
+        turns.append({
             'role': msg.role,
             'content': msg.content,
         })
+    turns.reverse()
+    return head + turns
+
+
+def _unsummarized(session):
+    """Messages past the context window and not yet summarized, oldest first (None until the window is full)."""
+    window_ids = list(
+        session.messages.order_by('-created_at', '-id')
+        .values_list('id', flat=True)[:settings.AI_CHAT_CONTEXT_MESSAGES]
+    )
+    if len(window_ids) < settings.AI_CHAT_CONTEXT_MESSAGES:
+        return None
+    return (
+        session.messages.filter(id__gt=session.summarized_through, id__lt=min(window_ids))
+        .order_by('created_at', 'id')
+    )
+
+
+def summary_due(session):
+    """Whether AI_CHAT_SUMMARY_EVERY messages have left the window since the last refresh."""
+    if not getattr(settings, 'OPENAI_API_KEY', None):
+        return False
+    pending = _unsummarized(session)
+    every = settings.AI_CHAT_SUMMARY_EVERY
+    return pending is not None and pending[:every].count() >= every
+
+
+def refresh_summary_if_due(session):
+    """Fold messages that left the context window into ``session.summary``.
+
+    Runs only once AI_CHAT_SUMMARY_EVERY such messages have accumulated, and
+    sends the previous summary plus at most AI_CHAT_SUMMARY_EVERY ×
+    AI_CHAT_SUMMARY_MAX_BATCHES of the oldest of them, so each refresh is one
+    short completion however far behind the session is; call it again until
+    it returns False to catch up. Failures keep the old summary. Runs in the
+    ``process_analysis_jobs`` worker (see ``enqueue_summary``).
+    """
+    if not summary_due(session):
+        return False
+    limit = settings.AI_CHAT_SUMMARY_EVERY * settings.AI_CHAT_SUMMARY_MAX_BATCHES
+    pending = list(_unsummarized(session)[:limit])
+
+    from api.services.circuit_breaker import llm_available, llm_guard
+    if not llm_available('chat_summary'):
+        return False
+
+    transcript = '\n'.join(f'{m.role}: {m.content[:1000]}' for m in pending)
+    try:
+        from api.services.llm_client import get_openai_client
+        client = get_openai_client('chat_summary')
+        with llm_guard('chat_summary'):
+            response = client.chat.completions.create(
+                model=getattr(settings, 'OPENAI_MODEL', 'gpt-4o-mini'),
+                messages=[
+                    {
+                        'role': 'system',
+                        'content': (
+                            'You maintain a running summary of a supportive mental-health chat. '
+                            'Merge the previous summary with the new messages into one updated summary '
+                            'of at most 150 words, in the same language as the conversation. Keep the '
+                            "user's key events, feelings, concerns and anything the assistant promised "
+                            'to follow up on. Output only the summary.'
+                        ),
+                    },
+                    {
+                        'role': 'user',
+                        'content': f'Previous summary:\n{session.summary or "(none)"}\n\nNew messages:\n{transcript}',
+                    },
+                ],
+                temperature=0.3,
+                max_tokens=300,
+            )
+        summary = response.choices[0].message.content.strip()
+    except Exception as e:
+        logger.warning('AI chat summary refresh failed for session %s: %s', session.pk, e)
+        return False
+
+    session.summary = summary
+    session.summarized_through = pending[-1].id
+    session.save(update_fields=['summary', 'summarized_through'])
+    return True
+
+
+def generate_ai_response(session_messages, lang='zh-TW', summary=''):
+    """
+    Generate an AI response given conversation history (see ``load_context``)
+    and the session's rolling summary. The prompt is capped by
+    AI_CHAT_CONTEXT_TOKEN_BUDGET. Falls back to a canned response if OpenAI
+    is unavailable.
+    """
+    messages = _build_messages(session_messages, lang, summary)
 
     if not getattr(settings, 'OPENAI_API_KEY', None):
         logger.warning('OPENAI_API_KEY not set, returning fallback response')
         return FALLBACK_RESPONSES.get(lang, FALLBACK_RESPONSES['zh-TW'])
 
+    from api.services.circuit_breaker import llm_available, llm_guard
+    if not llm_available('chat'):
+        return FALLBACK_RESPONSES.get(lang, FALLBACK_RESPONSES['zh-TW'])
+
     try:
-        from openai import OpenAI
-        client = OpenAI(api_key=settings.OPENAI_API_KEY)
-        response = client.chat.completions.create(
-            model=getattr(settings, 'OPENAI_MODEL', 'gpt-4o-mini'),
-            messages=messages,
-            temperature=0.8,
-            max_tokens=500,
-        )
+        from api.services.llm_client import get_openai_client
+        client = get_openai_client('chat')
+        with llm_guard('chat'):
+            response = client.chat.completions.create(
+                model=getattr(settings, 'OPENAI_MODEL', 'gpt-4o-mini'),
+                messages=messages,
+                temperature=0.8,
+                max_tokens=500,
+            )
         return response.choices[0].message.content.strip()
     except Exception as e:
         logger.warning('AI chat response generation failed: %s', e)
         return FALLBACK_RESPONSES.get(lang, FALLBACK_RESPONSES['zh-TW'])
+
+
+async def stream_ai_response(session_messages, lang='zh-TW', summary=''):
+    """
+    Async generator counterpart of ``generate_ai_response`` yielding text deltas
+    as the completion streams in. Yields the canned fallback as a single delta
+    when OpenAI is unavailable, fails before the first token or returns no
+    text. A failure after some text was yielded is recorded with the circuit
+    breaker and raised as ``StreamInterrupted``.
+    """
+    fallback = FALLBACK_RESPONSES.get(lang, FALLBACK_RESPONSES['zh-TW'])
+    messages = _build_messages(session_messages, lang, summary)
+
+    from api.services.circuit_breaker import get_breaker, llm_available, llm_guard
+    if not getattr(settings, 'OPENAI_API_KEY', None) or not llm_available('chat'):
+        yield fallback
+        return
+
+    from api.services.llm_client import get_async_openai_client
+    started = time.monotonic()
+    try:
+        client = get_async_openai_client('chat')
+        # The breaker times the call up to the response headers, i.e. time-to-first-token
+        with llm_guard('chat'):
+            stream = await client.chat.completions.create(
+                model=getattr(settings, 'OPENAI_MODEL', 'gpt-4o-mini'),
+                messages=messages,
+                temperature=0.8,
+                max_tokens=500,
+                stream=True,
+            )
+    except Exception as e:
+        logger.warning('AI chat stream failed to start: %s', e)
+        yield fallback
+        return
+
+    yielded = False
+    try:
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yielded = True
+                yield chunk.choices[0].delta.content
+    except Exception as e:
+        # llm_guard only covered the call up to the first chunk
+        get_breaker('chat').record(False, time.monotonic() - started)
+        logger.warning('AI chat stream failed mid-reply: %s', e)
+        if yielded:
+            raise StreamInterrupted(str(e)) from e
+    if not yielded:
+        yield fallback
@@ -0,0 +1,193 @@
+"""DB-backed queue for note AI analysis.
+
+Note create/update enqueue a NoteAnalysisJob and return immediately; the
+`process_analysis_jobs` management command claims jobs, runs
+``ai_engine.analyze`` and pushes the result to the owner's
+``notifications_<user_id>`` WebSocket group.
+
+The same worker drains AIChatSummaryJob, queued (with CHAT_SUMMARY_ASYNC)
+after an AI chat turn once the session's rolling summary is due, so the
+summary completion stays off the chat request path.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_analysis(note):
+    """Queue a note for analysis. Reuses an existing pending job for the note."""
+    from api.models import MoodNote, NoteAnalysisJob
+
+    with transaction.atomic():
+        # Serialises with run_job's supersede check, which holds the same row lock
+        list(MoodNote.objects.select_for_update().filter(pk=note.pk).values_list('pk', flat=True))
+        job = NoteAnalysisJob.objects.filter(note=note, status='pending').first()
+        if job is None:
+            job = NoteAnalysisJob.objects.create(note=note)
+        MoodNote.objects.filter(pk=note.pk).update(analysis_status='pending')
+    note.analysis_status = 'pending'
+    return job
+
+
+def claim_next_job(model=None):
+    """Atomically claim the oldest pending (or stale running) job. Returns None if idle.
+
+    ``model`` is the job table (default NoteAnalysisJob). Claiming is an
+    optimistic conditional UPDATE so several workers can poll the same table
+    on both PostgreSQL and SQLite without row locks.
+    """
+    from api.models import NoteAnalysisJob
+
+    model = model or NoteAnalysisJob
+    related = 'note' if model is NoteAnalysisJob else 'session'
+    stale_before = timezone.now() - timedelta(seconds=settings.NOTE_ANALYSIS_STALE_SECONDS)
+    claimable = Q(status='pending') | Q(status='running', started_at__lt=stale_before)
+
+    for job_id in model.objects.filter(claimable).order_by('created_at').values_list('id', flat=True)[:10]:
+        claimed = model.objects.filter(claimable, pk=job_id).update(
+            status='running', started_at=timezone.now(),
+        )
+        if claimed:
+            return model.objects.select_related(related).get(pk=job_id)
+    return None
+
+
+def _retry_or_fail(job, error):
+    """Put a failed job back in the queue, or mark it failed after NOTE_ANALYSIS_MAX_ATTEMPTS."""
+    job.status = 'pending' if job.attempts < settings.NOTE_ANALYSIS_MAX_ATTEMPTS else 'failed'
+    job.last_error = str(error)[:1000]
+    job.finished_at = timezone.now() if job.status == 'failed' else None
+    job.save(update_fields=['status', 'attempts', 'last_error', 'finished_at'])
+
+
+def run_job(job):
+    """Analyze the job's note, persist the scores and push the result. Never raises."""
+    from api.models import MoodNote, NoteAnalysisJob
+    from api.services.ai_engine import ai_engine
+    from api.services.analytics import invalidate_user_cache
+    from api.services.rollups import update_notes
+
+    note = job.note
+    job.attempts += 1
+    try:
+        plaintext = note.content
+        result = ai_engine.analyze(plaintext, user_id=note.user_id) if plaintext else None
+    except Exception as e:
+        logger.warning('Analysis job %s failed for note %s: %s', job.pk, note.pk, e)
+        _retry_or_fail(job, e)
+        if job.status == 'failed':
+            MoodNote.objects.filter(pk=note.pk).update(analysis_status='failed')
+            note.analysis_status = 'failed'
+            push_analysis_result(note)
+        return job
+
+    with transaction.atomic():
+        # Checked under the note's row lock: a newer pending job means the note was
+        # edited mid-analysis, so this result is stale and that job writes instead.
+        list(MoodNote.objects.select_for_update().filter(pk=note.pk).values_list('pk', flat=True))
+        superseded = NoteAnalysisJob.objects.filter(
+            note_id=note.pk, status='pending', created_at__gt=job.created_at,
+        ).exists()
+        if not superseded:
+            if result is not None:
+                note.sentiment_score = result['sentiment_score']
+                note.stress_index = result['stress_index']
+                note.ai_feedback = result['ai_feedback']
+            note.analysis_status = 'done'
+            update_notes(
+                MoodNote.objects.filter(pk=note.pk),
+                sentiment_score=note.sentiment_score,
+                stress_index=note.stress_index,
+                ai_feedback=note.ai_feedback,
+                analysis_status=note.analysis_status,
+            )
+        job.status = 'done'
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'attempts', 'finished_at'])
+
+    if superseded:
+        return job
+
+    invalidate_user_cache(note.user_id, [note.local_date])
+    new_achievements = []
+    try:
+        from api.services.achievements import check_achievements
+        new_achievements = check_achievements(note.user)
+    except Exception as e:
+        logger.warning('Achievement check failed for user %s: %s', note.user_id, e)
+    push_analysis_result(note, new_achievements)
+    return job
+
+
+def enqueue_summary(session):
+    """Queue a summary refresh for an AI chat session if one is due. Returns the job or None.
+
+    With CHAT_SUMMARY_ASYNC off (no worker) one bounded refresh pass runs
+    inline instead and any remainder is picked up on later turns.
+    """
+    from api.models import AIChatSummaryJob
+    from api.services.ai_chat import refresh_summary_if_due, summary_due
+
+    if not getattr(settings, 'CHAT_SUMMARY_ASYNC', True):
+        refresh_summary_if_due(session)
+        return None
+    if not summary_due(session):
+        return None
+    with transaction.atomic():
+        job = AIChatSummaryJob.objects.filter(session=session, status='pending').first()
+        if job is None:
+            job = AIChatSummaryJob.objects.create(session=session)
+    return job
+
+
+def run_summary_job(job):
+    """Fold the session's overdue messages into its summary, one bounded pass at a time. Never raises."""
+    from api.services.ai_chat import refresh_summary_if_due, summary_due
+
+    session = job.session
+    job.attempts += 1
+    try:
+        while refresh_summary_if_due(session):
+            pass
+        if summary_due(session):
+            raise RuntimeError('summary refresh failed')
+    except Exception as e:
+        logger.warning('Summary job %s failed for session %s: %s', job.pk, session.pk, e)
+        _retry_or_fail(job, e)
+        return job
+
+    job.status = 'done'
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'attempts', 'finished_at'])
+    return job
+
+
+def push_analysis_result(note, new_achievements=None):
+    """Push analysis scores to the note owner's notification socket (fire-and-forget)."""
+    try:
+        from asgiref.sync import async_to_sync
+        from channels.layers import get_channel_layer
+        channel_layer = get_channel_layer()
+        async_to_sync(channel_layer.group_send)(
+            f'notifications_{note.user_id}',
+            {
+                'type': 'notify',
+                'data': {
+                    'type': 'note_analysis',
+                    'note_id': note.pk,
+                    'analysis_status': note.analysis_status,
+                    'sentiment_score': note.sentiment_score,
+                    'stress_index': note.stress_index,
+                    'ai_feedback': note.ai_feedback,
+                    'new_achievements': new_achievements or [],
+                },
+            },
+        )
+    except Exception as e:
+        logger.debug('Channel layer push failed: %s', e)
@@ -1,11 +1,12 @@
 import math
-from datetime import timedelta
+from datetime import date, timedelta
 
 import numpy as np
-import pandas as pd
-from django.db.models import Avg
+from django.core.cache import cache
+from django.db.models import Avg, Count
 from django.utils import timezone
-from scipy import stats
+
+from .analytics_kernels import binned_counts, pearsonr
 
 
 def _sanitize(obj):
@@ -24,38 +25,45 @@ def _sanitize(obj):
     return obj
 
 
-def get_mood_trends(queryset, period='week', lookback_days=30):
-    """Calculate mood trends over time. Returns Recharts-compatible LineChart data."""
-    since = timezone.now() - timedelta(days=lookback_days)
-    notes = queryset.filter(
-        created_at__gte=since,
-        sentiment_score__isnull=False,
-    ).values('created_at', 'sentiment_score', 'stress_index')
-
-    if not notes:
-        return []
+def invalidate_user_cache(user_id, dates=()):
+    """Drop cached analytics payloads for a user after notes change.
 
-    df = pd.DataFrame(list(notes))
-    df['date'] = pd.to_datetime(df['created_at']).dt.tz_localize(None)
-
-    if period == 'week':
-        iso = df['date'].dt.isocalendar()
-        df['period'] = iso.year.astype(str) + '-W' + iso.week.astype(str).str.zfill(2)
-        df['sort_key'] = df['period']
-    else:  # month
-        df['period'] = df['date'].dt.strftime('%Y-%m')
-        df['sort_key'] = df['date'].dt.to_period('M').astype(str)
+    ``dates`` are the changed notes' ``local_date`` values; the calendar pages
+    of their months are dropped too (CalendarView keys by the user's local month).
+    """
+    cache.delete_many([
+        f'analytics_{user_id}_week_30',
+        f'analytics_{user_id}_month_30',
+        f'analytics_{user_id}_week_7',
+        *{f'calendar_{user_id}_{day.year}_{day.month}' for day in dates if day is not None},
+    ])
 
-    grouped = df.groupby('period').agg(
-        avg_sentiment=('sentiment_score', 'mean'),
-        avg_stress=('stress_index', 'mean'),
-        count=('sentiment_score', 'count'),
-    ).reset_index()
 
-    grouped['avg_sentiment'] = grouped['avg_sentiment'].round(2)
-    grouped['avg_stress'] = grouped['avg_stress'].round(1)
+def get_mood_trends(user, period='week', lookback_days=30):
+    """Calculate mood trends over time from the daily rollups. Returns Recharts-compatible LineChart data."""
+    from api.services.rollups import daily_rows, summarize
 
-    return _sanitize(grouped.rename(columns={'period': 'name'}).to_dict(orient='records'))
+    buckets = {}
+    for row in daily_rows(user, start=user.localdate() - timedelta(days=lookback_days)):
+        if not row.sentiment_n:
+            continue
+        if period == 'week':
+            iso_year, iso_week, _ = row.date.isocalendar()
+            name = f'{iso_year}-W{iso_week:02d}'
+        else:  # month
+            name = row.date.strftime('%Y-%m')
+        buckets.setdefault(name, []).append(row)
+
+    trends = []
+    for name in sorted(buckets):
+        totals = summarize(buckets[name])
+        trends.append({
+            'name': name,
+            'avg_sentiment': round(totals['avg_sentiment'], 2),
+            'avg_stress': round(totals['avg_stress'], 1) if totals['avg_stress'] is not None else None,
+            'count': totals['scored_count'],
+        })
+    return trends
 
 
 def get_mood_weather_correlation(queryset, lookback_days=90):
@@ -82,95 +90,65 @@ def get_mood_weather_correlation(queryset, lookback_days=90):
     if len(pairs) < 3:
         return {'correlation': None, 'p_value': None, 'scatter_data': pairs, 'sample_size': len(pairs)}
 
-    df = pd.DataFrame(pairs)
+    sentiments = [pair['sentiment'] for pair in pairs]
+    temperatures = [pair['temperature'] for pair in pairs]
     try:
-        r, p = stats.pearsonr(df['sentiment'], df['temperature'])
+        r, p = pearsonr(sentiments, temperatures)
     except Exception:
         return {'correlation': None, 'p_value': None, 'scatter_data': pairs, 'sample_size': len(pairs)}
 
     # Heatmap buckets (temp ranges × sentiment ranges)
-    temp_bins = pd.cut(df['temperature'], bins=5, labels=False)
-    sent_bins = pd.cut(df['sentiment'], bins=5, labels=False)
-    heatmap = df.assign(temp_bin=temp_bins, sent_bin=sent_bins)\
-        .groupby(['temp_bin', 'sent_bin']).size().reset_index(name='count')
+    heatmap = [
+        {'temp_bin': temp_bin, 'sent_bin': sent_bin, 'count': count}
+        for temp_bin, sent_bin, count in binned_counts(temperatures, sentiments, bins=5)
+    ]
 
     return _sanitize({
         'correlation': round(r, 3),
         'p_value': round(p, 4),
         'scatter_data': pairs,
-        'heatmap': heatmap.to_dict(orient='records'),
+        'heatmap': heatmap,
         'sample_size': len(pairs),
     })
 
 
-def get_calendar_data(queryset, year, month):
-    """Return per-day average sentiment and note count for a given month."""
-    notes = queryset.filter(
-        created_at__year=year,
-        created_at__month=month,
-        sentiment_score__isnull=False,
-    ).values('created_at', 'sentiment_score')
-
-    if not notes:
-        return []
-
-    df = pd.DataFrame(list(notes))
-    df['date'] = pd.to_datetime(df['created_at']).dt.date
-
-    grouped = df.groupby('date').agg(
-        avg_sentiment=('sentiment_score', 'mean'),
-        count=('sentiment_score', 'count'),
-    ).reset_index()
+def get_calendar_data(user, year, month):
+    """Return per-day average sentiment and note count for a given month (one rollup row per day)."""
+    from api.services.rollups import daily_rows
 
-    grouped['avg_sentiment'] = grouped['avg_sentiment'].round(2)
-    grouped['date'] = grouped['date'].astype(str)
-
-    return _sanitize(grouped.to_dict(orient='records'))
+    next_month = date(year + month // 12, month % 12 + 1, 1)
+    rows = daily_rows(user, start=date(year, month, 1), end=next_month - timedelta(days=1))
+    return [
+        {'date': str(row.date), 'avg_sentiment': round(row.avg_sentiment, 2), 'count': row.sentiment_n}
+        for row in rows if row.sentiment_n
+    ]
 
 
 def get_frequent_tags(queryset, lookback_days=90, top_n=10):
-    """Aggregate tag frequency from metadata.tags. Returns Recharts BarChart data."""
+    """Top tags by note count (one GROUP BY over NoteTag). Returns Recharts BarChart data."""
+    from api.models import NoteTag
     since = timezone.now() - timedelta(days=lookback_days)
-    notes = queryset.filter(created_at__gte=since).values('metadata')
-
-    tag_counts = {}
-    for note in notes:
-        meta = note.get('metadata') or {}
-        tags = meta.get('tags', [])
-        if isinstance(tags, list):
-            for tag in tags:
-                tag_counts[tag] = tag_counts.get(tag, 0) + 1
-
-    sorted_tags = sorted(tag_counts.items(), key=lambda x: x[1], reverse=True)[:top_n]
-    return [{'name': tag, 'count': count} for tag, count in sorted_tags]
+    rows = (
+        NoteTag.objects.filter(note__in=queryset.filter(created_at__gte=since).values('pk'))
+        .values('tag').annotate(count=Count('id')).order_by('-count', 'tag')[:top_n]
+    )
+    return [{'name': row['tag'], 'count': row['count']} for row in rows]
 
 
 def get_stress_by_tag(queryset, lookback_days=90):
     """Average stress index per tag for RadarChart. Returns [{tag, avg_stress, count}]."""
+    from api.models import NoteTag
     since = timezone.now() - timedelta(days=lookback_days)
-    notes = queryset.filter(
-        created_at__gte=since,
-        stress_index__isnull=False,
-    ).values('stress_index', 'metadata')
-
-    tag_stress = {}  # tag -> [stress_values]
-    for note in notes:
-        meta = note.get('metadata') or {}
-        tags = meta.get('tags', [])
-        if isinstance(tags, list):
-            for tag in tags:
-                tag_stress.setdefault(tag, []).append(note['stress_index'])
-
-    result = []
-    for tag, values in tag_stress.items():
-        result.append({
-            'tag': tag,
-            'avg_stress': round(sum(values) / len(values), 1),
-            'count': len(values),
-        })
-
-    result.sort(key=lambda x: x['count'], reverse=True)
-    return result[:10]
+    notes = queryset.filter(created_at__gte=since, stress_index__isnull=False).values('pk')
+    rows = (
+        NoteTag.objects.filter(note__in=notes)
+        .values('tag').annotate(avg_stress=Avg('note__stress_index'), count=Count('id'))
+        .order_by('-count', 'tag')[:10]
+    )
+    return [
+        {'tag': row['tag'], 'avg_stress': round(row['avg_stress'], 1), 'count': row['count']}
+        for row in rows
+    ]
 
 
 def get_activity_mood_correlation(queryset, lookback_days=90):
@@ -216,16 +194,22 @@ def get_sleep_mood_correlation(queryset, lookback_days=90):
 
     # Primary source: DailySleep records joined with daily avg sentiment
     if user_obj:
-        sleep_records = DailySleep.objects.filter(
+        sleep_records = list(DailySleep.objects.filter(
             user=user_obj, date__gte=since.date(),
-        ).values('date', 'sleep_hours', 'sleep_quality')
+        ).values('date', 'sleep_hours', 'sleep_quality'))
 
-        for rec in sleep_records:
-            day_notes = queryset.filter(
-                created_at__date=rec['date'],
+        # One GROUP BY over the indexed local_date instead of a query per night
+        day_avgs = dict(
+            queryset.filter(
+                local_date__in=[rec['date'] for rec in sleep_records],
                 sentiment_score__isnull=False,
             )
-            avg = day_notes.aggregate(avg=Avg('sentiment_score'))['avg']
+            .values('local_date')
+            .annotate(avg=Avg('sentiment_score'))
+            .values_list('local_date', 'avg')
+        ) if sleep_records else {}
+        for rec in sleep_records:
+            avg = day_avgs.get(rec['date'])
             if avg is not None:
                 pairs.append({
                     'sentiment': round(avg, 3),
@@ -240,11 +224,10 @@ def get_sleep_mood_correlation(queryset, lookback_days=90):
     notes = queryset.filter(
         created_at__gte=since,
         sentiment_score__isnull=False,
-    ).values('sentiment_score', 'metadata', 'created_at')
+    ).values('sentiment_score', 'metadata', 'local_date')
 
     for note in notes:
-        note_date = note['created_at'].date() if hasattr(note['created_at'], 'date') else note['created_at']
-        if note_date in seen_dates:
+        if note['local_date'] in seen_dates:
             continue
         meta = note.get('metadata') or {}
         sleep_hours = meta.get('sleep_hours')
@@ -261,19 +244,21 @@ def get_sleep_mood_correlation(queryset, lookback_days=90):
     if len(pairs) < 3:
         return {'hours_correlation': None, 'scatter_data': pairs, 'sample_size': len(pairs)}
 
-    df = pd.DataFrame(pairs)
     result = {'scatter_data': pairs, 'sample_size': len(pairs)}
     try:
-        r, p = stats.pearsonr(df['sentiment'], df['sleep_hours'])
+        r, p = pearsonr([pair['sentiment'] for pair in pairs], [pair['sleep_hours'] for pair in pairs])
         result['hours_correlation'] = round(r, 3)
         result['hours_p_value'] = round(p, 4)
     except Exception:
         result['hours_correlation'] = None
 
-    quality_pairs = df.dropna(subset=['sleep_quality'])
+    quality_pairs = [pair for pair in pairs if pair['sleep_quality'] is not None]
     if len(quality_pairs) >= 3:
         try:
-            r, p = stats.pearsonr(quality_pairs['sentiment'], quality_pairs['sleep_quality'])
+            r, p = pearsonr(
+                [pair['sentiment'] for pair in quality_pairs],
+                [pair['sleep_quality'] for pair in quality_pairs],
+            )
             result['quality_correlation'] = round(r, 3)
             result['quality_p_value'] = round(p, 4)
         except Exception:
@@ -281,8 +266,11 @@ def get_sleep_mood_correlation(queryset, lookback_days=90):
     return _sanitize(result)
 
 
-def get_gratitude_stats(queryset):
-    """Count gratitude notes and calculate consecutive gratitude days streak."""
+def get_gratitude_stats(queryset, today=None):
+    """Count gratitude notes and calculate consecutive gratitude days streak.
+
+    ``today`` is the owner's local date (default: today in TIME_ZONE).
+    """
     gratitude_notes = queryset.filter(metadata__type='gratitude')
     gratitude_count = gratitude_notes.count()
 
@@ -290,12 +278,12 @@ def get_gratitude_stats(queryset):
     gratitude_streak = 0
     if gratitude_count > 0:
         dates = list(
-            gratitude_notes.values_list('created_at__date', flat=True)
+            gratitude_notes.values_list('local_date', flat=True)
             .distinct()
-            .order_by('-created_at__date')[:366]
+            .order_by('-local_date')[:366]
         )
         if dates:
-            today = timezone.localdate()
+            today = today or timezone.localdate()
             streak = 0
             expected = today
             for d in dates:
@@ -315,18 +303,9 @@ def get_gratitude_stats(queryset):
     }
 
 
-def get_year_pixels(queryset, year):
+def get_year_pixels(user, year):
     """Per-day average sentiment for the entire year. Returns {date_str: avg_sentiment}."""
-    notes = queryset.filter(
-        created_at__year=year,
-        sentiment_score__isnull=False,
-    ).values('created_at', 'sentiment_score')
-
-    if not notes:
-        return {}
-
-    df = pd.DataFrame(list(notes))
-    df['date'] = pd.to_datetime(df['created_at']).dt.date
+    from api.services.rollups import daily_rows
 
-    grouped = df.groupby('date')['sentiment_score'].mean().round(2)
-    return _sanitize({str(date): float(val) for date, val in grouped.items()})
+    rows = daily_rows(user, start=date(year, 1, 1), end=date(year, 12, 31))
+    return {str(row.date): round(row.avg_sentiment, 2) for row in rows if row.sentiment_n}
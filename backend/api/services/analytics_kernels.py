@@ -0,0 +1,123 @@
+"""Small-input statistics kernels for the analytics endpoints.
+
+Analytics inputs are usually a few dozen rows, where building a pandas
+DataFrame or calling into scipy costs far more than the arithmetic (and
+importing them adds tens of MB to every worker). These NumPy/stdlib kernels
+return the same values as ``scipy.stats.pearsonr`` and ``pd.cut(...,
+labels=False)``; pandas/scipy are imported lazily and only used for inputs of
+at least ``ANALYTICS_SCIPY_MIN_ROWS`` rows.
+"""
+import math
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+
+
+def _use_scipy(n: int) -> bool:
+    threshold = settings.ANALYTICS_SCIPY_MIN_ROWS
+    return bool(threshold) and n >= threshold
+
+
+def _betacf(a: float, b: float, x: float) -> float:
+    """Continued fraction for the regularized incomplete beta function (modified Lentz)."""
+    tiny = 1e-300
+    qab, qap, qam = a + b, a + 1.0, a - 1.0
+    c, d = 1.0, 1.0 - qab * x / qap
+    d = 1.0 / (d if abs(d) > tiny else tiny)
+    h = d
+    for m in range(1, 301):
+        m2 = 2 * m
+        aa = m * (b - m) * x / ((qam + m2) * (a + m2))
+        d = 1.0 + aa * d
+        d = 1.0 / (d if abs(d) > tiny else tiny)
+        c = 1.0 + aa / c
+        c = c if abs(c) > tiny else tiny
+        h *= d * c
+        aa = -(a + m) * (qab + m) * x / ((a + m2) * (qap + m2))
+        d = 1.0 + aa * d
+        d = 1.0 / (d if abs(d) > tiny else tiny)
+        c = 1.0 + aa / c
+        c = c if abs(c) > tiny else tiny
+        delta = d * c
+        h *= delta
+        if abs(delta - 1.0) < 1e-15:
+            break
+    return h
+
+
+def betainc(a: float, b: float, x: float) -> float:
+    """Regularized incomplete beta function I_x(a, b)."""
+    if x <= 0.0:
+        return 0.0
+    if x >= 1.0:
+        return 1.0
+    front = math.exp(
+        math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) + a * math.log(x) + b * math.log1p(-x)
+    )
+    if x < (a + 1.0) / (a + b + 2.0):
+        return front * _betacf(a, b, x) / a
+    return 1.0 - front * _betacf(b, a, 1.0 - x) / b
+
+
+def pearson_p_value(r: float, n: int) -> float:
+    """Two-sided p-value of Pearson's r over n samples (t-test with n - 2 degrees of freedom)."""
+    if math.isnan(r):
+        return math.nan
+    if abs(r) >= 1.0:
+        return 0.0
+    df = n - 2
+    return betainc(df / 2.0, 0.5, 1.0 - r * r)
+
+
+def pearsonr(x, y) -> tuple[float, float]:
+    """Pearson correlation and two-sided p-value, as ``scipy.stats.pearsonr`` returns them.
+
+    Constant input gives ``(nan, nan)``; fewer than two samples raises ValueError.
+    """
+    n = len(x)
+    if n != len(y):
+        raise ValueError('x and y must have the same length.')
+    if n < 2:
+        raise ValueError('x and y must have length at least 2.')
+    if _use_scipy(n):
+        from scipy import stats
+        result = stats.pearsonr(x, y)
+        return float(result[0]), float(result[1])
+
+    xm = np.asarray(x, dtype=float)
+    ym = np.asarray(y, dtype=float)
+    xm = xm - xm.mean()
+    ym = ym - ym.mean()
+    norm_x, norm_y = np.linalg.norm(xm), np.linalg.norm(ym)
+    if norm_x == 0 or norm_y == 0:
+        return math.nan, math.nan
+    r = float(np.clip(np.dot(xm / norm_x, ym / norm_y), -1.0, 1.0))
+    if n == 2:
+        return r, 1.0
+    return r, pearson_p_value(r, n)
+
+
+def cut_codes(values, bins: int = 5) -> list[int]:
+    """Equal-width bin index of each value, as ``pd.cut(values, bins, labels=False)``."""
+    if _use_scipy(len(values)):
+        import pandas as pd
+        return [int(code) for code in pd.cut(pd.Series(values, dtype=float), bins=bins, labels=False)]
+
+    arr = np.asarray(values, dtype=float)
+    lo, hi = float(arr.min()), float(arr.max())
+    if lo == hi:
+        lo -= 0.001 * abs(lo) if lo != 0 else 0.001
+        hi += 0.001 * abs(hi) if hi != 0 else 0.001
+        edges = np.linspace(lo, hi, bins + 1, endpoint=True)
+    else:
+        edges = np.linspace(lo, hi, bins + 1, endpoint=True)
+        edges[0] -= (hi - lo) * 0.001
+    # Right-closed intervals (edges[i-1], edges[i]]
+    return [int(code) for code in np.searchsorted(edges, arr, side='left') - 1]
+
+
+def binned_counts(x, y, bins: int = 5) -> list[tuple[int, int, int]]:
+    """``(x_bin, y_bin, count)`` per non-empty cell, sorted by cell (a 2-D ``groupby(...).size()``)."""
+    cells = Counter(zip(cut_codes(x, bins), cut_codes(y, bins)))
+    return [(bx, by, count) for (bx, by), count in sorted(cells.items())]
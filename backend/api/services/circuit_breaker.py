@@ -0,0 +1,181 @@
+"""Circuit breakers for LLM calls, one per (model, use case).
+
+Every OpenAI call runs inside ``llm_guard(use_case)``. A breaker counts a call
+as failed when it raises or takes longer than ``slow_call_seconds``. When the
+failure rate over the rolling window reaches the threshold, the breaker opens
+and ``llm_guard`` raises ``CircuitOpenError`` immediately, so callers drop to
+their local fallback instead of each waiting out a timeout. After
+``open_seconds`` one probe call is let through (half-open); its outcome closes
+or re-opens the breaker.
+
+State is process-local. With ``LLM_BREAKER['shared']`` an open breaker is also
+recorded in the Django cache, so other workers skip the API until it expires.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+_registry_lock = threading.Lock()
+_breakers: dict = {}
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling the LLM while its breaker is open."""
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, config: dict):
+        self.name = name
+        self.failure_rate = config['failure_rate']
+        self.min_calls = config['min_calls']
+        self.window_seconds = config['window_seconds']
+        self.slow_call_seconds = config['slow_call_seconds']
+        self.open_seconds = config['open_seconds']
+        self.shared = config['shared']
+        self._lock = threading.Lock()
+        self._calls = deque()  # (finished_at, failed)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probe_started = None
+        self.trips = 0
+        self.short_circuited = 0
+
+    @property
+    def _cache_key(self) -> str:
+        return f'llm_breaker_open_{self.name}'
+
+    def _open(self, now: float, reason: str):
+        self._state = OPEN
+        self._opened_at = now
+        self._probe_started = None
+        self._calls.clear()
+        self.trips += 1
+        logger.warning('LLM circuit %s opened (%s)', self.name, reason)
+        if self.shared:
+            from django.core.cache import cache
+            cache.set(self._cache_key, True, self.open_seconds)
+
+    def _close(self):
+        self._state = CLOSED
+        self._probe_started = None
+        self._calls.clear()
+        logger.info('LLM circuit %s closed', self.name)
+        if self.shared:
+            from django.core.cache import cache
+            cache.delete(self._cache_key)
+
+    def allow(self) -> bool:
+        """Whether a call may go out now. In half-open state only one probe at a time."""
+        now = time.monotonic()
+        with self._lock:
+            if self._state == CLOSED:
+                if self.shared:
+                    from django.core.cache import cache
+                    if cache.get(self._cache_key):
+                        self._state = OPEN
+                        self._opened_at = now
+                        self.short_circuited += 1
+                        return False
+                return True
+            if self._state == OPEN:
+                if now - self._opened_at < self.open_seconds:
+                    self.short_circuited += 1
+                    return False
+                self._state = HALF_OPEN
+            # Half-open: a probe that never reported back is abandoned after open_seconds
+            if self._probe_started is not None and now - self._probe_started < self.open_seconds:
+                self.short_circuited += 1
+                return False
+            self._probe_started = now
+            return True
+
+    def record(self, ok: bool, elapsed: float):
+        now = time.monotonic()
+        failed = not ok or elapsed > self.slow_call_seconds
+        with self._lock:
+            if self._state == HALF_OPEN:
+                if failed:
+                    self._open(now, 'probe failed')
+                else:
+                    self._close()
+                return
+            if self._state == OPEN:
+                return
+            self._calls.append((now, failed))
+            while self._calls and now - self._calls[0][0] > self.window_seconds:
+                self._calls.popleft()
+            if len(self._calls) >= self.min_calls:
+                failures = sum(1 for _, f in self._calls if f)
+                if failures / len(self._calls) >= self.failure_rate:
+                    self._open(now, f'{failures}/{len(self._calls)} failed or slow')
+
+    @contextmanager
+    def guard(self):
+        if not self.allow():
+            raise CircuitOpenError(f'LLM circuit {self.name} is open')
+        started = time.monotonic()
+        try:
+            yield
+        except Exception:
+            self.record(False, time.monotonic() - started)
+            raise
+        self.record(True, time.monotonic() - started)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            failures = sum(1 for _, f in self._calls if f)
+            return {
+                'name': self.name,
+                'state': self._state,
+                'window_calls': len(self._calls),
+                'window_failures': failures,
+                'trips': self.trips,
+                'short_circuited': self.short_circuited,
+            }
+
+
+def get_breaker(use_case: str, model: str | None = None) -> CircuitBreaker:
+    name = f'{model or settings.OPENAI_MODEL}:{use_case}'
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _registry_lock:
+            breaker = _breakers.get(name)
+            if breaker is None:
+                breaker = CircuitBreaker(name, settings.LLM_BREAKER)
+                _breakers[name] = breaker
+    return breaker
+
+
+def llm_guard(use_case: str, model: str | None = None):
+    """Context manager around one LLM call; raises ``CircuitOpenError`` while open."""
+    return get_breaker(use_case, model).guard()
+
+
+def llm_available(use_case: str, model: str | None = None) -> bool:
+    """Cheap check for callers that want to skip building a request entirely."""
+    breaker = get_breaker(use_case, model)
+    if breaker.shared:
+        from django.core.cache import cache
+        if cache.get(breaker._cache_key):
+            return False
+    return breaker._state != OPEN or time.monotonic() - breaker._opened_at >= breaker.open_seconds
+
+
+def breaker_metrics() -> list[dict]:
+    return [b.snapshot() for b in list(_breakers.values())]
+
+
+def reset_breakers():
+    """Drop all breaker state (tests, or after changing LLM_BREAKER at runtime)."""
+    with _registry_lock:
+        _breakers.clear()
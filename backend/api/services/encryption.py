@@ -1,8 +1,13 @@
+import base64
 import logging
 import threading
+import time
+import zlib
+from collections import OrderedDict
 
 from cryptography.fernet import Fernet, InvalidToken, MultiFernet
 from django.conf import settings
+from django.utils.crypto import salted_hmac
 
 logger = logging.getLogger(__name__)
 
@@ -14,8 +19,22 @@ class EncryptionService:
     Fernet keys. The first key is used for encryption; all keys are tried
     for decryption. This allows rotating keys without losing access to
     old data.
+
+    Envelope encryption: with ``user_id`` given (and ENVELOPE_ENCRYPTION on),
+    content is encrypted under that user's own Fernet data key, stored on
+    ``CustomUser.wrapped_data_key`` encrypted by the master key. Such tokens
+    carry the ``dk1:`` prefix. Rotating the master key then only rewraps one
+    data key per user, and destroying a data key makes all of that user's
+    ciphertexts unreadable. Unwrapped data keys are kept in a per-process LRU
+    for DATA_KEY_CACHE_TTL seconds.
     """
 
+    ENVELOPE_PREFIX = 'dk1:'
+    # Binary storage format: bytes((BINARY_FORMAT_V1, flags)) + raw Fernet token
+    BINARY_FORMAT_V1 = 1
+    FLAG_ENVELOPE = 0x01
+    FLAG_ZLIB = 0x02
+
     _instance = None
     _lock = threading.Lock()
 
@@ -35,21 +54,212 @@ class EncryptionService:
                         keys = [k.strip() for k in raw.split(',') if k.strip()]
                         fernets = [Fernet(k.encode() if isinstance(k, str) else k) for k in keys]
                         cls._instance._multi = MultiFernet(fernets)
+                        cls._instance._fernets = fernets
                         cls._instance._primary = fernets[0]
+                        cls._instance._data_keys = OrderedDict()  # user_id -> (Fernet, expires_at)
+                        cls._instance._data_key_lock = threading.Lock()
                     except Exception as e:
                         cls._instance = None
                         raise RuntimeError(f'Invalid ENCRYPTION_KEY: {e}')
         return cls._instance
 
-    def encrypt(self, plaintext: str) -> str:
+    def encrypt(self, plaintext: str, user_id: int | None = None) -> str:
+        if user_id is not None and settings.ENVELOPE_ENCRYPTION:
+            data_key = self.data_key(user_id, create=True)
+            return self.ENVELOPE_PREFIX + data_key.encrypt(plaintext.encode('utf-8')).decode('utf-8')
         return self._primary.encrypt(plaintext.encode('utf-8')).decode('utf-8')
 
-    def decrypt(self, ciphertext: str) -> str:
+    def encrypt_binary(self, plaintext: str, user_id: int | None = None) -> bytes:
+        data = plaintext.encode('utf-8')
+        flags = 0
+        if len(data) >= settings.CIPHERTEXT_COMPRESS_MIN_BYTES:
+            packed = zlib.compress(data, 6)
+            if len(packed) < len(data):
+                data, flags = packed, flags | self.FLAG_ZLIB
+        fernet = self._primary
+        if user_id is not None and settings.ENVELOPE_ENCRYPTION:
+            fernet = self.data_key(user_id, create=True)
+            flags |= self.FLAG_ENVELOPE
+        return bytes((self.BINARY_FORMAT_V1, flags)) + base64.urlsafe_b64decode(fernet.encrypt(data))
+
+    def encrypt_for_storage(self, plaintext: str, user_id: int | None = None) -> str | bytes:
+        """Encrypt in the format selected by NOTE_CIPHERTEXT_FORMAT."""
+        if settings.NOTE_CIPHERTEXT_FORMAT == 'binary':
+            return self.encrypt_binary(plaintext, user_id=user_id)
+        return self.encrypt(plaintext, user_id=user_id)
+
+    def decrypt(self, ciphertext: str | bytes, user_id: int | None = None) -> str:
+        data_key = None
+        if self.is_envelope(ciphertext) and user_id is not None:
+            data_key = self.data_key(user_id)
+        return self._decrypt_token(ciphertext, data_key)
+
+    def _decrypt_token(self, ciphertext: str | bytes, data_key: Fernet | None) -> str:
         try:
-            return self._multi.decrypt(ciphertext.encode('utf-8')).decode('utf-8')
-        except InvalidToken:
+            token = self._fernet_token(ciphertext)
+            if self.is_envelope(ciphertext):
+                if data_key is None:
+                    raise InvalidToken
+                data = data_key.decrypt(token)
+            else:
+                data = self._multi.decrypt(token)
+            if isinstance(ciphertext, bytes) and ciphertext[1] & self.FLAG_ZLIB:
+                data = zlib.decompress(data)
+            return data.decode('utf-8')
+        except (InvalidToken, zlib.error):
             logger.error('Failed to decrypt content — invalid token or wrong key')
             return '[Decryption failed]'
 
+    def _fernet_token(self, ciphertext: str | bytes) -> bytes:
+        """The base64 Fernet token inside either storage format."""
+        if isinstance(ciphertext, bytes):
+            if len(ciphertext) < 2 or ciphertext[0] != self.BINARY_FORMAT_V1:
+                raise InvalidToken
+            return base64.urlsafe_b64encode(ciphertext[2:])
+        if ciphertext.startswith(self.ENVELOPE_PREFIX):
+            ciphertext = ciphertext[len(self.ENVELOPE_PREFIX):]
+        return ciphertext.encode('utf-8')
+
+    @classmethod
+    def is_envelope(cls, ciphertext: str | bytes) -> bool:
+        if isinstance(ciphertext, bytes):
+            return len(ciphertext) > 1 and bool(ciphertext[1] & cls.FLAG_ENVELOPE)
+        return ciphertext.startswith(cls.ENVELOPE_PREFIX)
+
+    # --- Per-user data keys ---
+
+    def data_key(self, user_id: int, create: bool = False) -> Fernet | None:
+        """Unwrapped data key of ``user_id`` (LRU-cached), optionally creating it on first use.
+
+        Returns None if the user has no key (never created, or destroyed) or it cannot be unwrapped.
+        """
+        now = time.monotonic()
+        with self._data_key_lock:
+            entry = self._data_keys.get(user_id)
+            if entry is not None and entry[1] > now:
+                self._data_keys.move_to_end(user_id)
+                return entry[0]
+
+        from django.contrib.auth import get_user_model
+        wrapped = (
+            get_user_model().objects.filter(pk=user_id)
+            .values_list('wrapped_data_key', flat=True).first()
+        )
+        if not wrapped:
+            if not create:
+                return None
+            wrapped = self._create_data_key(user_id)
+        try:
+            data_key = Fernet(self._multi.decrypt(wrapped.encode('utf-8')))
+        except InvalidToken:
+            logger.error('Failed to unwrap data key of user %s — wrong master key', user_id)
+            return None
+
+        with self._data_key_lock:
+            self._data_keys[user_id] = (data_key, now + settings.DATA_KEY_CACHE_TTL)
+            self._data_keys.move_to_end(user_id)
+            while len(self._data_keys) > settings.DATA_KEY_CACHE_SIZE:
+                self._data_keys.popitem(last=False)
+        return data_key
+
+    def _create_data_key(self, user_id: int) -> str:
+        from django.contrib.auth import get_user_model
+        User = get_user_model()
+        wrapped = self._primary.encrypt(Fernet.generate_key()).decode('utf-8')
+        # Conditional update: if another request created a key first, use that one
+        if not User.objects.filter(pk=user_id, wrapped_data_key='').update(wrapped_data_key=wrapped):
+            wrapped = User.objects.filter(pk=user_id).values_list('wrapped_data_key', flat=True).first()
+        if not wrapped:
+            raise RuntimeError(f'Cannot create a data key for missing user {user_id}')
+        return wrapped
+
+    def rewrap(self, wrapped_data_key: str) -> str:
+        """Re-encrypt a wrapped data key under the primary master key (the data key is unchanged)."""
+        return self.rotate(wrapped_data_key)
+
+    def destroy_data_key(self, user_id: int):
+        """Crypto-shred: drop the user's data key so every ``dk1:`` ciphertext of theirs is unreadable.
+
+        Other processes may keep the unwrapped key until their cache entry expires
+        (at most DATA_KEY_CACHE_TTL seconds).
+        """
+        from django.contrib.auth import get_user_model
+        get_user_model().objects.filter(pk=user_id).update(wrapped_data_key='')
+        with self._data_key_lock:
+            self._data_keys.pop(user_id, None)
+
+    def clear_data_key_cache(self):
+        with self._data_key_lock:
+            self._data_keys.clear()
+
+    @property
+    def key_count(self) -> int:
+        return len(self._fernets)
+
+    def key_index(self, ciphertext: str | bytes) -> int | None:
+        """Position in ENCRYPTION_KEY of the key that decrypts ``ciphertext`` (None if none does)."""
+        if self.is_envelope(ciphertext):
+            return None
+        try:
+            token = self._fernet_token(ciphertext)
+        except InvalidToken:
+            return None
+        for i, fernet in enumerate(self._fernets):
+            try:
+                fernet.decrypt(token)
+                return i
+            except InvalidToken:
+                continue
+        return None
+
+    def rotate(self, ciphertext: str | bytes) -> str | bytes:
+        """Re-encrypt ``ciphertext`` under the primary key (keeps its format and original timestamp)."""
+        rotated = self._multi.rotate(self._fernet_token(ciphertext))
+        if isinstance(ciphertext, bytes):
+            return ciphertext[:2] + base64.urlsafe_b64decode(rotated)
+        return rotated.decode('utf-8')
+
+    def decrypt_many(
+        self, ciphertexts: list[str | bytes], workers: int | None = None, user_ids: list[int] | None = None,
+    ) -> list[str]:
+        """Decrypt a list of tokens, aligned with the input.
+
+        ``user_ids`` (aligned with ``ciphertexts``) gives the owner of each
+        envelope token. Data keys are unwrapped once per user up front, and
+        duplicate tokens are decrypted once. Lists of at least
+        ``DECRYPT_PARALLEL_THRESHOLD`` unique tokens are spread over a thread
+        pool (OpenSSL releases the GIL while it works).
+        """
+        if user_ids is None:
+            user_ids = [None] * len(ciphertexts)
+        # BinaryField values come back as memoryview on PostgreSQL
+        ciphertexts = [bytes(c) if isinstance(c, memoryview) else c for c in ciphertexts]
+        unique = list(dict.fromkeys((c, u) for c, u in zip(ciphertexts, user_ids) if c))
+        data_keys = {
+            u: self.data_key(u)
+            for u in {u for c, u in unique if u is not None and self.is_envelope(c)}
+        }
+        threshold = settings.DECRYPT_PARALLEL_THRESHOLD
+        if workers is None:
+            workers = settings.DECRYPT_WORKERS if threshold and len(unique) >= threshold else 1
+        if workers > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                plaintexts = list(pool.map(
+                    lambda pair: self._decrypt_token(pair[0], data_keys.get(pair[1])), unique, chunksize=64,
+                ))
+        else:
+            plaintexts = [self._decrypt_token(c, data_keys.get(u)) for c, u in unique]
+        lookup = dict(zip(unique, plaintexts))
+        return [lookup[(c, u)] if c else '' for c, u in zip(ciphertexts, user_ids)]
+
+
+def content_digest(plaintext: str, purpose: str = 'content') -> str:
+    """Keyed HMAC-SHA256 hex digest of plaintext (keyed by SECRET_KEY, salted per purpose).
+
+    Lets callers compare or index note text without storing it or decrypting it.
+    """
+    return salted_hmac(f'heartbox.{purpose}', plaintext, algorithm='sha256').hexdigest()
+
 
 encryption_service = EncryptionService()
@@ -0,0 +1,246 @@
+"""Offline BM25 index over the knowledge base, stored as memory-mapped NumPy arrays.
+
+``build_kb_index`` (run by ``manage.py load_knowledge_base``) tokenises chunks
+with jieba and writes a CSR inverted index with precomputed BM25 weights, the
+chunk texts, and optionally chunk embeddings. ``KnowledgeBaseIndex.open`` maps
+the arrays read-only, so every worker process on a host shares the same pages
+and retrieval needs no network call.
+
+Layout of the index directory:
+  manifest.json         format version, chunk/term counts, BM25 parameters
+  terms.npy             sorted vocabulary (unicode array, searched with searchsorted)
+  term_offsets.npy      int64[V+1] — postings slice per term
+  posting_chunks.npy    int32 chunk index per posting
+  posting_weights.npy   float32 BM25 weight per posting
+  chunk_offsets.npy     int64[N+1] — byte slice per chunk in chunk_text.bin
+  chunk_text.bin        UTF-8 chunk texts, concatenated
+  chunk_sources.json    source filename per chunk
+  embeddings.npy        float32[N, D] L2-normalised (optional, enables hybrid re-ranking)
+  chunk_hashes.json     content hash per chunk (optional, lets a rebuild reuse embeddings)
+"""
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT = 1
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r'\w')
+
+_open_lock = threading.Lock()
+_open_indexes: dict = {}
+
+
+def tokenize(text: str) -> list[str]:
+    """jieba tokens (lowercased), dropping whitespace and punctuation-only tokens."""
+    from .ai_engine import AIEngine
+
+    return [t.lower() for t in AIEngine._segment_text(text) if _TOKEN_RE.search(t)]
+
+
+def index_content_digest(index_dir: str) -> str | None:
+    """The ``content_digest`` recorded when the index was built, if any."""
+    try:
+        with open(os.path.join(index_dir, 'manifest.json'), encoding='utf-8') as f:
+            return json.load(f).get('content_digest')
+    except (OSError, ValueError):
+        return None
+
+
+def stored_embeddings(index_dir: str) -> dict:
+    """Embedding rows of a built index keyed by chunk hash (empty if it has none or no hashes)."""
+    try:
+        with open(os.path.join(index_dir, 'chunk_hashes.json'), encoding='utf-8') as f:
+            hashes = json.load(f)
+        vectors = np.load(os.path.join(index_dir, 'embeddings.npy'))
+    except (OSError, ValueError):
+        return {}
+    if len(hashes) != len(vectors):
+        return {}
+    return dict(zip(hashes, vectors))
+
+
+def build_kb_index(chunks: list[tuple[str, str]], index_dir: str, embeddings=None,
+                   content_digest: str = '', chunk_hashes: list[str] | None = None) -> int:
+    """Write the index for ``chunks`` (text, source) into ``index_dir``; returns the term count.
+
+    ``embeddings`` is an optional (N, D) array aligned with ``chunks``.
+    ``content_digest`` is stored in the manifest so callers can skip rebuilding
+    an unchanged index; ``chunk_hashes`` (aligned with ``chunks``) lets a later
+    build reuse these embeddings via ``stored_embeddings``. The directory is
+    replaced atomically so running workers never see a half-built index.
+    """
+    token_lists = [tokenize(text) for text, _ in chunks]
+    lengths = np.array([len(tokens) for tokens in token_lists], dtype=np.float32)
+    avg_len = float(lengths.mean()) if len(lengths) and lengths.sum() else 1.0
+
+    postings: dict[str, dict[int, int]] = {}
+    for chunk_idx, tokens in enumerate(token_lists):
+        for token in tokens:
+            tf = postings.setdefault(token, {})
+            tf[chunk_idx] = tf.get(chunk_idx, 0) + 1
+
+    terms = sorted(postings)
+    n_chunks = len(chunks)
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    posting_chunks, posting_weights = [], []
+    for i, term in enumerate(terms):
+        tf = postings[term]
+        df = len(tf)
+        idf = np.log(1 + (n_chunks - df + 0.5) / (df + 0.5))
+        ids = np.fromiter(tf.keys(), dtype=np.int32, count=df)
+        freqs = np.fromiter(tf.values(), dtype=np.float32, count=df)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[ids] / avg_len)
+        posting_chunks.append(ids)
+        posting_weights.append((idf * freqs * (BM25_K1 + 1) / (freqs + norm)).astype(np.float32))
+        offsets[i + 1] = offsets[i] + df
+
+    encoded = [text.encode('utf-8') for text, _ in chunks]
+    chunk_offsets = np.zeros(n_chunks + 1, dtype=np.int64)
+    chunk_offsets[1:] = np.cumsum([len(b) for b in encoded])
+
+    parent = os.path.dirname(os.path.abspath(index_dir))
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent, prefix='.kb_index-')
+    np.save(os.path.join(tmp_dir, 'terms.npy'), np.array(terms or [''], dtype=str)[:len(terms)])
+    np.save(os.path.join(tmp_dir, 'term_offsets.npy'), offsets)
+    np.save(
+        os.path.join(tmp_dir, 'posting_chunks.npy'),
+        np.concatenate(posting_chunks) if posting_chunks else np.zeros(0, dtype=np.int32),
+    )
+    np.save(
+        os.path.join(tmp_dir, 'posting_weights.npy'),
+        np.concatenate(posting_weights) if posting_weights else np.zeros(0, dtype=np.float32),
+    )
+    np.save(os.path.join(tmp_dir, 'chunk_offsets.npy'), chunk_offsets)
+    with open(os.path.join(tmp_dir, 'chunk_text.bin'), 'wb') as f:
+        f.write(b''.join(encoded))
+    with open(os.path.join(tmp_dir, 'chunk_sources.json'), 'w', encoding='utf-8') as f:
+        json.dump([source for _, source in chunks], f, ensure_ascii=False)
+    if chunk_hashes is not None:
+        with open(os.path.join(tmp_dir, 'chunk_hashes.json'), 'w', encoding='utf-8') as f:
+            json.dump(list(chunk_hashes), f)
+    if embeddings is not None:
+        vectors = np.array(embeddings, dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        np.save(os.path.join(tmp_dir, 'embeddings.npy'), vectors)
+    with open(os.path.join(tmp_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump({
+            'format': INDEX_FORMAT,
+            'chunks': n_chunks,
+            'terms': len(terms),
+            'k1': BM25_K1,
+            'b': BM25_B,
+            'embeddings': embeddings is not None,
+            'content_digest': content_digest,
+        }, f)
+
+    old_dir = None
+    if os.path.exists(index_dir):
+        old_dir = tempfile.mkdtemp(dir=parent, prefix='.kb_index-old-')
+        os.rmdir(old_dir)
+        os.replace(index_dir, old_dir)
+    os.replace(tmp_dir, index_dir)
+    if old_dir:
+        shutil.rmtree(old_dir, ignore_errors=True)
+    return len(terms)
+
+
+class KnowledgeBaseIndex:
+    """Read-only view over a built index directory. All arrays are memory-mapped."""
+
+    def __init__(self, index_dir: str):
+        with open(os.path.join(index_dir, 'manifest.json'), encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('format') != INDEX_FORMAT:
+            raise ValueError(f'Unsupported knowledge-base index format: {manifest.get("format")}')
+
+        def load(name):
+            return np.load(os.path.join(index_dir, name), mmap_mode='r')
+
+        self.size = manifest['chunks']
+        self._terms = load('terms.npy')
+        self._term_offsets = load('term_offsets.npy')
+        self._posting_chunks = load('posting_chunks.npy')
+        self._posting_weights = load('posting_weights.npy')
+        self._chunk_offsets = load('chunk_offsets.npy')
+        text_path = os.path.join(index_dir, 'chunk_text.bin')
+        self._chunk_text = (
+            np.memmap(text_path, dtype=np.uint8, mode='r') if os.path.getsize(text_path) else b''
+        )
+        with open(os.path.join(index_dir, 'chunk_sources.json'), encoding='utf-8') as f:
+            self._sources = json.load(f)
+        self.embeddings = load('embeddings.npy') if manifest.get('embeddings') else None
+
+    @classmethod
+    def open(cls, index_dir: str) -> 'KnowledgeBaseIndex':
+        """Shared instance per directory, re-opened when the manifest changes.
+
+        A rebuild swaps in a new directory, so the manifest's inode and mtime
+        both identify the build; checking them costs one ``stat`` per call.
+        """
+        st = os.stat(os.path.join(index_dir, 'manifest.json'))
+        version = (st.st_ino, st.st_mtime_ns)
+        with _open_lock:
+            entry = _open_indexes.get(index_dir)
+            if entry is None or entry[0] != version:
+                entry = (version, cls(index_dir))
+                _open_indexes[index_dir] = entry
+            return entry[1]
+
+    def _term_id(self, term: str) -> int:
+        pos = int(np.searchsorted(self._terms, term))
+        if pos < len(self._terms) and self._terms[pos] == term:
+            return pos
+        return -1
+
+    def bm25_scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self._term_id(term)
+            if term_id < 0:
+                continue
+            start, end = self._term_offsets[term_id], self._term_offsets[term_id + 1]
+            np.add.at(scores, self._posting_chunks[start:end], self._posting_weights[start:end])
+        return scores
+
+    def chunk(self, idx: int) -> dict:
+        start, end = self._chunk_offsets[idx], self._chunk_offsets[idx + 1]
+        return {
+            'id': f'kb-{idx}',
+            'text': bytes(self._chunk_text[start:end]).decode('utf-8'),
+            'source': self._sources[idx],
+        }
+
+    def search(self, query: str, k: int = 3, query_embedding=None, hybrid_weight: float = 0.5) -> list[dict]:
+        """Top-``k`` chunks by BM25, optionally re-ranked with cosine similarity.
+
+        With ``query_embedding`` and stored embeddings, the best ``4 * k`` BM25
+        candidates are re-scored as ``(1 - w) * bm25_norm + w * cosine``.
+        """
+        if self.size == 0:
+            return []
+        scores = self.bm25_scores(query)
+        pool = min(self.size, k * 4 if query_embedding is not None else k)
+        candidates = np.argpartition(-scores, pool - 1)[:pool]
+        candidates = candidates[scores[candidates] > 0]
+        ranked = scores[candidates]
+
+        if query_embedding is not None and self.embeddings is not None and len(candidates):
+            q = np.array(query_embedding, dtype=np.float32)
+            q /= max(float(np.linalg.norm(q)), 1e-12)
+            cosine = np.asarray(self.embeddings[candidates]) @ q
+            top = float(ranked.max()) or 1.0
+            ranked = (1 - hybrid_weight) * (ranked / top) + hybrid_weight * cosine
+
+        order = np.argsort(-ranked, kind='stable')[:k]
+        return [{**self.chunk(int(candidates[i])), 'score': float(ranked[i])} for i in order]
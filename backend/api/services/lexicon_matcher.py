@@ -0,0 +1,102 @@
+"""Aho-Corasick multi-pattern matcher for the local sentiment lexicons.
+
+Scans text once per character instead of segmenting it with jieba first.
+Overlapping hits are resolved leftmost-longest, so a compound term such as
+'太好了' counts once rather than also matching '好'. Hits ignore jieba's word
+boundaries, so counts can differ from looking up jieba tokens in the lexicons.
+"""
+from collections import deque
+
+import numpy as np
+
+
+class LexiconMatcher:
+    """Compiled automaton over several named lexicons.
+
+    ``count`` returns one hit count per lexicon, in the order the lexicons
+    were given. A term present in several lexicons counts towards each.
+    """
+
+    def __init__(self, lexicons: dict[str, set[str]]):
+        self.names = list(lexicons)
+        # Trie: per-state transition dict; terminal states carry (length, category mask)
+        self._goto: list[dict[str, int]] = [{}]
+        self._term: list[tuple[int, int] | None] = [None]
+        for bit, name in enumerate(self.names):
+            for word in lexicons[name]:
+                if word:
+                    self._insert(word.lower(), 1 << bit)
+        self._fail = [0] * len(self._goto)
+        # Every (length, mask) ending at a state, following fail links — precomputed
+        self._out: list[tuple[tuple[int, int], ...]] = [()] * len(self._goto)
+        self._build_links()
+
+    def _insert(self, word: str, mask: int):
+        state = 0
+        for ch in word:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._term.append(None)
+            state = nxt
+        prev = self._term[state]
+        self._term[state] = (len(word), mask | (prev[1] if prev else 0))
+
+    def _build_links(self):
+        queue = deque()
+        for nxt in self._goto[0].values():
+            self._fail[nxt] = 0
+            queue.append(nxt)
+        while queue:
+            state = queue.popleft()
+            term = self._term[state]
+            own = (term,) if term else ()
+            self._out[state] = own + self._out[self._fail[state]]
+            for ch, nxt in self._goto[state].items():
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                queue.append(nxt)
+
+    def count(self, text: str) -> list[int]:
+        """Leftmost-longest, non-overlapping hit counts per lexicon for one text."""
+        goto, fail, out = self._goto, self._fail, self._out
+        longest_at = {}  # start index -> (length, mask) of the longest match starting there
+        state = 0
+        for i, ch in enumerate(text.lower()):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for length, mask in out[state]:
+                start = i - length + 1
+                best = longest_at.get(start)
+                if best is None or length > best[0]:
+                    longest_at[start] = (length, mask)
+
+        counts = [0] * len(self.names)
+        if not longest_at:
+            return counts
+        next_free = 0
+        for start in sorted(longest_at):
+            if start < next_free:
+                continue
+            length, mask = longest_at[start]
+            next_free = start + length
+            bit = 0
+            while mask:
+                if mask & 1:
+                    counts[bit] += 1
+                mask >>= 1
+                bit += 1
+        return counts
+
+    def count_many(self, texts) -> np.ndarray:
+        """Hit-count matrix of shape (len(texts), len(lexicons)); ``count`` is run per text."""
+        counts = np.zeros((len(texts), len(self.names)), dtype=np.int32)
+        for row, text in enumerate(texts):
+            if text:
+                counts[row] = self.count(text)
+        return counts
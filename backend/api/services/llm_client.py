@@ -0,0 +1,127 @@
+"""Process-wide OpenAI clients with connection reuse.
+
+All OpenAI calls go through ``get_openai_client(use_case)`` (or the async
+variant) instead of constructing ``OpenAI(...)`` inline. One httpx pool is
+shared by every use case, so TLS connections stay alive between note saves
+and chat turns. Each use case gets its own timeout and retry policy from
+``settings.OPENAI_CALL_POLICIES``.
+"""
+import asyncio
+import logging
+import threading
+import weakref
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_http_lock = threading.Lock()
+_http_client = None
+_client = None
+_client_key = None
+_use_case_clients: dict = {}
+# AsyncClient connections are bound to the event loop that opened them
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _limits():
+    import httpx
+
+    pool_size = settings.OPENAI_POOL_SIZE
+    return httpx.Limits(
+        max_connections=pool_size,
+        max_keepalive_connections=pool_size,
+        keepalive_expiry=settings.OPENAI_KEEPALIVE_EXPIRY,
+    )
+
+
+def _policy(use_case: str) -> dict:
+    policies = settings.OPENAI_CALL_POLICIES
+    policy = {**policies.get('default', {}), **policies.get(use_case, {})}
+    return {
+        'timeout': policy.get('timeout', 30),
+        'max_retries': policy.get('max_retries', settings.OPENAI_MAX_RETRIES),
+    }
+
+
+def get_http_client():
+    """Shared keep-alive httpx.Client (also handed to LangChain's ChatOpenAI/OpenAIEmbeddings)."""
+    global _http_client
+    if _http_client is None:
+        with _http_lock:
+            if _http_client is None:
+                from openai import DefaultHttpxClient
+                _http_client = DefaultHttpxClient(limits=_limits())
+    return _http_client
+
+
+def get_openai_client(use_case: str = 'default'):
+    """Return the shared OpenAI client configured for ``use_case``, or None without an API key."""
+    global _client, _client_key
+    api_key = settings.OPENAI_API_KEY
+    if not api_key:
+        return None
+
+    with _lock:
+        if _client is None or _client_key != api_key:
+            from openai import OpenAI
+            _client = OpenAI(
+                api_key=api_key,
+                http_client=get_http_client(),
+                max_retries=settings.OPENAI_MAX_RETRIES,
+            )
+            _client_key = api_key
+            _use_case_clients.clear()
+
+        client = _use_case_clients.get(use_case)
+        if client is None:
+            # with_options() copies config but keeps the same underlying http pool
+            client = _client.with_options(**_policy(use_case))
+            _use_case_clients[use_case] = client
+    return client
+
+
+def get_async_openai_client(use_case: str = 'default'):
+    """Async counterpart of ``get_openai_client``. Pooled per running event loop."""
+    api_key = settings.OPENAI_API_KEY
+    if not api_key:
+        return None
+
+    loop = asyncio.get_running_loop()
+    with _lock:
+        entry = _async_clients.get(loop)
+        if entry is None or entry['api_key'] != api_key:
+            from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+            entry = {
+                'api_key': api_key,
+                'client': AsyncOpenAI(
+                    api_key=api_key,
+                    http_client=DefaultAsyncHttpxClient(limits=_limits()),
+                    max_retries=settings.OPENAI_MAX_RETRIES,
+                ),
+                'use_cases': {},
+            }
+            _async_clients[loop] = entry
+
+        client = entry['use_cases'].get(use_case)
+        if client is None:
+            client = entry['client'].with_options(**_policy(use_case))
+            entry['use_cases'][use_case] = client
+    return client
+
+
+def reset_clients():
+    """Drop cached clients (e.g. after changing OpenAI settings at runtime)."""
+    global _http_client, _client, _client_key
+    with _lock, _http_lock:
+        if _http_client is not None:
+            try:
+                _http_client.close()
+            except Exception as e:
+                logger.debug('Closing OpenAI http client failed: %s', e)
+        _http_client = None
+        _client = None
+        _client_key = None
+        _use_case_clients.clear()
+        _async_clients.clear()
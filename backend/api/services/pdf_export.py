@@ -152,17 +152,18 @@ def generate_notes_pdf(queryset, date_from=None, date_to=None, user=None, lang='
     if date_from:
         try:
             dt = datetime.strptime(date_from, '%Y-%m-%d')
-            qs = qs.filter(created_at__date__gte=dt.date())
+            qs = qs.filter(local_date__gte=dt.date())
         except ValueError:
             pass
     if date_to:
         try:
             dt = datetime.strptime(date_to, '%Y-%m-%d')
-            qs = qs.filter(created_at__date__lte=dt.date())
+            qs = qs.filter(local_date__lte=dt.date())
         except ValueError:
             pass
 
     notes = list(qs[:1000])  # Cap at 1000 notes per PDF to prevent memory exhaustion
+    qs.model.prefetch_content(notes)  # one bulk decryption instead of one per note
 
     # --- Title ---
     story.append(Paragraph(labels['title'], styles['CJKTitle']))
@@ -0,0 +1,235 @@
+"""Per-user daily mood rollups.
+
+``MoodDailyRollup`` holds one row per user and local day with the sums of that
+day's live notes, so analytics read at most a year of rollup rows instead of
+every note. Rows are kept exact by applying each note's old/new contribution
+inside the transaction that changes the note (see ``MoodNote.save``/``delete``
+and ``update_notes``); ``rebuild_rollups`` recomputes them from scratch.
+"""
+from collections import Counter, defaultdict
+from typing import NamedTuple
+
+from django.db import transaction
+
+# Note columns a rollup is derived from; saving any of them re-applies the note
+STATE_FIELDS = ('user_id', 'local_date', 'is_deleted', 'sentiment_score', 'stress_index', 'metadata')
+ROLLUP_FIELDS = frozenset(STATE_FIELDS) - {'user_id'}
+
+
+class Contribution(NamedTuple):
+    user_id: int
+    date: object
+    sentiment: float | None
+    stress: int | None
+    tags: tuple
+    activities: tuple
+
+
+def contribution(state) -> Contribution | None:
+    """What one note (as a ``STATE_FIELDS`` dict) adds to its day; None while in the trash."""
+    if state is None or state['is_deleted'] or state['local_date'] is None:
+        return None
+    from api.models import MoodNote
+    meta = state['metadata'] if isinstance(state['metadata'], dict) else {}
+    activities = meta.get('activities')
+    # Stress is averaged over scored notes only, like sentiment
+    scored = state['sentiment_score'] is not None
+    return Contribution(
+        state['user_id'],
+        state['local_date'],
+        state['sentiment_score'],
+        state['stress_index'] if scored else None,
+        tuple(sorted(MoodNote.tags_from_metadata(meta))),
+        tuple(str(a) for a in activities) if isinstance(activities, list) else (),
+    )
+
+
+def note_state(note, base=None, fields=None) -> dict:
+    """A note's ``STATE_FIELDS`` as they will be stored.
+
+    With ``base`` (the locked row) and ``fields`` (``update_fields``), only the
+    saved fields are taken from the instance.
+    """
+    state = dict(base) if base else {}
+    for field in STATE_FIELDS:
+        if base is None or fields is None or field in fields:
+            state[field] = getattr(note, field)
+    return state
+
+
+def locked_states(queryset) -> dict:
+    """Lock the notes in ``queryset`` and return their stored state by id.
+
+    Must run inside the transaction that writes them, so concurrent edits of a
+    note serialize and each change is applied to the rollups exactly once.
+    """
+    return {
+        row.pop('id'): row
+        for row in queryset.select_for_update().values('id', *STATE_FIELDS)
+    }
+
+
+class _Delta:
+    __slots__ = ('count', 'sentiment_sum', 'sentiment_n', 'stress_sum', 'stress_n', 'tags', 'activities')
+
+    def __init__(self):
+        self.count = self.sentiment_n = self.stress_sum = self.stress_n = 0
+        self.sentiment_sum = 0.0
+        self.tags = Counter()
+        self.activities = Counter()
+
+    def add(self, c: Contribution, sign: int):
+        self.count += sign
+        if c.sentiment is not None:
+            self.sentiment_sum += sign * c.sentiment
+            self.sentiment_n += sign
+        if c.stress is not None:
+            self.stress_sum += sign * c.stress
+            self.stress_n += sign
+        for tag in c.tags:
+            self.tags[tag] += sign
+        for act in c.activities:
+            self.activities[act] += sign
+
+    def is_empty(self) -> bool:
+        return not (self.count or self.sentiment_n or self.stress_n or self.sentiment_sum
+                    or self.stress_sum or any(self.tags.values()) or any(self.activities.values()))
+
+
+def _merge_counts(stored, delta) -> dict:
+    merged = Counter(stored or {})
+    merged.update(delta)
+    return {key: n for key, n in merged.items() if n > 0}
+
+
+def apply_changes(changes):
+    """Apply ``(old_state, new_state)`` pairs (either may be None) to the rollup rows."""
+    from api.models import MoodDailyRollup
+
+    deltas = defaultdict(_Delta)
+    for old, new in changes:
+        old_c, new_c = contribution(old), contribution(new)
+        if old_c == new_c:
+            continue
+        if old_c is not None:
+            deltas[old_c.user_id, old_c.date].add(old_c, -1)
+        if new_c is not None:
+            deltas[new_c.user_id, new_c.date].add(new_c, 1)
+
+    # Sorted so concurrent writers lock rollup rows in the same order
+    for (user_id, day), delta in sorted(deltas.items()):
+        if delta.is_empty():
+            continue
+        with transaction.atomic():
+            row, _ = MoodDailyRollup.objects.select_for_update().get_or_create(user_id=user_id, date=day)
+            row.count += delta.count
+            if row.count <= 0:
+                row.delete()
+                continue
+            row.sentiment_n = max(row.sentiment_n + delta.sentiment_n, 0)
+            row.sentiment_sum = row.sentiment_sum + delta.sentiment_sum if row.sentiment_n else 0.0
+            row.stress_n = max(row.stress_n + delta.stress_n, 0)
+            row.stress_sum = row.stress_sum + delta.stress_sum if row.stress_n else 0
+            row.tag_counts = _merge_counts(row.tag_counts, delta.tags)
+            row.activity_counts = _merge_counts(row.activity_counts, delta.activities)
+            row.save()
+
+
+def update_notes(queryset, **values) -> int:
+    """``queryset.update(**values)`` that also keeps the rollups in step."""
+    with transaction.atomic():
+        old = locked_states(queryset)
+        if not old:
+            return 0
+        updated = queryset.model.objects.filter(pk__in=list(old)).update(**values)
+        changed = {k: v for k, v in values.items() if k in ROLLUP_FIELDS}
+        if changed:
+            apply_changes((state, {**state, **changed}) for state in old.values())
+    return updated
+
+
+def create_notes(notes, batch_size=None) -> list:
+    """``MoodNote.objects.bulk_create(notes)`` that also sets local_date and keeps the rollups in step."""
+    from api.models import MoodNote
+
+    for note in notes:
+        note.assign_local_date()
+    with transaction.atomic():
+        created = MoodNote.objects.bulk_create(notes, batch_size=batch_size)
+        apply_changes((None, note_state(note)) for note in created)
+    return created
+
+
+def rebuild_rollups(user_ids=None) -> int:
+    """Recompute the rollups of ``user_ids`` (default: every user) from their notes.
+
+    Returns the number of rollup rows written.
+    """
+    from api.models import MoodDailyRollup, MoodNote
+
+    notes = MoodNote.objects.filter(is_deleted=False, local_date__isnull=False)
+    rollups = MoodDailyRollup.objects.all()
+    if user_ids is not None:
+        notes = notes.filter(user_id__in=user_ids)
+        rollups = rollups.filter(user_id__in=user_ids)
+
+    with transaction.atomic():
+        # Locking the notes holds back concurrent note writes until the new rows are in
+        deltas = defaultdict(_Delta)
+        for state in notes.select_for_update().values(*STATE_FIELDS):
+            c = contribution(state)
+            deltas[c.user_id, c.date].add(c, 1)
+        rows = [
+            MoodDailyRollup(
+                user_id=user_id, date=day, count=d.count,
+                sentiment_sum=d.sentiment_sum, sentiment_n=d.sentiment_n,
+                stress_sum=d.stress_sum, stress_n=d.stress_n,
+                tag_counts=_merge_counts({}, d.tags), activity_counts=_merge_counts({}, d.activities),
+            )
+            for (user_id, day), d in deltas.items()
+        ]
+        rollups.delete()
+        MoodDailyRollup.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+# --- Readers ---
+
+def daily_rows(user, start=None, end=None):
+    """The user's rollup rows with ``start <= date <= end``, oldest first."""
+    from api.models import MoodDailyRollup
+
+    rows = MoodDailyRollup.objects.filter(user=user)
+    if start is not None:
+        rows = rows.filter(date__gte=start)
+    if end is not None:
+        rows = rows.filter(date__lte=end)
+    return rows.order_by('date')
+
+
+def summarize(rows) -> dict:
+    """Totals over rollup rows: note count (and how many are scored), average sentiment/stress and activity/tag counts."""
+    count = sentiment_n = stress_n = stress_sum = 0
+    sentiment_sum = 0.0
+    tags, activities = Counter(), Counter()
+    for row in rows:
+        count += row.count
+        sentiment_sum += row.sentiment_sum
+        sentiment_n += row.sentiment_n
+        stress_sum += row.stress_sum
+        stress_n += row.stress_n
+        tags.update(row.tag_counts)
+        activities.update(row.activity_counts)
+    return {
+        'count': count,
+        'scored_count': sentiment_n,
+        'avg_sentiment': sentiment_sum / sentiment_n if sentiment_n else None,
+        'avg_stress': stress_sum / stress_n if stress_n else None,
+        'tag_counts': dict(tags),
+        'activity_counts': dict(activities),
+    }
+
+
+def active_dates(user, limit=366) -> list:
+    """Most recent local days with at least one live note, newest first."""
+    return list(daily_rows(user).order_by('-date').values_list('date', flat=True)[:limit])
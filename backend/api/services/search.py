@@ -4,23 +4,24 @@ from datetime import datetime
 def search_notes(queryset, search=None, tag=None,
                  sentiment_min=None, sentiment_max=None,
                  stress_min=None, stress_max=None,
-                 date_from=None, date_to=None):
+                 date_from=None, date_to=None, user_id=None):
     """
     Filter MoodNote queryset using structured fields first (DB-level),
-    then decrypt-and-match keyword search as the final step.
+    then keyword search through the configured search backend
+    (``user_id`` is the owner of the notes in ``queryset``).
     """
     # Date range filters
     if date_from:
         try:
             dt = datetime.strptime(date_from, '%Y-%m-%d')
-            queryset = queryset.filter(created_at__date__gte=dt.date())
+            queryset = queryset.filter(local_date__gte=dt.date())
         except ValueError:
             pass
 
     if date_to:
         try:
             dt = datetime.strptime(date_to, '%Y-%m-%d')
-            queryset = queryset.filter(created_at__date__lte=dt.date())
+            queryset = queryset.filter(local_date__lte=dt.date())
         except ValueError:
             pass
 
@@ -50,12 +51,13 @@ def search_notes(queryset, search=None, tag=None,
         except (ValueError, TypeError):
             pass
 
-    # Tag filter (JSON contains)
+    # Tag filter — indexed NoteTag lookup (one row per note and tag, so no duplicates)
     if tag:
-        queryset = queryset.filter(metadata__tags__contains=[tag])
+        queryset = queryset.filter(note_tags__tag=tag)
 
-    # Keyword search — DB-level via search_text index
+    # Keyword search — blind token index or the database's text index (ranked)
     if search:
-        queryset = queryset.filter(search_text__icontains=search)
+        from api.services.search_backends import get_search_backend
+        queryset = get_search_backend().search(queryset, user_id, search)
 
     return queryset
@@ -0,0 +1,139 @@
+"""Keyword search backends for notes, selected by NOTE_SEARCH_BACKEND.
+
+- ``blind``: hashed-term lookups in ``NoteSearchToken`` over the full encrypted
+  note (see ``search_index``). No plaintext is needed and there is no ranking.
+- ``native``: the database's own text index over ``search_text``. On
+  PostgreSQL this is ``ILIKE`` served by a ``pg_trgm`` GIN index, ranked by
+  trigram word similarity. On SQLite it is an FTS5 trigram shadow table
+  (``moodnote_fts``, kept in sync by triggers), ranked by bm25.
+
+Ranked backends annotate ``search_rank`` (higher is better) and order by it.
+``snippet_offsets`` gives highlight positions for the serializer.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Lookup
+
+# FTS5's trigram tokenizer and pg_trgm cannot match queries shorter than this
+MIN_TRIGRAM_QUERY = 3
+
+_fts_available = None
+
+
+class LikeSearchBackend:
+    """Unindexed ``icontains`` over search_text; used when nothing better is available."""
+
+    name = 'like'
+    ranked = False
+
+    def search(self, queryset, user_id, query):
+        return queryset.filter(search_text__icontains=query)
+
+
+class BlindIndexSearchBackend(LikeSearchBackend):
+    """Token-index lookup; notes with no ``NoteSearchToken`` rows yet still match on search_text."""
+
+    name = 'blind'
+
+    def search(self, queryset, user_id, query):
+        from django.db.models import Exists, OuterRef
+
+        from api.models import NoteSearchToken
+        from api.services.search_index import filter_by_keywords
+
+        filtered = filter_by_keywords(queryset, user_id, query) if user_id is not None else None
+        if filtered is None:
+            return super().search(queryset, user_id, query)
+        # Notes saved before the index existed stay searchable until build_search_index reaches them
+        unindexed = super().search(queryset, user_id, query).filter(
+            ~Exists(NoteSearchToken.objects.filter(note=OuterRef('pk')))
+        )
+        return filtered | unindexed
+
+
+class _ILike(Lookup):
+    """``lhs ILIKE rhs`` on the raw column (``icontains`` compiles to ``UPPER(col::text) LIKE``)."""
+
+    lookup_name = 'ilike'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} ILIKE {rhs}', [*lhs_params, *rhs_params]
+
+
+class PostgresTrigramSearchBackend(LikeSearchBackend):
+    """``search_text ILIKE '%q%'``, which the ``gin (search_text gin_trgm_ops)`` index serves."""
+
+    name = 'postgres_trigram'
+    ranked = True
+
+    def search(self, queryset, user_id, query):
+        from django.contrib.postgres.search import TrigramWordSimilarity
+        pattern = f'%{connection.ops.prep_for_like_query(query)}%'
+        return (
+            queryset.filter(_ILike(F('search_text'), pattern))
+            .annotate(search_rank=TrigramWordSimilarity(query, 'search_text'))
+            .order_by('-search_rank', '-created_at')
+        )
+
+
+class SqliteFTSSearchBackend(LikeSearchBackend):
+    name = 'sqlite_fts5'
+    ranked = True
+
+    def search(self, queryset, user_id, query):
+        from django.db.models import FloatField
+        from django.db.models.expressions import RawSQL
+
+        if len(query) < MIN_TRIGRAM_QUERY:
+            return super().search(queryset, user_id, query)
+        phrase = '"' + query.replace('"', '""') + '"'
+        table = queryset.model._meta.db_table
+        return (
+            queryset.filter(pk__in=RawSQL(
+                'SELECT rowid FROM moodnote_fts WHERE moodnote_fts MATCH %s', [phrase],
+            ))
+            .annotate(search_rank=RawSQL(
+                f'SELECT -bm25(moodnote_fts) FROM moodnote_fts '
+                f'WHERE moodnote_fts MATCH %s AND rowid = "{table}"."id"',
+                [phrase], output_field=FloatField(),
+            ))
+            .order_by('-search_rank', '-created_at')
+        )
+
+
+def _sqlite_fts_available() -> bool:
+    global _fts_available
+    if _fts_available is None:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'moodnote_fts'")
+            _fts_available = cursor.fetchone() is not None
+    return _fts_available
+
+
+def get_search_backend() -> LikeSearchBackend:
+    if settings.NOTE_SEARCH_BACKEND == 'native':
+        if connection.vendor == 'postgresql':
+            return PostgresTrigramSearchBackend()
+        if connection.vendor == 'sqlite' and _sqlite_fts_available():
+            return SqliteFTSSearchBackend()
+        return LikeSearchBackend()
+    return BlindIndexSearchBackend()
+
+
+def snippet_offsets(text: str, query: str, width: int = 80) -> dict:
+    """A ``width``-char window of ``text`` around the first hit, with [start, end) offsets of every hit in it."""
+    terms = [t for t in dict.fromkeys([query.strip(), *query.split()]) if t]
+    if not terms or not text:
+        return {'snippet': text[:width], 'offsets': []}
+    pattern = re.compile('|'.join(re.escape(t) for t in sorted(terms, key=len, reverse=True)), re.IGNORECASE)
+    first = pattern.search(text)
+    start = max(0, first.start() - width // 4) if first else 0
+    window = text[start:start + width]
+    return {
+        'snippet': window,
+        'offsets': [[m.start(), m.end()] for m in pattern.finditer(window)],
+    }
@@ -0,0 +1,98 @@
+"""Blind keyword index for encrypted notes.
+
+Each note's full plaintext is reduced to a set of terms: lowercased latin/digit
+words, plus every CJK character and CJK character bigram. Only a keyed hash of
+each term is stored (``NoteSearchToken``). The hash mixes in the owner's user
+id, so equal words in two users' notes do not share a hash.
+
+A query is reduced the same way: latin words, plus the bigrams of each CJK run
+(or the lone character of a one-character run). A note matches when it holds
+every query hash, so CJK queries behave like substring search and latin
+queries like whole-word search. Bigrams are not checked for adjacency, so rare
+false positives are possible, but a real match is never missed.
+
+jieba is deliberately not used: its segmentation depends on the surrounding
+text, so a query word need not be cut the same way inside the note.
+"""
+import re
+import unicodedata
+
+from api.services.encryption import content_digest
+
+# Long queries are capped; the first terms already narrow the candidates
+MAX_QUERY_TERMS = 12
+
+# CJK ideographs (ext. A, unified, compatibility), kana and hangul
+_CJK_RUN = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af]+')
+_WORD = re.compile(r'[0-9a-z]+')
+
+
+def _normalize(text: str) -> str:
+    # NFKC folds full-width latin/digits onto ASCII
+    return unicodedata.normalize('NFKC', text).casefold()
+
+
+def _words(text: str) -> list[str]:
+    return _WORD.findall(_CJK_RUN.sub(' ', text))
+
+
+def index_terms(text: str) -> set[str]:
+    text = _normalize(text)
+    terms = set(_words(text))
+    for run in _CJK_RUN.findall(text):
+        terms.update(run)
+        terms.update(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def query_terms(text: str) -> list[str]:
+    text = _normalize(text)
+    terms = _words(text)
+    for run in _CJK_RUN.findall(text):
+        if len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return list(dict.fromkeys(terms))[:MAX_QUERY_TERMS]
+
+
+def term_hash(user_id: int, term: str) -> str:
+    return content_digest(f'{user_id}\0{term}', purpose='search')[:32]
+
+
+def index_note(note, plaintext: str, created: bool = False):
+    """Bring the note's stored hashes in line with ``plaintext`` (inserts and deletes only the difference)."""
+    from api.models import NoteSearchToken
+
+    wanted = {term_hash(note.user_id, t) for t in index_terms(plaintext)}
+    existing = set() if created else set(
+        NoteSearchToken.objects.filter(note=note).values_list('token_hash', flat=True)
+    )
+    stale = existing - wanted
+    if stale:
+        NoteSearchToken.objects.filter(note=note, token_hash__in=stale).delete()
+    NoteSearchToken.objects.bulk_create(
+        [NoteSearchToken(note=note, token_hash=h) for h in wanted - existing],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+def filter_by_keywords(queryset, user_id: int, search: str):
+    """Restrict a MoodNote queryset to notes containing every term of ``search``.
+
+    Returns None when the query has no indexable terms (e.g. only punctuation).
+    """
+    from django.db.models import Count
+
+    from api.models import NoteSearchToken
+
+    hashes = [term_hash(user_id, t) for t in query_terms(search)]
+    if not hashes:
+        return None
+    matching = (
+        NoteSearchToken.objects.filter(token_hash__in=hashes)
+        .values('note_id').annotate(hits=Count('id')).filter(hits=len(hashes))
+        .values('note_id')
+    )
+    return queryset.filter(pk__in=matching)
@@ -1,5 +1,9 @@
+import io
+from datetime import timedelta
+
 from django.core import mail
 from django.test import override_settings
+from django.utils import timezone
 from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_encode
 from rest_framework import status
@@ -11,9 +15,18 @@ from django.core.files.uploadedfile import SimpleUploadedFile
 from .models import (
     AIChatMessage, AIChatSession,
     Booking, Conversation, CounselorProfile, CustomUser, Message,
-    MoodNote, NoteAttachment, Notification, SharedNote, UserAchievement,
+    MoodNote, NoteAnalysisJob, NoteAttachment, Notification, SharedNote, UserAchievement,
 )
 
+
+def make_note(user, text='x', **fields):
+    """Save a note through set_content/save, so encryption, search tokens, tags and rollups all run."""
+    note = MoodNote(user=user, **fields)
+    note.set_content(text)
+    note.save()
+    return note
+
+
 # Disable throttling for all non-throttle tests
 NO_THROTTLE = {
     'DEFAULT_THROTTLE_CLASSES': [],
@@ -140,7 +153,7 @@ class NoteCRUDTests(APITestCase):
         self.client.post('/api/notes/', {'content': 'Secret content'}, format='json')
         note = MoodNote.objects.first()
         # Encrypted content should NOT be plaintext
-        self.assertNotEqual(note.encrypted_content, 'Secret content')
+        self.assertNotEqual(note.ciphertext, 'Secret content')
         # Decrypted content should match
         self.assertEqual(note.content, 'Secret content')
 
@@ -1142,7 +1155,7 @@ class SoftDeleteTests(APITestCase):
         self.client.delete(f'/api/notes/{note_id}/')
         resp = self.client.get('/api/notes/trash/')
         self.assertEqual(resp.status_code, status.HTTP_200_OK)
-        ids = [n['id'] for n in resp.data]
+        ids = [n['id'] for n in resp.data['results']]
         self.assertIn(note_id, ids)
 
     def test_restore(self):
@@ -1406,7 +1419,7 @@ class AISentimentTests(APITestCase):
         self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
         # Note should exist regardless of AI
         note = MoodNote.objects.get(id=resp.data['id'])
-        self.assertTrue(note.encrypted_content)
+        self.assertTrue(note.ciphertext)
 
     def test_ai_chat_fallback(self):
         """AI chat should return a fallback response when OpenAI key is missing."""
@@ -1494,3 +1507,1485 @@ class SecurityHeaderTests(APITestCase):
         """Verify RefreshView has throttle classes."""
         from api.views import RefreshView
         self.assertTrue(len(RefreshView.throttle_classes) > 0)
+
+
+# ===== Async note analysis queue =====
+
+@override_settings(REST_FRAMEWORK={**NO_THROTTLE}, NOTE_ANALYSIS_ASYNC=True, OPENAI_API_KEY='')
+class NoteAnalysisQueueTests(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='queueuser', password='pass1234')
+        self.client.force_authenticate(user=self.user)
+
+    def test_create_returns_pending_and_enqueues_job(self):
+        resp = self.client.post('/api/notes/', {'content': '今天很開心'}, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(resp.data['analysis_status'], 'pending')
+        self.assertIsNone(resp.data['sentiment_score'])
+        self.assertEqual(NoteAnalysisJob.objects.filter(note_id=resp.data['id'], status='pending').count(), 1)
+
+    def test_update_reuses_pending_job(self):
+        resp = self.client.post('/api/notes/', {'content': 'first'}, format='json')
+        self.client.patch(f'/api/notes/{resp.data["id"]}/', {'content': 'second'}, format='json')
+        self.assertEqual(NoteAnalysisJob.objects.filter(note_id=resp.data['id']).count(), 1)
+
+    def test_worker_processes_job_and_pushes_result(self):
+        from asgiref.sync import async_to_sync
+        from channels.layers import get_channel_layer
+        from django.core.management import call_command
+
+        resp = self.client.post('/api/notes/', {'content': '今天很開心，很快樂'}, format='json')
+        note_id = resp.data['id']
+
+        layer = get_channel_layer()
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)(f'notifications_{self.user.id}', channel)
+
+        call_command('process_analysis_jobs', '--once', stdout=io.StringIO())
+
+        note = MoodNote.objects.get(id=note_id)
+        self.assertEqual(note.analysis_status, 'done')
+        self.assertGreater(note.sentiment_score, 0)
+        self.assertTrue(note.ai_feedback)
+        self.assertEqual(NoteAnalysisJob.objects.get(note=note).status, 'done')
+
+        event = async_to_sync(layer.receive)(channel)
+        self.assertEqual(event['type'], 'notify')
+        self.assertEqual(event['data']['type'], 'note_analysis')
+        self.assertEqual(event['data']['note_id'], note_id)
+        self.assertEqual(event['data']['sentiment_score'], note.sentiment_score)
+        self.assertEqual(event['data']['ai_feedback'], note.ai_feedback)
+
+    def test_job_superseded_mid_analysis_does_not_write(self):
+        from api.services.ai_engine import ai_engine
+        from unittest.mock import patch
+
+        from api.services.analysis_queue import claim_next_job, run_job
+
+        resp = self.client.post('/api/notes/', {'content': '今天很開心'}, format='json')
+        note_id = resp.data['id']
+        job = claim_next_job()
+
+        def edit_then_score(text, **kwargs):
+            self.client.patch(f'/api/notes/{note_id}/', {'content': '其實很難過'}, format='json')
+            return {'sentiment_score': 0.9, 'stress_index': 1, 'ai_feedback': 'stale'}
+
+        with patch.object(ai_engine, 'analyze', side_effect=edit_then_score), \
+                patch('api.services.rollups.update_notes') as update_notes:
+            run_job(job)
+
+        update_notes.assert_not_called()
+        note = MoodNote.objects.get(pk=note_id)
+        self.assertEqual(note.analysis_status, 'pending')
+        self.assertIsNone(note.sentiment_score)
+        self.assertEqual(NoteAnalysisJob.objects.get(pk=job.pk).status, 'done')
+        self.assertTrue(NoteAnalysisJob.objects.filter(note_id=note_id, status='pending').exists())
+
+    @override_settings(NOTE_ANALYSIS_ASYNC=False)
+    def test_inline_mode_still_analyzes(self):
+        resp = self.client.post('/api/notes/', {'content': '今天很開心'}, format='json')
+        self.assertEqual(resp.data['analysis_status'], 'done')
+        self.assertFalse(NoteAnalysisJob.objects.exists())
+
+
+# ===== jieba preload =====
+
+class JiebaPreloadTests(APITestCase):
+    def test_user_dictionary_terms_segment_as_units(self):
+        from api.services.ai_engine import AIEngine
+        words = AIEngine._segment_text('最近壓力山大，真的喘不過氣')
+        self.assertIn('壓力山大', words)
+        self.assertIn('喘不過氣', words)
+
+    def test_cache_filename_is_versioned_by_user_dictionary(self):
+        from api.services.ai_engine import _user_dict_entries, jieba_cache_filename
+        entries = _user_dict_entries()
+        name = jieba_cache_filename(entries)
+        self.assertTrue(name.startswith('jieba-') and name.endswith('.cache'))
+        self.assertNotEqual(name, jieba_cache_filename({**entries, '新詞彙': None}))
+
+
+# ===== Batched local sentiment (Aho-Corasick) =====
+
+class LexiconMatcherTests(APITestCase):
+    def test_leftmost_longest_counts_per_lexicon(self):
+        from api.services.lexicon_matcher import LexiconMatcher
+        matcher = LexiconMatcher({'pos': {'好', '太好了'}, 'neg': {'壓力'}, 'stress': {'壓力', '忙'}})
+        # '太好了' wins over the embedded '好'; '壓力' counts for both lexicons
+        self.assertEqual(matcher.count('太好了，壓力好大，好忙'), [3, 1, 2])
+        self.assertEqual(matcher.count('平常的一天'), [0, 0, 0])
+
+    def test_analyze_batch_returns_aligned_arrays(self):
+        import numpy as np
+        from api.services.ai_engine import ai_engine
+        result = ai_engine.analyze_batch(['今天很開心，很快樂', '焦慮又崩潰，壓力很大', '', '普通的一天'])
+        self.assertIsInstance(result['sentiment_score'], np.ndarray)
+        self.assertEqual(result['sentiment_score'].shape, (4,))
+        self.assertEqual(result['sentiment_score'][0], 1.0)
+        self.assertEqual(result['sentiment_score'][1], -1.0)
+        self.assertGreater(result['stress_index'][1], result['stress_index'][0])
+        self.assertEqual(result['sentiment_score'][2], 0.0)
+        self.assertEqual(result['stress_index'][3], 0)
+
+    def test_batch_matches_per_text_scoring_on_segmented_terms(self):
+        from api.services.ai_engine import AIEngine, ai_engine
+        texts = ['開心又感恩，但是很疲憊', '加班到很晚，失眠又焦慮', '考試壓力很大']
+        batch = ai_engine.analyze_batch(texts)
+        for i, text in enumerate(texts):
+            expected = AIEngine._analyze_sentiment_local(AIEngine._segment_text(text))
+            self.assertEqual(batch['sentiment_score'][i], expected['sentiment_score'])
+            self.assertEqual(batch['stress_index'][i], expected['stress_index'])
+
+    def test_single_character_terms_diverge_inside_words(self):
+        from api.services.ai_chat import analyze_user_message
+        from api.services.ai_engine import ai_engine
+        # Accepted for bulk scoring: the automaton counts 好 inside 好像 ...
+        self.assertEqual(ai_engine.analyze_batch(['我好像有點累'])['sentiment_score'][0], 0.0)
+        # ... chat messages go through jieba, where 好像 is one token
+        self.assertEqual(analyze_user_message('我好像有點累')['sentiment_score'], -1.0)
+
+    def test_terms_jieba_splits_still_count_in_batch(self):
+        from api.services.ai_engine import AIEngine, ai_engine
+        # jieba cuts 自在 into 自/在, so only the automaton sees the positive term
+        self.assertEqual(AIEngine._segment_text('很自在'), ['很', '自', '在'])
+        self.assertEqual(AIEngine._analyze_sentiment_local(['很', '自', '在'])['sentiment_score'], 0.0)
+        self.assertEqual(ai_engine.analyze_batch(['很自在'])['sentiment_score'][0], 1.0)
+
+
+# ===== Shared OpenAI client pool =====
+
+class OpenAIClientPoolTests(APITestCase):
+    def tearDown(self):
+        from api.services.llm_client import reset_clients
+        reset_clients()
+
+    @override_settings(OPENAI_API_KEY='')
+    def test_no_client_without_api_key(self):
+        from api.services.llm_client import get_openai_client
+        self.assertIsNone(get_openai_client('chat'))
+
+    @override_settings(OPENAI_API_KEY='sk-test')
+    def test_use_cases_share_one_http_pool_with_own_policy(self):
+        from django.conf import settings
+        from api.services.llm_client import get_http_client, get_openai_client
+        sentiment = get_openai_client('sentiment')
+        chat = get_openai_client('chat')
+        self.assertIs(sentiment, get_openai_client('sentiment'))
+        self.assertIs(sentiment._client, chat._client)
+        self.assertIs(sentiment._client, get_http_client())
+        self.assertEqual(sentiment.timeout, settings.OPENAI_CALL_POLICIES['sentiment']['timeout'])
+        self.assertEqual(sentiment.max_retries, 1)
+        self.assertEqual(chat.max_retries, settings.OPENAI_MAX_RETRIES)
+
+    @override_settings(OPENAI_API_KEY='sk-test')
+    def test_async_client_is_reused_within_event_loop(self):
+        import asyncio
+        from api.services.llm_client import get_async_openai_client
+
+        async def fetch():
+            return get_async_openai_client('chat'), get_async_openai_client('chat')
+
+        first, second = asyncio.run(fetch())
+        self.assertIs(first, second)
+
+
+# ===== Single-call structured note analysis =====
+
+def _fake_completion(content):
+    from types import SimpleNamespace
+    message = SimpleNamespace(content=content)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+@override_settings(OPENAI_API_KEY='sk-test')
+class StructuredAnalysisTests(APITestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from api.services.circuit_breaker import reset_breakers
+        cache.clear()
+        reset_breakers()
+
+    def _client(self, *contents):
+        from unittest.mock import MagicMock
+        client = MagicMock()
+        client.chat.completions.create.side_effect = [
+            c if isinstance(c, Exception) else _fake_completion(c) for c in contents
+        ]
+        return client
+
+    @override_settings(NOTE_ANALYSIS_MODE='structured')
+    def test_structured_mode_uses_one_completion(self):
+        from unittest.mock import patch
+        from api.services.ai_engine import ai_engine
+        client = self._client('{"sentiment_score": 0.6, "stress_index": 2, "ai_feedback": "很棒的一天"}')
+        with patch('api.services.llm_client.get_openai_client', return_value=client):
+            result = ai_engine.analyze('今天和朋友去爬山，很開心')
+        self.assertEqual(client.chat.completions.create.call_count, 1)
+        self.assertEqual(result['analysis_mode'], 'structured')
+        self.assertEqual(result['sentiment_score'], 0.6)
+        self.assertEqual(result['stress_index'], 2)
+        self.assertEqual(result['ai_feedback'], '很棒的一天')
+
+    @override_settings(NOTE_ANALYSIS_MODE='structured')
+    def test_structured_failure_falls_back_to_two_calls(self):
+        from unittest.mock import patch
+        from api.services.ai_engine import ai_engine
+        client = self._client(
+            '{"sentiment_score": 0.5}',  # missing feedback -> rejected
+            '{"sentiment_score": 0.5, "stress_index": 3}',
+            '聽起來是充實的一天',
+        )
+        with patch('api.services.llm_client.get_openai_client', return_value=client):
+            result = ai_engine.analyze('今天工作很順利')
+        self.assertEqual(client.chat.completions.create.call_count, 3)
+        self.assertEqual(result['analysis_mode'], 'two_call')
+        self.assertEqual(result['stress_index'], 3)
+        self.assertEqual(result['ai_feedback'], '聽起來是充實的一天')
+
+    @override_settings(NOTE_ANALYSIS_MODE='two_call')
+    def test_local_mode_reported_when_openai_unavailable(self):
+        from unittest.mock import patch
+        from api.services.ai_engine import ai_engine
+        client = self._client(RuntimeError('boom'))
+        with patch('api.services.llm_client.get_openai_client', return_value=client):
+            result = ai_engine.analyze('今天很開心')
+        self.assertEqual(result['analysis_mode'], 'local')
+        self.assertIsNotNone(result['sentiment_score'])
+
+
+# ===== Content-hash analysis cache =====
+
+@override_settings(REST_FRAMEWORK={**NO_THROTTLE}, OPENAI_API_KEY='sk-test', NOTE_ANALYSIS_MODE='structured')
+class AnalysisCacheTests(APITestCase):
+    def setUp(self):
+        from unittest.mock import MagicMock, patch
+        from django.core.cache import cache
+        from api.services.circuit_breaker import reset_breakers
+        cache.clear()
+        reset_breakers()
+        self.user = CustomUser.objects.create_user(username='cacheuser', password='pass1234')
+        self.client.force_authenticate(user=self.user)
+        self.llm = MagicMock()
+        self.llm.chat.completions.create.side_effect = lambda **kw: _fake_completion(
+            '{"sentiment_score": 0.4, "stress_index": 3, "ai_feedback": "辛苦了"}'
+        )
+        patcher = patch('api.services.llm_client.get_openai_client', return_value=self.llm)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_identical_text_is_served_from_cache(self):
+        first = self.client.post('/api/notes/', {'content': '今天去公園散步'}, format='json')
+        second = self.client.post('/api/notes/', {'content': '今天去公園散步'}, format='json')
+        self.assertEqual(first['X-Analysis-Cache'], 'miss')
+        self.assertEqual(second['X-Analysis-Cache'], 'hit')
+        self.assertEqual(second.data['ai_feedback'], '辛苦了')
+        self.assertEqual(self.llm.chat.completions.create.call_count, 1)
+
+    def test_metadata_only_patch_skips_analysis(self):
+        resp = self.client.post('/api/notes/', {'content': '今天去公園散步'}, format='json')
+        url = f'/api/notes/{resp.data["id"]}/'
+        patched = self.client.patch(url, {'metadata': {'tags': ['walk']}}, format='json')
+        self.assertEqual(patched['X-Analysis-Cache'], 'skipped')
+        resent = self.client.patch(url, {'content': '今天去公園散步'}, format='json')
+        self.assertEqual(resent['X-Analysis-Cache'], 'skipped')
+        self.assertEqual(self.llm.chat.completions.create.call_count, 1)
+
+    def test_changed_content_is_reanalyzed(self):
+        resp = self.client.post('/api/notes/', {'content': '今天去公園散步'}, format='json')
+        patched = self.client.patch(f'/api/notes/{resp.data["id"]}/', {'content': '今天在家休息'}, format='json')
+        self.assertEqual(patched['X-Analysis-Cache'], 'miss')
+        self.assertEqual(self.llm.chat.completions.create.call_count, 2)
+
+    def test_cache_is_not_shared_between_users(self):
+        other = CustomUser.objects.create_user(username='cacheuser2', password='pass1234')
+        self.client.post('/api/notes/', {'content': '今天去公園散步'}, format='json')
+        self.client.force_authenticate(user=other)
+        resp = self.client.post('/api/notes/', {'content': '今天去公園散步'}, format='json')
+        self.assertEqual(resp['X-Analysis-Cache'], 'miss')
+        self.assertEqual(self.llm.chat.completions.create.call_count, 2)
+
+    def test_migration_digest_matches_live_digest(self):
+        import importlib
+        from cryptography.fernet import MultiFernet
+        from api.services.encryption import content_digest, encryption_service
+        migration = importlib.import_module('api.migrations.0034_moodnote_content_digest')
+        token = encryption_service.encrypt('今天去公園散步')
+        plaintext = migration._decrypt(MultiFernet(encryption_service._fernets), token)
+        self.assertEqual(plaintext, '今天去公園散步')
+        self.assertEqual(migration._content_digest(plaintext), content_digest(plaintext))
+
+    def test_cache_key_depends_on_mode_and_model(self):
+        from api.services.ai_engine import AIEngine
+        key = AIEngine._analysis_cache_key('同一段文字')
+        self.assertNotIn('同一段文字', key)
+        with override_settings(NOTE_ANALYSIS_MODE='two_call'):
+            self.assertNotEqual(key, AIEngine._analysis_cache_key('同一段文字'))
+        with override_settings(OPENAI_MODEL='gpt-4o'):
+            self.assertNotEqual(key, AIEngine._analysis_cache_key('同一段文字'))
+
+
+# ===== RAG retrieval cache =====
+
+@override_settings(RAG_QUERY_CACHE_SIZE=2)
+class RagQueryCacheTests(APITestCase):
+    def setUp(self):
+        from unittest.mock import MagicMock
+        from api.services.ai_engine import ai_engine
+        self.engine = ai_engine
+        self.store = MagicMock()
+        self.store.embeddings.embed_query.return_value = [0.1, 0.2]
+        self.store.similarity_search_by_vector.return_value = ['chunk']
+        self._saved_store = ai_engine._vectorstore
+        ai_engine._vectorstore = self.store
+        ai_engine._rag_query_cache.clear()
+        self.addCleanup(self._restore)
+
+    def _restore(self):
+        self.engine._vectorstore = self._saved_store
+        self.engine._rag_query_cache.clear()
+
+    def test_near_identical_queries_share_one_embedding(self):
+        self.assertEqual(self.engine._retrieve_chunks('今天  好累\n'), ['chunk'])
+        self.assertEqual(self.engine._retrieve_chunks('今天 好累'), ['chunk'])
+        self.assertEqual(self.store.embeddings.embed_query.call_count, 1)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        for text in ('一', '二', '三'):
+            self.engine._retrieve_chunks(text)
+        self.assertEqual(len(self.engine._rag_query_cache), 2)
+        self.engine._retrieve_chunks('一')
+        self.assertEqual(self.store.embeddings.embed_query.call_count, 4)
+
+
+# ===== Offline BM25 knowledge-base index =====
+
+class KnowledgeBaseIndexTests(APITestCase):
+    def setUp(self):
+        import tempfile
+        from api.services.kb_index import build_kb_index
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.index_dir = f'{tmp.name}/kb_index'
+        build_kb_index(
+            [
+                ('Deep breathing reduces stress and anxiety.', 'a.txt'),
+                ('Regular sleep schedules improve mood.', 'b.txt'),
+                ('Exercise and sleep both help with stress.', 'c.txt'),
+            ],
+            self.index_dir,
+            embeddings=[[1.0, 0.0], [0.0, 1.0], [0.6, 0.8]],
+        )
+
+    def test_bm25_search_ranks_matching_chunks(self):
+        from api.services.kb_index import KnowledgeBaseIndex
+        index = KnowledgeBaseIndex.open(self.index_dir)
+        hits = index.search('anxiety breathing', k=2)
+        self.assertEqual(hits[0]['source'], 'a.txt')
+        self.assertEqual(hits[0]['text'], 'Deep breathing reduces stress and anxiety.')
+        self.assertEqual(len(hits), 1)
+
+    def test_arrays_are_memory_mapped_read_only(self):
+        import numpy as np
+        from api.services.kb_index import KnowledgeBaseIndex
+        index = KnowledgeBaseIndex.open(self.index_dir)
+        self.assertIsInstance(index._posting_weights, np.memmap)
+        self.assertFalse(index._posting_weights.flags.writeable)
+
+    def test_hybrid_reranking_uses_embeddings(self):
+        from api.services.kb_index import KnowledgeBaseIndex
+        index = KnowledgeBaseIndex.open(self.index_dir)
+        bm25_only = index.search('stress', k=2)
+        hybrid = index.search('stress', k=2, query_embedding=[0.0, 1.0], hybrid_weight=0.9)
+        self.assertEqual({h['source'] for h in bm25_only}, {'a.txt', 'c.txt'})
+        self.assertEqual(hybrid[0]['source'], 'c.txt')
+
+    def test_engine_reopens_index_after_rebuild(self):
+        from api.services.ai_engine import ai_engine
+        from api.services.kb_index import build_kb_index
+        saved = ai_engine._retriever, ai_engine._kb_embeddings
+        self.addCleanup(lambda: setattr(ai_engine, '_retriever', saved[0]))
+        self.addCleanup(lambda: setattr(ai_engine, '_kb_embeddings', saved[1]))
+        ai_engine._retriever = None
+        with override_settings(RAG_RETRIEVER='bm25', KB_INDEX_DIR=self.index_dir, OPENAI_API_KEY=''):
+            first = ai_engine._get_retriever()
+            self.assertIs(ai_engine._get_retriever(), first)
+            ai_engine._rag_query_cache['stale'] = {'chunks': []}
+            build_kb_index([('Journaling helps process emotions.', 'd.txt')], self.index_dir)
+            second = ai_engine._get_retriever()
+        self.assertIsNot(second, first)
+        self.assertEqual(second.search('journaling')[0]['source'], 'd.txt')
+        self.assertNotIn('stale', ai_engine._rag_query_cache)
+
+
+# ===== Incremental knowledge-base ingestion =====
+
+class KnowledgeBaseDeltaTests(APITestCase):
+    def test_chunk_hash_depends_on_source_and_text(self):
+        from api.management.commands.load_knowledge_base import chunk_hash
+        self.assertEqual(chunk_hash('a.txt', '呼吸'), chunk_hash('a.txt', '呼吸'))
+        self.assertNotEqual(chunk_hash('a.txt', '呼吸'), chunk_hash('b.txt', '呼吸'))
+
+    def test_delta_splits_new_unchanged_and_stale(self):
+        from api.management.commands.load_knowledge_base import compute_delta
+        delta = compute_delta(['h1', 'h2', 'h3'], {'h2', 'old', 'legacy-uuid'})
+        self.assertEqual(delta['new'], ['h1', 'h3'])
+        self.assertEqual(delta['unchanged'], ['h2'])
+        self.assertEqual(delta['stale'], ['legacy-uuid', 'old'])
+
+    def test_skip_chroma_index_embeds_only_new_chunks(self):
+        import os
+        import tempfile
+        from unittest.mock import MagicMock, patch
+        from django.core.management import call_command
+        from api.services.kb_index import stored_embeddings
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        os.mkdir(f'{tmp.name}/knowledge_base')
+        index_dir = f'{tmp.name}/kb_index'
+        embedder = MagicMock()
+        embedder.embed_documents.side_effect = lambda texts: [[float(len(t)), 1.0] for t in texts]
+
+        def run(*files):
+            for name, text in files:
+                with open(f'{tmp.name}/knowledge_base/{name}', 'w', encoding='utf-8') as f:
+                    f.write(text)
+            with override_settings(BASE_DIR=tmp.name), \
+                    patch('langchain_openai.OpenAIEmbeddings', return_value=embedder):
+                call_command('load_knowledge_base', '--skip-chroma', '--embed-index',
+                             '--index-dir', index_dir, stdout=io.StringIO())
+
+        run(('a.txt', '深呼吸可以緩解焦慮。'))
+        self.assertEqual(embedder.embed_documents.call_count, 1)
+        run()  # unchanged: digest matches before any embedding
+        self.assertEqual(embedder.embed_documents.call_count, 1)
+        run(('b.txt', '規律睡眠有助於穩定情緒。'))
+        self.assertEqual(embedder.embed_documents.call_count, 2)
+        self.assertEqual(embedder.embed_documents.call_args.args[0], ['規律睡眠有助於穩定情緒。'])
+        self.assertEqual(len(stored_embeddings(index_dir)), 2)
+
+
+# ===== LLM circuit breaker =====
+
+@override_settings(
+    OPENAI_API_KEY='sk-test', NOTE_ANALYSIS_MODE='structured',
+    LLM_BREAKER={
+        'failure_rate': 0.5, 'min_calls': 2, 'window_seconds': 60,
+        'slow_call_seconds': 5, 'open_seconds': 30, 'shared': False,
+    },
+)
+class CircuitBreakerTests(APITestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from api.services.circuit_breaker import reset_breakers
+        cache.clear()
+        reset_breakers()
+        self.addCleanup(reset_breakers)
+
+    def _fail(self, breaker):
+        from api.services.circuit_breaker import CircuitOpenError
+        try:
+            with breaker.guard():
+                raise TimeoutError('upstream timeout')
+        except (TimeoutError, CircuitOpenError):
+            pass
+
+    def test_opens_on_error_rate_and_short_circuits(self):
+        from api.services.circuit_breaker import CircuitOpenError, get_breaker
+        breaker = get_breaker('analysis')
+        self._fail(breaker)
+        self._fail(breaker)
+        self.assertEqual(breaker.snapshot()['state'], 'open')
+        with self.assertRaises(CircuitOpenError):
+            with breaker.guard():
+                self.fail('call should not run while open')
+
+    def test_slow_calls_count_as_failures(self):
+        from api.services.circuit_breaker import get_breaker
+        breaker = get_breaker('chat')
+        breaker.record(True, 6.0)
+        breaker.record(True, 7.0)
+        self.assertEqual(breaker.snapshot()['state'], 'open')
+
+    def test_half_open_probe_closes_on_success(self):
+        from unittest.mock import patch
+        from api.services.circuit_breaker import get_breaker
+        breaker = get_breaker('sentiment')
+        self._fail(breaker)
+        self._fail(breaker)
+        with patch('api.services.circuit_breaker.time.monotonic', return_value=breaker._opened_at + 31):
+            self.assertTrue(breaker.allow())
+            self.assertFalse(breaker.allow())  # only one probe in flight
+            breaker.record(True, 0.1)
+        self.assertEqual(breaker.snapshot()['state'], 'closed')
+
+    def test_open_breakers_skip_openai_during_analysis(self):
+        from unittest.mock import MagicMock, patch
+        from api.services.ai_engine import ai_engine
+        from api.services.circuit_breaker import get_breaker
+        for use_case in ('analysis', 'sentiment'):
+            breaker = get_breaker(use_case)
+            self._fail(breaker)
+            self._fail(breaker)
+        client = MagicMock()
+        with patch('api.services.llm_client.get_openai_client', return_value=client):
+            result = ai_engine.analyze('今天很開心')
+        self.assertEqual(result['analysis_mode'], 'local')
+        client.chat.completions.create.assert_not_called()
+
+    def test_breaker_state_in_admin_stats(self):
+        from api.services.circuit_breaker import get_breaker
+        admin = CustomUser.objects.create_user(username='breakeradmin', password='pass1234', is_staff=True)
+        self.client.force_authenticate(user=admin)
+        get_breaker('chat')
+        resp = self.client.get('/api/admin/stats/')
+        names = [c['name'] for c in resp.data['llm_circuits']]
+        self.assertIn('gpt-4o-mini:chat', names)
+
+
+# ===== Bulk re-scoring command =====
+
+class RescoreNotesCommandTests(APITestCase):
+    def setUp(self):
+        import tempfile
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.checkpoint = f'{tmp.name}/checkpoint.json'
+        self.user = CustomUser.objects.create_user(username='rescoreuser', password='pass1234')
+        self.notes = []
+        for text in ('今天很開心', '壓力好大，好焦慮', '普通的一天'):
+            self.notes.append(make_note(self.user, text, sentiment_score=0.0, stress_index=5))
+
+    def _run(self, *args):
+        from django.core.management import call_command
+        out = io.StringIO()
+        call_command(
+            'rescore_notes', '--workers', '0', '--chunk-size', '2',
+            '--checkpoint', self.checkpoint, *args, stdout=out,
+        )
+        return out.getvalue()
+
+    def test_local_tier_rewrites_scores_and_checkpoints(self):
+        import json
+        out = self._run()
+        happy, stressed, _ = (MoodNote.objects.get(pk=n.pk) for n in self.notes)
+        self.assertGreater(happy.sentiment_score, 0)
+        self.assertLess(stressed.sentiment_score, 0)
+        self.assertIn('notes/s', out)
+        with open(self.checkpoint) as f:
+            checkpoint = json.load(f)
+        self.assertEqual(checkpoint['last_id'], self.notes[-1].pk)
+        self.assertEqual(checkpoint['processed'], 3)
+
+    def test_rerun_resumes_after_checkpoint(self):
+        self._run()
+        MoodNote.objects.filter(pk=self.notes[0].pk).update(sentiment_score=0.0)
+        self._run()
+        self.assertEqual(MoodNote.objects.get(pk=self.notes[0].pk).sentiment_score, 0.0)
+        self._run('--restart')
+        self.assertGreater(MoodNote.objects.get(pk=self.notes[0].pk).sentiment_score, 0)
+
+    @override_settings(OPENAI_API_KEY='sk-test')
+    def test_openai_tier_bypasses_the_analysis_cache_by_default(self):
+        from unittest.mock import patch
+        from django.core.cache import cache
+        from api.services.ai_engine import AIEngine, ai_engine
+        cache.clear()
+        fresh = {'sentiment_score': 0.5, 'stress_index': 1, 'ai_feedback': 'new', 'analysis_mode': 'structured'}
+        with patch.object(AIEngine, '_analyze_uncached', return_value=fresh) as uncached:
+            ai_engine.analyze('今天很開心')
+            self._run('--tier', 'openai', '--concurrency', '1')
+            self.assertEqual(uncached.call_count, 1 + len(self.notes))
+            self._run('--tier', 'openai', '--concurrency', '1', '--restart', '--use-cache')
+            self.assertEqual(uncached.call_count, 1 + len(self.notes))
+        self.assertEqual(MoodNote.objects.get(pk=self.notes[0].pk).ai_feedback, 'new')
+
+
+# ===== Streaming AI chat =====
+
+@override_settings(OPENAI_API_KEY='sk-test')
+class AIChatStreamTests(APITestCase):
+    def setUp(self):
+        from api.services.circuit_breaker import reset_breakers
+        reset_breakers()
+
+    def _collect(self, client, lang='en'):
+        from unittest.mock import patch
+        from asgiref.sync import async_to_sync
+        from api.services.ai_chat import stream_ai_response
+
+        async def run():
+            return [d async for d in stream_ai_response([], lang)]
+
+        with patch('api.services.llm_client.get_async_openai_client', return_value=client):
+            return async_to_sync(run)()
+
+    def test_deltas_are_yielded_as_they_arrive(self):
+        from types import SimpleNamespace
+        from unittest.mock import AsyncMock, MagicMock
+
+        async def chunks():
+            for text in ('Hello', None, ' there'):
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+        client = MagicMock()
+        client.chat.completions.create = AsyncMock(return_value=chunks())
+        self.assertEqual(self._collect(client), ['Hello', ' there'])
+        self.assertTrue(client.chat.completions.create.call_args.kwargs['stream'])
+
+    def test_failure_before_first_token_yields_fallback(self):
+        from unittest.mock import AsyncMock, MagicMock
+        from api.services.ai_chat import FALLBACK_RESPONSES
+        client = MagicMock()
+        client.chat.completions.create = AsyncMock(side_effect=TimeoutError('slow'))
+        self.assertEqual(self._collect(client), [FALLBACK_RESPONSES['en']])
+
+    def _failing_stream(self, texts):
+        from types import SimpleNamespace
+
+        async def chunks():
+            for text in texts:
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+            raise ConnectionError('reset')
+        return chunks()
+
+    def test_failure_mid_stream_raises_and_counts_against_breaker(self):
+        from unittest.mock import AsyncMock, MagicMock
+        from api.services.ai_chat import StreamInterrupted
+        from api.services.circuit_breaker import get_breaker
+        client = MagicMock()
+        client.chat.completions.create = AsyncMock(return_value=self._failing_stream(['Hel', 'lo']))
+        with self.assertRaises(StreamInterrupted):
+            self._collect(client)
+        self.assertEqual(get_breaker('chat').snapshot()['window_failures'], 1)
+
+    def test_failure_or_empty_stream_before_first_token_yields_fallback(self):
+        from unittest.mock import AsyncMock, MagicMock
+        from api.services.ai_chat import FALLBACK_RESPONSES
+        client = MagicMock()
+        client.chat.completions.create = AsyncMock(return_value=self._failing_stream([None]))
+        self.assertEqual(self._collect(client), [FALLBACK_RESPONSES['en']])
+
+        async def empty():
+            return
+            yield
+        client.chat.completions.create = AsyncMock(return_value=empty())
+        self.assertEqual(self._collect(client), [FALLBACK_RESPONSES['en']])
+
+    def test_interrupted_reply_is_saved_with_marker_and_error_frame(self):
+        from unittest.mock import AsyncMock, patch
+        from asgiref.sync import async_to_sync
+        from api.consumers import AIChatConsumer
+        from api.services.ai_chat import StreamInterrupted, TRUNCATED_MARKERS
+
+        async def partial(*args):
+            yield 'Hello'
+            raise StreamInterrupted('reset')
+
+        consumer = AIChatConsumer()
+        consumer.scope = {'user': CustomUser(pk=1)}
+        consumer.session_id = 1
+        consumer.send_json = AsyncMock()
+        consumer.save_user_message = AsyncMock(return_value=({}, [], ''))
+        consumer.save_ai_message = AsyncMock(return_value={'id': 2})
+        consumer.queue_summary = AsyncMock()
+        with patch('api.services.ai_chat.stream_ai_response', partial):
+            async_to_sync(consumer.stream_reply)('hi', 'en')
+        consumer.save_ai_message.assert_awaited_once_with(1, 'Hello' + TRUNCATED_MARKERS['en'])
+        frames = [c.args[0]['type'] for c in consumer.send_json.await_args_list]
+        self.assertEqual(frames, ['ai_chat.user_message', 'ai_chat.delta', 'ai_chat.error', 'ai_chat.done'])
+
+    def test_websocket_messages_share_the_rest_throttle(self):
+        from unittest.mock import patch
+        from asgiref.sync import async_to_sync
+        from api.consumers import AIChatConsumer
+        from api.throttles import AIChatThrottle
+        from django.core.cache import cache
+        cache.clear()
+        user = CustomUser.objects.create_user(username='wsthrottle', password='pass1234')
+        consumer = AIChatConsumer()
+        with patch.object(AIChatThrottle, 'rate', '2/hour', create=True):
+            waits = [async_to_sync(consumer.throttle_wait)(user) for _ in range(3)]
+        self.assertEqual(waits[:2], [None, None])
+        self.assertGreater(waits[2], 0)
+
+
+# ===== Bounded AI chat context =====
+
+@override_settings(
+    OPENAI_API_KEY='sk-test', AI_CHAT_CONTEXT_MESSAGES=4, AI_CHAT_SUMMARY_EVERY=3,
+    AI_CHAT_CONTEXT_TOKEN_BUDGET=3000,
+)
+class AIChatContextTests(APITestCase):
+    def setUp(self):
+        from api.services.circuit_breaker import reset_breakers
+        reset_breakers()
+        self.user = CustomUser.objects.create_user(username='ctxuser', password='pass1234')
+        self.session = AIChatSession.objects.create(user=self.user)
+
+    def _add(self, n):
+        for i in range(n):
+            AIChatMessage.objects.create(
+                session=self.session, role='user' if i % 2 == 0 else 'assistant', content=f'message {i}',
+            )
+
+    def test_context_is_newest_messages_in_order(self):
+        from api.services.ai_chat import load_context
+        self._add(10)
+        self.assertEqual([m.content for m in load_context(self.session)],
+                         ['message 6', 'message 7', 'message 8', 'message 9'])
+
+    def test_prompt_is_trimmed_to_token_budget(self):
+        from api.services.ai_chat import _build_messages, estimate_tokens, load_context, SYSTEM_PROMPTS
+        self._add(4)
+        budget = estimate_tokens(SYSTEM_PROMPTS['en']) + estimate_tokens('message 3') * 2
+        with override_settings(AI_CHAT_CONTEXT_TOKEN_BUDGET=budget):
+            messages = _build_messages(load_context(self.session), 'en', '')
+        self.assertEqual([m['content'] for m in messages[1:]], ['message 2', 'message 3'])
+
+    def test_summary_folds_messages_that_left_the_window(self):
+        from unittest.mock import MagicMock, patch
+        from api.services.ai_chat import _build_messages, load_context, refresh_summary_if_due
+        self._add(6)
+        client = MagicMock()
+        client.chat.completions.create.return_value = _fake_completion('使用者最近工作壓力大')
+        with patch('api.services.llm_client.get_openai_client', return_value=client):
+            self.assertFalse(refresh_summary_if_due(self.session))  # only 2 messages outside window
+            self._add(1)
+            self.assertTrue(refresh_summary_if_due(self.session))
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.summary, '使用者最近工作壓力大')
+        prompt = client.chat.completions.create.call_args.kwargs['messages'][1]['content']
+        self.assertIn('message 0', prompt)
+        self.assertNotIn('message 3', prompt)
+        messages = _build_messages(load_context(self.session), 'en', self.session.summary)
+        self.assertIn('使用者最近工作壓力大', messages[1]['content'])
+
+    @override_settings(AI_CHAT_SUMMARY_MAX_BATCHES=1)
+    def test_each_refresh_folds_a_bounded_batch(self):
+        from unittest.mock import MagicMock, patch
+        from api.services.ai_chat import refresh_summary_if_due
+        self._add(13)  # 9 messages outside the window of 4
+        ids = list(self.session.messages.order_by('id').values_list('id', flat=True))
+        client = MagicMock()
+        client.chat.completions.create.return_value = _fake_completion('摘要')
+        through = []
+        with patch('api.services.llm_client.get_openai_client', return_value=client):
+            while refresh_summary_if_due(self.session):
+                through.append(self.session.summarized_through)
+        self.assertEqual(through, [ids[2], ids[5], ids[8]])
+        prompt = client.chat.completions.create.call_args_list[0].kwargs['messages'][1]['content']
+        self.assertIn('message 2', prompt)
+        self.assertNotIn('message 3', prompt)
+
+    @override_settings(NOTE_ANALYSIS_ASYNC=False, CHAT_SUMMARY_ASYNC=True)
+    def test_summary_refresh_runs_in_the_job_worker(self):
+        from unittest.mock import MagicMock, patch
+        from api.models import AIChatSummaryJob
+        from api.services.analysis_queue import claim_next_job, enqueue_summary, run_summary_job
+        self._add(6)
+        self.assertIsNone(enqueue_summary(self.session))
+        self._add(4)
+        job = enqueue_summary(self.session)
+        self.assertEqual(enqueue_summary(self.session), job)
+        # Queued even with note analysis inline: the chat turn never waits on the summary
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.summary, '')
+        client = MagicMock()
+        client.chat.completions.create.return_value = _fake_completion('使用者最近工作壓力大')
+        with patch('api.services.llm_client.get_openai_client', return_value=client):
+            job = run_summary_job(claim_next_job(AIChatSummaryJob))
+        self.assertEqual(job.status, 'done')
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.summary, '使用者最近工作壓力大')
+        self.assertIsNone(claim_next_job(AIChatSummaryJob))
+
+
+# ===== Denormalized AI chat session counters =====
+
+class AIChatSessionCounterTests(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='counteruser', password='pass1234')
+        self.client.force_authenticate(user=self.user)
+        self.session = AIChatSession.objects.create(user=self.user)
+
+    def test_message_writes_maintain_counters(self):
+        AIChatMessage.objects.create(session=self.session, role='user', content='第一則訊息')
+        last = AIChatMessage.objects.create(session=self.session, role='assistant', content='x' * 100)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.message_count, 2)
+        self.assertEqual(self.session.last_message_preview, 'x' * 80)
+        self.assertEqual(self.session.last_message_at, last.created_at)
+        last.delete()
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.message_count, 1)
+        self.assertEqual(self.session.last_message_preview, '第一則訊息')
+
+    def test_first_message_sets_title(self):
+        from api.services.ai_chat import save_user_message
+        save_user_message(self.session, '今天想聊聊工作')
+        save_user_message(self.session, '第二句')
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.title, '今天想聊聊工作')
+        self.assertEqual(self.session.message_count, 2)
+
+    def test_session_list_is_a_single_query(self):
+        for i in range(3):
+            session = AIChatSession.objects.create(user=self.user, title=f'S{i}')
+            AIChatMessage.objects.create(session=session, role='user', content=f'hello {i}')
+        self.client.get('/api/ai-chat/sessions/')  # warm auth/throttle lookups
+        with self.assertNumQueries(1):
+            resp = self.client.get('/api/ai-chat/sessions/')
+        previews = {s['title']: s['last_message_preview'] for s in resp.data}
+        self.assertEqual(previews['S1'], 'hello 1')
+        self.assertIsNone(previews['New Chat'])
+
+
+# ===== Bulk decryption and plaintext memoization =====
+
+class BulkDecryptionTests(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='decryptuser', password='pass1234')
+
+    def test_decrypt_many_matches_decrypt_and_keeps_order(self):
+        from api.services.encryption import encryption_service
+        tokens = [encryption_service.encrypt(t) for t in ('一', '二', '三')]
+        tokens.append(tokens[0])
+        expected = ['一', '二', '三', '一']
+        self.assertEqual(encryption_service.decrypt_many(tokens), expected)
+        self.assertEqual(encryption_service.decrypt_many(tokens, workers=3), expected)
+        self.assertEqual(encryption_service.decrypt_many(['', tokens[1]]), ['', '二'])
+
+    def test_content_is_memoized_until_set_content(self):
+        from unittest.mock import patch
+        from api.services.encryption import EncryptionService
+        note = MoodNote(user=self.user)
+        note.set_content('原本的內容')
+        note.save()
+        note = MoodNote.objects.get(pk=note.pk)
+        with patch.object(EncryptionService, 'decrypt', autospec=True, side_effect=lambda self, c, user_id=None: '原本的內容') as dec:
+            note.content
+            note.content
+        self.assertEqual(dec.call_count, 1)
+        note.set_content('新的內容')
+        self.assertEqual(note.content, '新的內容')
+        note.save()
+        self.assertEqual(note.content, '新的內容')
+
+    def test_prefetch_content_decrypts_in_one_batch(self):
+        from unittest.mock import patch
+        from api.services.encryption import EncryptionService
+        for text in ('a', 'b', 'c'):
+            make_note(self.user, text)
+        notes = list(MoodNote.objects.filter(user=self.user).order_by('pk'))
+        with patch.object(EncryptionService, 'decrypt_many', autospec=True,
+                          side_effect=lambda self, tokens, **kw: ['x'] * len(tokens)) as bulk:
+            MoodNote.prefetch_content(notes)
+            self.assertEqual([n.content for n in notes], ['x', 'x', 'x'])
+        self.assertEqual(bulk.call_count, 1)
+
+
+# ===== Encryption key rotation =====
+
+class RotateEncryptionCommandTests(APITestCase):
+    def setUp(self):
+        import tempfile
+        from cryptography.fernet import Fernet, MultiFernet
+        from api.services.encryption import encryption_service
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.checkpoint = f'{tmp.name}/rotate.json'
+
+        self.svc = encryption_service
+        saved = (self.svc._fernets, self.svc._multi, self.svc._primary)
+        self.addCleanup(self._restore, saved)
+        self.old_key = self.svc._primary
+        self.new_key = Fernet(Fernet.generate_key())
+
+        self.user = CustomUser.objects.create_user(username='rotateuser', password='pass1234')
+        self.notes = []
+        # Legacy rows, encrypted directly under the master key
+        with self.settings(ENVELOPE_ENCRYPTION=False):
+            for text in ('舊的日記一', '舊的日記二', '舊的日記三'):
+                self.notes.append(make_note(self.user, text))
+        # New primary key in front; existing rows are still under the old (now retired) key
+        self.svc._fernets = [self.new_key, self.old_key]
+        self.svc._multi = MultiFernet(self.svc._fernets)
+        self.svc._primary = self.new_key
+
+    def _restore(self, saved):
+        self.svc._fernets, self.svc._multi, self.svc._primary = saved
+
+    def _run(self, *args):
+        from django.core.management import call_command
+        out = io.StringIO()
+        call_command(
+            'rotate_encryption', '--batch-size', '2', '--sleep', '0',
+            '--checkpoint', self.checkpoint, *args, stdout=out,
+        )
+        return out.getvalue()
+
+    def test_report_counts_rows_per_key_without_writing(self):
+        out = self._run('--report')
+        self.assertIn('key 1 (retired): 3 rows found, 3 remaining', out)
+        token = MoodNote.objects.get(pk=self.notes[0].pk).ciphertext
+        self.assertEqual(self.svc.key_index(token), 1)
+
+    def test_rotation_moves_rows_to_primary_key(self):
+        out = self._run()
+        self.assertIn('Rotated 3 of 3 rows', out)
+        for note, text in zip(self.notes, ('舊的日記一', '舊的日記二', '舊的日記三')):
+            stored = MoodNote.objects.get(pk=note.pk)
+            self.assertEqual(self.svc.key_index(stored.ciphertext), 0)
+            self.assertEqual(stored.content, text)
+        out = self._run('--restart')
+        self.assertIn('Rotated 0 of 3 rows', out)
+
+    def test_envelope_moves_legacy_rows_onto_user_data_key(self):
+        out = self._run('--envelope')
+        self.assertIn('Rotated 3 of 3 rows', out)
+        stored = MoodNote.objects.get(pk=self.notes[0].pk)
+        self.assertTrue(self.svc.is_envelope(stored.ciphertext))
+        self.assertEqual(stored.content, '舊的日記一')
+
+    def test_rewraps_data_keys_without_touching_envelope_rows(self):
+        from cryptography.fernet import MultiFernet
+        self.svc.clear_data_key_cache()
+        self.addCleanup(self.svc.clear_data_key_cache)
+        # Data key created while the old key was still primary
+        self.svc._fernets = [self.old_key]
+        self.svc._multi = MultiFernet(self.svc._fernets)
+        self.svc._primary = self.old_key
+        note = make_note(self.user, '信封加密')
+        token = note.ciphertext
+        self.svc._fernets = [self.new_key, self.old_key]
+        self.svc._multi = MultiFernet(self.svc._fernets)
+        self.svc._primary = self.new_key
+
+        out = self._run()
+        self.assertIn('Data keys: 1 users, 1 rewrapped', out)
+        self.assertIn('1 rows under per-user data keys', out)
+        self.user.refresh_from_db()
+        self.assertEqual(self.svc.key_index(self.user.wrapped_data_key), 0)
+        stored = MoodNote.objects.get(pk=note.pk)
+        self.assertEqual(stored.ciphertext, token)
+        self.svc.clear_data_key_cache()
+        self.assertEqual(stored.content, '信封加密')
+
+
+class EnvelopeEncryptionTests(APITestCase):
+    def setUp(self):
+        from api.services.encryption import encryption_service
+        self.svc = encryption_service
+        self.svc.clear_data_key_cache()
+        self.addCleanup(self.svc.clear_data_key_cache)
+        self.alice = CustomUser.objects.create_user(username='alice_env', password='pass1234')
+        self.bob = CustomUser.objects.create_user(username='bob_env', password='pass1234')
+
+    def test_note_encrypted_under_per_user_data_key(self):
+        note = make_note(self.alice, '今天很平靜')
+        self.assertTrue(self.svc.is_envelope(note.ciphertext))
+        self.alice.refresh_from_db()
+        self.assertTrue(self.alice.wrapped_data_key)
+        self.svc.clear_data_key_cache()
+        self.assertEqual(MoodNote.objects.get(pk=note.pk).content, '今天很平靜')
+        # Another user's key cannot open it
+        self.assertEqual(self.svc.decrypt(note.ciphertext, user_id=self.bob.pk), '[Decryption failed]')
+
+    def test_data_key_created_once_and_cached(self):
+        make_note(self.alice, 'a')
+        self.alice.refresh_from_db()
+        wrapped = self.alice.wrapped_data_key
+        make_note(self.alice, 'b')
+        self.alice.refresh_from_db()
+        self.assertEqual(self.alice.wrapped_data_key, wrapped)
+        with self.assertNumQueries(0):
+            self.svc.data_key(self.alice.pk)
+
+    def test_legacy_master_key_rows_still_readable(self):
+        with self.settings(ENVELOPE_ENCRYPTION=False):
+            note = make_note(self.alice, '舊格式')
+        self.assertFalse(self.svc.is_envelope(note.ciphertext))
+        self.assertEqual(MoodNote.objects.get(pk=note.pk).content, '舊格式')
+
+    def test_decrypt_many_mixes_users(self):
+        notes = [make_note(self.alice, 'A'), make_note(self.bob, 'B')]
+        self.svc.clear_data_key_cache()
+        fresh = list(MoodNote.objects.filter(pk__in=[n.pk for n in notes]).order_by('pk'))
+        MoodNote.prefetch_content(fresh)
+        self.assertEqual([n.content for n in fresh], ['A', 'B'])
+
+    def test_destroy_data_key_shreds_content(self):
+        note = make_note(self.alice, '秘密')
+        self.svc.destroy_data_key(self.alice.pk)
+        self.assertEqual(MoodNote.objects.get(pk=note.pk).content, '[Decryption failed]')
+
+
+class BinaryCiphertextFormatTests(APITestCase):
+    def setUp(self):
+        from api.services.encryption import encryption_service
+        self.svc = encryption_service
+        self.user = CustomUser.objects.create_user(username='blobuser', password='pass1234')
+
+    def test_long_note_is_compressed_and_smaller_than_text_token(self):
+        text = '今天的心情還不錯，和朋友去散步。' * 60
+        note = make_note(self.user, text)
+        stored = MoodNote.objects.get(pk=note.pk)
+        self.assertEqual(stored.encrypted_content, '')
+        blob = stored.ciphertext
+        self.assertEqual(blob[0], self.svc.BINARY_FORMAT_V1)
+        self.assertTrue(blob[1] & self.svc.FLAG_ZLIB)
+        self.assertLess(len(blob), len(self.svc.encrypt(text)))
+        self.assertEqual(stored.content, text)
+
+    def test_short_note_not_compressed(self):
+        blob = self.svc.encrypt_binary('短')
+        self.assertFalse(blob[1] & self.svc.FLAG_ZLIB)
+        self.assertEqual(self.svc.decrypt(blob), '短')
+
+    def _restore(self, saved):
+        self.svc._fernets, self.svc._multi, self.svc._primary = saved
+
+    def test_round_trip_compressed_envelope_rotate_and_key_index(self):
+        from cryptography.fernet import Fernet, MultiFernet
+        text = '壓力有點大，但和家人吃飯很開心。' * 40
+        master = self.svc.encrypt_binary(text)
+        envelope = self.svc.encrypt_binary(text, user_id=self.user.pk)
+        self.assertEqual((master[0], master[1]), (self.svc.BINARY_FORMAT_V1, self.svc.FLAG_ZLIB))
+        self.assertEqual(envelope[1], self.svc.FLAG_ZLIB | self.svc.FLAG_ENVELOPE)
+        self.assertTrue(self.svc.is_envelope(envelope))
+        self.assertFalse(self.svc.is_envelope(master))
+        self.assertEqual(self.svc.decrypt(master), text)
+        self.assertEqual(self.svc.decrypt(envelope, user_id=self.user.pk), text)
+        self.assertEqual(self.svc.key_index(master), 0)
+        self.assertIsNone(self.svc.key_index(envelope))
+
+        saved = (self.svc._fernets, self.svc._multi, self.svc._primary)
+        self.addCleanup(self._restore, saved)
+        new_key = Fernet(Fernet.generate_key())
+        self.svc._fernets = [new_key, saved[2]]
+        self.svc._multi = MultiFernet(self.svc._fernets)
+        self.svc._primary = new_key
+        self.assertEqual(self.svc.key_index(master), 1)
+        rotated = self.svc.rotate(master)
+        self.assertEqual(rotated[:2], master[:2])
+        self.assertEqual(self.svc.key_index(rotated), 0)
+        self.assertEqual(self.svc.decrypt(rotated), text)
+
+    def test_unknown_format_byte_fails_cleanly(self):
+        blob = bytearray(self.svc.encrypt_binary('x'))
+        blob[0] = 99
+        self.assertEqual(self.svc.decrypt(bytes(blob)), '[Decryption failed]')
+
+    def test_compact_command_converts_legacy_rows(self):
+        from django.core.management import call_command
+        text = '很長的日記內容。' * 100
+        with self.settings(NOTE_CIPHERTEXT_FORMAT='text'):
+            legacy = [make_note(self.user, text), make_note(self.user, 'short')]
+        self.assertTrue(all(n.encrypted_blob is None for n in legacy))
+
+        out = io.StringIO()
+        call_command('compact_note_ciphertexts', '--report', '--sleep', '0', stdout=out)
+        self.assertIn('would take', out.getvalue())
+        self.assertIsNone(MoodNote.objects.get(pk=legacy[0].pk).encrypted_blob)
+
+        out = io.StringIO()
+        call_command('compact_note_ciphertexts', '--batch-size', '1', '--sleep', '0', stdout=out)
+        self.assertIn('Converted 2 of 2 rows', out.getvalue())
+        stored = MoodNote.objects.get(pk=legacy[0].pk)
+        self.assertEqual(stored.encrypted_content, '')
+        self.assertTrue(self.svc.is_envelope(stored.ciphertext))
+        self.assertEqual(stored.content, text)
+        self.assertEqual(MoodNote.objects.get(pk=legacy[1].pk).content, 'short')
+
+
+class BlindSearchIndexTests(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='searcher', password='pass1234')
+        self.other = CustomUser.objects.create_user(username='other_searcher', password='pass1234')
+        self.client.force_authenticate(user=self.user)
+
+    def _search(self, query):
+        resp = self.client.get('/api/notes/', {'search': query})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        results = resp.data['results'] if isinstance(resp.data, dict) else resp.data
+        return {r['id'] for r in results}
+
+    def test_matches_text_beyond_first_500_chars(self):
+        note = make_note(self.user, '平凡的一天。' * 100 + '最後終於放下了焦慮')
+        make_note(self.user, '今天天氣很好')
+        self.assertEqual(self._search('放下了焦慮'), {note.pk})
+
+    def test_terms_are_anded_and_latin_is_case_insensitive(self):
+        both = make_note(self.user, 'Went running, 心情很好')
+        make_note(self.user, 'Went running alone')
+        self.assertEqual(self._search('RUNNING 心情'), {both.pk})
+
+    def test_hashes_are_per_user_and_updated_on_edit(self):
+        from api.models import NoteSearchToken
+        mine = make_note(self.user, '失眠')
+        theirs = make_note(self.other, '失眠')
+        mine_hashes = set(NoteSearchToken.objects.filter(note=mine).values_list('token_hash', flat=True))
+        theirs_hashes = set(NoteSearchToken.objects.filter(note=theirs).values_list('token_hash', flat=True))
+        self.assertFalse(mine_hashes & theirs_hashes)
+        self.assertEqual(self._search('失眠'), {mine.pk})
+
+        mine.set_content('睡得很好')
+        mine.save()
+        self.assertEqual(self._search('失眠'), set())
+        self.assertEqual(self._search('睡得'), {mine.pk})
+
+    def test_build_search_index_backfills(self):
+        from django.core.management import call_command
+        from api.models import NoteSearchToken
+        note = make_note(self.user, '平凡的一天。' * 100 + '運動後放鬆')
+        NoteSearchToken.objects.all().delete()
+        # Unindexed notes fall back to search_text, which stops at 500 chars
+        self.assertEqual(self._search('放鬆'), set())
+        call_command('build_search_index', stdout=io.StringIO())
+        self.assertEqual(self._search('放鬆'), {note.pk})
+
+    def test_unindexed_notes_match_on_search_text(self):
+        from django.core.management import call_command
+        from api.models import NoteSearchToken
+        indexed = make_note(self.user, '散步後放鬆')
+        legacy = make_note(self.user, '聽音樂放鬆')
+        make_note(self.user, '今天很忙')
+        NoteSearchToken.objects.filter(note=legacy).delete()
+        self.assertEqual(self._search('放鬆'), {indexed.pk, legacy.pk})
+
+        out = io.StringIO()
+        call_command('build_search_index', '--missing', stdout=out)
+        self.assertIn('Indexed 1 notes', out.getvalue())
+        self.assertTrue(NoteSearchToken.objects.filter(note=legacy).exists())
+
+
+class SearchBackendTests(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='fts_user', password='pass1234')
+        self.client.force_authenticate(user=self.user)
+
+    def test_snippet_offsets(self):
+        from api.services.search_backends import snippet_offsets
+        result = snippet_offsets('I was Happy, so happy today', 'happy')
+        self.assertEqual(result['offsets'], [[6, 11], [16, 21]])
+
+    def test_native_backend_ranks_and_returns_snippets(self):
+        from django.db import connection
+        from api.services import search_backends
+        if connection.vendor != 'sqlite' or not search_backends._sqlite_fts_available():
+            self.skipTest('FTS5 trigram tokenizer not available')
+        # The weaker match is newer, so recency order and relevance order disagree
+        strong = make_note(self.user, '睡不著')
+        weak = make_note(self.user, '今天下午去了公園散步，晚上有點睡不著，後來聽音樂就好了')
+        make_note(self.user, '睡得很好')
+        with self.settings(NOTE_SEARCH_BACKEND='native'):
+            resp = self.client.get('/api/notes/', {'search': '睡不著'})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        results = resp.data['results']
+        self.assertEqual({r['id'] for r in results}, {weak.pk, strong.pk})
+        self.assertTrue(all(r['search_rank'] > 0 for r in results))
+        self.assertEqual([r['id'] for r in results], [strong.pk, weak.pk])
+        self.assertGreater(results[0]['search_rank'], results[1]['search_rank'])
+        # Paging one row at a time keeps relevance order across cursors
+        with self.settings(NOTE_SEARCH_BACKEND='native'):
+            first_page = self.client.get('/api/notes/', {'search': '睡不著', 'page_size': 1})
+            second_page = self.client.get(first_page.data['next'])
+        self.assertEqual(
+            [first_page.data['results'][0]['id'], second_page.data['results'][0]['id']],
+            [r['id'] for r in results],
+        )
+        self.assertIsNone(second_page.data['next'])
+        first = results[0]['search_snippet']
+        start, end = first['offsets'][0]
+        self.assertEqual(first['snippet'][start:end], '睡不著')
+
+    def test_postgres_backend_filters_with_indexable_ilike(self):
+        from api.services.search_backends import PostgresTrigramSearchBackend
+        qs = PostgresTrigramSearchBackend().search(MoodNote.objects.all(), self.user.pk, '50%_off')
+        sql, params = qs.query.sql_with_params()
+        # The trigram GIN index is on the raw column; UPPER(search_text) would bypass it
+        self.assertIn('"search_text" ILIKE %s', sql)
+        self.assertNotIn('UPPER(', sql)
+        self.assertIn('%50\\%\\_off%', params)
+
+    def test_native_short_query_falls_back_to_like(self):
+        note = make_note(self.user, '好累')
+        with self.settings(NOTE_SEARCH_BACKEND='native'):
+            resp = self.client.get('/api/notes/', {'search': '累'})
+        self.assertEqual([r['id'] for r in resp.data['results']], [note.pk])
+
+    def test_list_without_search_has_no_search_fields(self):
+        make_note(self.user, 'hello')
+        resp = self.client.get('/api/notes/')
+        self.assertNotIn('search_rank', resp.data['results'][0])
+
+
+class KeysetPaginationTests(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='pager', password='pass1234')
+        self.client.force_authenticate(user=self.user)
+        from api.services.rollups import create_notes
+        base = timezone.now()
+        self.notes = create_notes([
+            MoodNote(user=self.user, encrypted_content='x', search_text=f'note {i}', is_pinned=i in (3, 17))
+            for i in range(45)
+        ])
+        # Several rows share a timestamp so the id tiebreak is exercised
+        for i, note in enumerate(self.notes):
+            MoodNote.objects.filter(pk=note.pk).update(created_at=base - timedelta(minutes=i // 3))
+
+    def _walk(self, url):
+        ids, pages = [], 0
+        while url:
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            ids += [r['id'] for r in resp.data['results']]
+            url = resp.data['next']
+            pages += 1
+        return ids, pages
+
+    def test_walks_notes_in_feed_order_without_gaps(self):
+        ids, pages = self._walk('/api/notes/')
+        expected = list(
+            MoodNote.objects.filter(user=self.user)
+            .order_by('-is_pinned', '-created_at', '-id').values_list('id', flat=True)
+        )
+        self.assertEqual(ids, expected)
+        self.assertEqual(pages, 3)
+        # Pinned notes first, newest first: note 3 is 1 minute old, note 17 is 5 minutes old
+        self.assertEqual(ids[:2], [self.notes[3].pk, self.notes[17].pk])
+
+    def test_count_is_opt_in(self):
+        resp = self.client.get('/api/notes/')
+        self.assertNotIn('count', resp.data)
+        resp = self.client.get('/api/notes/', {'count': 1, 'page_size': 10})
+        self.assertEqual(resp.data['count'], 45)
+        self.assertEqual(len(resp.data['results']), 10)
+
+    def test_invalid_cursor_is_404(self):
+        resp = self.client.get('/api/notes/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_trash_pages_by_deletion_time(self):
+        now = timezone.now()
+        for i, note in enumerate(self.notes[:30]):
+            MoodNote.objects.filter(pk=note.pk).update(is_deleted=True, deleted_at=now - timedelta(seconds=i))
+        ids, pages = self._walk('/api/notes/trash/')
+        self.assertEqual(ids, [n.pk for n in self.notes[:30]])
+        self.assertEqual(pages, 1)
+        self.assertEqual(len(self._walk('/api/notes/trash/?page_size=7')[0]), 30)
+
+    def test_trash_pages_past_notes_without_deleted_at(self):
+        MoodNote.objects.filter(pk__in=[n.pk for n in self.notes[:10]]).update(is_deleted=True)
+        MoodNote.objects.filter(pk__in=[n.pk for n in self.notes[:4]]).update(deleted_at=None)
+        ids, _ = self._walk('/api/notes/trash/?page_size=3')
+        self.assertEqual(sorted(ids), sorted(n.pk for n in self.notes[:10]))
+
+
+class NoteTagTests(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='tagger', password='pass1234')
+        self.client.force_authenticate(user=self.user)
+
+    def _tags(self, note):
+        from api.models import NoteTag
+        return set(NoteTag.objects.filter(note=note).values_list('tag', flat=True))
+
+    def test_tags_follow_edit_delete_and_restore(self):
+        note = make_note(self.user, 'a', metadata={'tags': ['工作', ' 運動 ', '']})
+        self.assertEqual(self._tags(note), {'工作', '運動'})
+
+        resp = self.client.patch(f'/api/notes/{note.pk}/', {'metadata': {'tags': ['家人']}}, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(self._tags(note), {'家人'})
+
+        self.client.delete(f'/api/notes/{note.pk}/')
+        self.assertEqual(self._tags(note), set())
+        self.client.post(f'/api/notes/{note.pk}/restore/')
+        self.assertEqual(self._tags(note), {'家人'})
+
+        self.client.post('/api/notes/batch_delete/', {'ids': [note.pk]}, format='json')
+        self.assertEqual(self._tags(note), set())
+
+    def test_tag_filter_and_aggregates(self):
+        from api.services.analytics import get_frequent_tags, get_stress_by_tag
+        from api.services.achievements import _get_distinct_tag_count
+        work = make_note(self.user, 'a', metadata={'tags': ['工作', '加班']}, stress_index=8)
+        make_note(self.user, 'b', metadata={'tags': ['工作']}, stress_index=6)
+        make_note(self.user, 'c', metadata={'tags': ['運動']}, stress_index=2)
+
+        resp = self.client.get('/api/notes/', {'tag': '加班'})
+        self.assertEqual([r['id'] for r in resp.data['results']], [work.pk])
+
+        qs = MoodNote.objects.filter(user=self.user, is_deleted=False)
+        self.assertEqual(get_frequent_tags(qs)[0], {'name': '工作', 'count': 2})
+        stress = {row['tag']: row for row in get_stress_by_tag(qs)}
+        self.assertEqual(stress['工作'], {'tag': '工作', 'avg_stress': 7.0, 'count': 2})
+        self.assertEqual(_get_distinct_tag_count(self.user), 3)
+
+    def test_autocomplete(self):
+        make_note(self.user, 'a', metadata={'tags': ['work', 'walk']})
+        make_note(self.user, 'b', metadata={'tags': ['work']})
+        resp = self.client.get('/api/notes/tags/', {'q': 'W'})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.data, [{'tag': 'work', 'count': 2}, {'tag': 'walk', 'count': 1}])
+
+
+class LocalDateTests(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='tzuser', password='pass1234')
+        self.client.force_authenticate(user=self.user)
+
+    def _note_at(self, when, score=0.5):
+        from unittest.mock import patch
+        with patch('django.utils.timezone.now', return_value=when):
+            return make_note(self.user, sentiment_score=score)
+
+    def test_local_date_follows_user_timezone(self):
+        # 2026-03-01 20:00 UTC is already 2026-03-02 in Taipei and still 2026-03-01 in New York
+        from datetime import datetime, timezone as dt_timezone
+        when = datetime(2026, 3, 1, 20, 0, tzinfo=dt_timezone.utc)
+        self.assertEqual(str(self._note_at(when).local_date), '2026-03-02')
+        self.user.timezone = 'America/New_York'
+        self.user.save(update_fields=['timezone'])
+        self.assertEqual(str(self._note_at(when).local_date), '2026-03-01')
+
+        resp = self.client.get('/api/analytics/calendar/?year=2026&month=3')
+        self.assertEqual([d['date'] for d in resp.data['days']], ['2026-03-01', '2026-03-02'])
+        resp = self.client.get('/api/analytics/year-pixels/?year=2026')
+        self.assertEqual(set(resp.data['pixels']), {'2026-03-01', '2026-03-02'})
+
+    def test_streak_uses_local_date(self):
+        self.user.timezone = 'Pacific/Kiritimati'
+        self.user.save(update_fields=['timezone'])
+        now = timezone.now()
+        for days in (0, 1, 2):
+            self._note_at(now - timedelta(days=days))
+        resp = self.client.get('/api/analytics/')
+        self.assertEqual(resp.data['current_streak'], 3)
+        self.assertEqual(resp.data['longest_streak'], 3)
+
+    def test_profile_timezone_validation(self):
+        resp = self.client.patch('/api/auth/profile/', {'timezone': 'Mars/Olympus'}, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.client.patch('/api/auth/profile/', {'timezone': 'Europe/Berlin'}, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.data['timezone'], 'Europe/Berlin')
+
+
+class MoodDailyRollupTests(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='rollup', password='pass1234')
+        self.client.force_authenticate(user=self.user)
+
+    def _rollup(self):
+        from api.models import MoodDailyRollup
+        row = MoodDailyRollup.objects.filter(user=self.user).first()
+        if row is None:
+            return None
+        return (row.count, round(row.sentiment_sum, 6), row.sentiment_n, row.stress_sum, row.stress_n,
+                row.tag_counts, row.activity_counts)
+
+    def test_rollup_follows_note_lifecycle(self):
+        a = make_note(
+            self.user, sentiment_score=0.5, stress_index=4, metadata={'tags': ['work'], 'activities': ['run']},
+        )
+        b = make_note(self.user, sentiment_score=-0.25, metadata={'tags': ['work', 'family']})
+        self.assertEqual(self._rollup(), (2, 0.25, 2, 4, 1, {'work': 2, 'family': 1}, {'run': 1}))
+
+        b.sentiment_score, b.stress_index = 0.75, 6
+        b.save(update_fields=['sentiment_score', 'stress_index'])
+        self.assertEqual(self._rollup(), (2, 1.25, 2, 10, 2, {'work': 2, 'family': 1}, {'run': 1}))
+
+        self.client.delete(f'/api/notes/{b.pk}/')
+        self.assertEqual(self._rollup(), (1, 0.5, 1, 4, 1, {'work': 1}, {'run': 1}))
+        self.client.post(f'/api/notes/{b.pk}/restore/')
+        self.assertEqual(self._rollup()[:3], (2, 1.25, 2))
+
+        self.client.post('/api/notes/batch_delete/', {'ids': [a.pk, b.pk]}, format='json')
+        self.assertIsNone(self._rollup())
+        self.client.post(f'/api/notes/{a.pk}/restore/')
+        self.client.delete(f'/api/notes/{b.pk}/permanent-delete/')
+        self.assertEqual(self._rollup(), (1, 0.5, 1, 4, 1, {'work': 1}, {'run': 1}))
+
+    def test_rebuild_matches_incremental(self):
+        from django.core.management import call_command
+        make_note(self.user, sentiment_score=0.5, stress_index=3, metadata={'tags': ['a']})
+        make_note(self.user, stress_index=7, metadata={'activities': ['walk', 'read']})
+        before = self._rollup()
+        from api.models import MoodDailyRollup
+        MoodDailyRollup.objects.all().delete()
+        call_command('rebuild_mood_rollups', stdout=io.StringIO())
+        self.assertEqual(self._rollup(), before)
+
+    def test_endpoints_read_rollups(self):
+        make_note(self.user, sentiment_score=0.5, stress_index=2)
+        make_note(self.user, sentiment_score=0.25, stress_index=4)
+        today = self.user.localdate()
+        resp = self.client.get(f'/api/analytics/calendar/?year={today.year}&month={today.month}')
+        self.assertEqual(resp.data['days'], [{'date': str(today), 'avg_sentiment': 0.38, 'count': 2}])
+        resp = self.client.get('/api/analytics/?period=week&lookback_days=7')
+        self.assertEqual(resp.data['mood_trends'][0]['count'], 2)
+        self.assertEqual(resp.data['mood_trends'][0]['avg_stress'], 3.0)
+        self.assertEqual(resp.data['current_streak'], 1)
+
+    def test_bulk_created_notes_get_local_date_and_rollups(self):
+        from api.services.rollups import create_notes
+        notes = create_notes([
+            MoodNote(user=self.user, encrypted_content='x', sentiment_score=score, stress_index=2)
+            for score in (0.5, 0.25, None)
+        ])
+        today = self.user.localdate()
+        self.assertEqual({n.local_date for n in MoodNote.objects.filter(pk__in=[n.pk for n in notes])}, {today})
+        self.assertEqual(self._rollup()[:5], (3, 0.75, 2, 4, 2))
+        resp = self.client.get(f'/api/analytics/calendar/?year={today.year}&month={today.month}')
+        self.assertEqual(resp.data['days'], [{'date': str(today), 'avg_sentiment': 0.38, 'count': 2}])
+
+    def test_trend_stress_averages_scored_notes_only(self):
+        make_note(self.user, sentiment_score=0.5, stress_index=2)
+        make_note(self.user, stress_index=8)
+        resp = self.client.get('/api/analytics/?period=week&lookback_days=7')
+        self.assertEqual(resp.data['mood_trends'][0]['count'], 1)
+        self.assertEqual(resp.data['mood_trends'][0]['avg_stress'], 2.0)
+
+    def test_note_edit_drops_the_calendar_month_of_its_local_date(self):
+        import datetime
+        from django.core.cache import cache
+        from api.services.rollups import update_notes
+        note = make_note(self.user, sentiment_score=0.5, stress_index=2)
+        update_notes(MoodNote.objects.filter(pk=note.pk), local_date=datetime.date(2025, 1, 15))
+        resp = self.client.get('/api/analytics/calendar/?year=2025&month=1')
+        self.assertEqual(resp.data['days'][0]['count'], 1)
+        self.assertIsNotNone(cache.get(f'calendar_{self.user.pk}_2025_1'))
+
+        self.client.patch(f'/api/notes/{note.pk}/', {'metadata': {'tags': ['old']}}, format='json')
+        self.assertIsNone(cache.get(f'calendar_{self.user.pk}_2025_1'))
+
+
+class AnalyticsKernelTests(APITestCase):
+    def test_pearsonr_matches_scipy(self):
+        from api.services.analytics_kernels import pearsonr
+        # scipy.stats.pearsonr([1, 2, 3, 4, 5], [5, 6, 7, 8, 7]) -> (0.8320502943378437, 0.0805095732984996)
+        r, p = pearsonr([1, 2, 3, 4, 5], [5, 6, 7, 8, 7])
+        self.assertAlmostEqual(r, 0.8320502943378437, places=12)
+        self.assertAlmostEqual(p, 0.0805095732984996, places=12)
+        r, p = pearsonr([1, 1, 1], [1, 2, 3])
+        self.assertNotEqual(r, r)
+        self.assertNotEqual(p, p)
+
+    def test_cut_codes_match_pandas(self):
+        from api.services.analytics_kernels import binned_counts, cut_codes
+        # pd.cut(..., bins=5, labels=False) uses right-closed bins with the lowest edge nudged down
+        self.assertEqual(cut_codes([0, 1, 2, 3, 4, 10]), [0, 0, 0, 1, 1, 4])
+        self.assertEqual(cut_codes([3, 3]), [2, 2])
+        self.assertEqual(binned_counts([0, 0, 10], [1, 1, -1]), [(0, 4, 2), (4, 0, 1)])
+
+    def test_weather_correlation_without_pandas(self):
+        from api.services.analytics import get_mood_weather_correlation
+        user = CustomUser.objects.create_user(username='weather', password='pass1234')
+        for score, temp in ((0.1, 10), (0.3, 20), (0.5, 30), (0.2, 15)):
+            make_note(user, sentiment_score=score, metadata={'temperature': temp})
+        result = get_mood_weather_correlation(MoodNote.objects.filter(user=user))
+        self.assertEqual(result['sample_size'], 4)
+        self.assertEqual(result['correlation'], 1.0)
+        self.assertEqual(sum(cell['count'] for cell in result['heatmap']), 4)
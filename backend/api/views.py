@@ -17,6 +17,7 @@ from django.utils.encoding import force_bytes, force_str
 from django.utils.html import strip_tags
 from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
 from django.db.models import Prefetch
+from django.db.models.functions import Coalesce
 import rest_framework.pagination
 import rest_framework.throttling
 from rest_framework import generics, viewsets, permissions, status, filters, exceptions
@@ -31,10 +32,11 @@ from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from .models import (
     AIChatMessage, AIChatSession,
     Booking, Conversation, Course, CounselorProfile, DailySleep, Feedback,
-    Message, MoodNote, NoteAttachment, Notification, PsychoArticle,
+    Message, MoodNote, NoteAttachment, NoteTag, Notification, PsychoArticle,
     SelfAssessment, SharedAssessment, SharedNote, TherapistReport, TimeSlot,
     UserAchievement, UserLessonProgress, WeeklySummary, WellnessSession,
 )
+from .pagination import KeysetPagination
 from .serializers import (
     AIChatMessageSerializer,
     AIChatSessionSerializer,
@@ -70,10 +72,16 @@ from .services.analytics import (
     get_activity_mood_correlation, get_calendar_data, get_frequent_tags,
     get_gratitude_stats, get_mood_trends, get_mood_weather_correlation,
     get_sleep_mood_correlation, get_stress_by_tag, get_year_pixels,
+    invalidate_user_cache,
 )
+from .services.ai_chat import MAX_AI_CHAT_MESSAGE_LENGTH
 from .services.alerts import check_mood_alerts
 from .services.audit import log_action
+from .services.circuit_breaker import breaker_metrics, llm_guard
+from .services.encryption import encryption_service
+from .services.llm_client import get_openai_client
 from .services.pdf_export import generate_notes_pdf, generate_weekly_summary_pdf
+from .services.rollups import active_dates, daily_rows, summarize, update_notes
 from .services.search import search_notes
 from .throttles import (
     AIChatThrottle, BookingThrottle, DeleteAccountThrottle, ExportThrottle,
@@ -96,29 +104,12 @@ def error_response(code, fallback, status_code=400):
 # ===== Constants =====
 MAX_BATCH_DELETE = 50
 MAX_MESSAGE_LENGTH = 5000
-MAX_AI_CHAT_MESSAGE_LENGTH = 2000
 MAX_EXPORT_NOTES = 5000
 CACHE_TTL_ANALYTICS = 300       # 5 minutes
 CACHE_TTL_CALENDAR = 300        # 5 minutes
 CACHE_TTL_YEAR_PIXELS = 3600    # 1 hour
 CACHE_TTL_DAILY_PROMPT = 86400  # 24 hours
 
-# Lazy singleton for OpenAI client
-_openai_client = None
-
-
-def _get_openai_client():
-    """Return a shared OpenAI client instance (lazy-initialized)."""
-    global _openai_client
-    if _openai_client is None:
-        from openai import OpenAI
-        from django.conf import settings as django_settings
-        api_key = getattr(django_settings, 'OPENAI_API_KEY', '')
-        if api_key:
-            _openai_client = OpenAI(api_key=api_key)
-    return _openai_client
-
-
 def _push_ws_notification(recipient_id, notif):
     """Push a notification to a user via WebSocket (fire-and-forget)."""
     try:
@@ -313,7 +304,19 @@ class LogoutOtherDevicesView(APIView):
         return Response(_issue_tokens(user))
 
 
+class NotePagination(KeysetPagination):
+    ordering = ('-is_pinned', '-created_at', '-id')
+
+
+class TrashPagination(KeysetPagination):
+    # deleted_at is nullable (notes trashed before it existed); trashed_at falls back to updated_at
+    ordering = ('-trashed_at', '-id')
+    page_size = 50
+
+
 class MoodNoteViewSet(viewsets.ModelViewSet):
+    pagination_class = NotePagination
+
     def get_throttles(self):
         if self.action == 'create':
             return [NoteCreateThrottle()]
@@ -324,6 +327,18 @@ class MoodNoteViewSet(viewsets.ModelViewSet):
             return MoodNoteListSerializer
         return MoodNoteSerializer
 
+    def get_serializer_context(self):
+        ctx = super().get_serializer_context()
+        if self.action == 'list':
+            ctx['search'] = self.request.query_params.get('search')
+        return ctx
+
+    def get_keyset_ordering(self, queryset):
+        """Ranked keyword searches page by relevance; everything else by the paginator's default."""
+        if self.action == 'list' and 'search_rank' in queryset.query.annotations:
+            return ('-search_rank', '-created_at', '-id')
+        return None
+
     def get_queryset(self):
         qs = MoodNote.objects.filter(user=self.request.user, is_deleted=False)
         if self.action == 'list':
@@ -338,6 +353,7 @@ class MoodNoteViewSet(viewsets.ModelViewSet):
                 stress_max=params.get('stress_max'),
                 date_from=params.get('date_from'),
                 date_to=params.get('date_to'),
+                user_id=self.request.user.pk,
             )
         elif self.action == 'retrieve':
             qs = qs.prefetch_related('attachments')
@@ -349,7 +365,8 @@ class MoodNoteViewSet(viewsets.ModelViewSet):
             from api.services.ai_engine import ai_engine
             plaintext = note.content
             if plaintext:
-                result = ai_engine.analyze(plaintext)
+                result = ai_engine.analyze(plaintext, user_id=note.user_id)
+                self._analysis_cache = 'hit' if result.get('cache_hit') else 'miss'
                 note.sentiment_score = result['sentiment_score']
                 note.stress_index = result['stress_index']
                 note.ai_feedback = result['ai_feedback']
@@ -357,21 +374,24 @@ class MoodNoteViewSet(viewsets.ModelViewSet):
         except Exception as e:
             logger.warning('AI analysis failed for note %s: %s', note.pk, e)
 
-    def _invalidate_user_cache(self):
-        """Invalidate analytics and calendar caches for the current user."""
-        uid = self.request.user.id
-        now = timezone.now()
-        cache.delete_many([
-            f'analytics_{uid}_week_30',
-            f'analytics_{uid}_month_30',
-            f'analytics_{uid}_week_7',
-            f'calendar_{uid}_{now.year}_{now.month}',
-        ])
+    def _schedule_ai_analysis(self, note):
+        """Queue analysis for the worker when async mode is on, otherwise run it inline."""
+        from django.conf import settings as django_settings
+        if getattr(django_settings, 'NOTE_ANALYSIS_ASYNC', False):
+            from api.services.analysis_queue import enqueue_analysis
+            enqueue_analysis(note)
+            self._analysis_cache = 'queued'
+        else:
+            self._run_ai_analysis(note)
+
+    def _invalidate_user_cache(self, note):
+        """Invalidate the current user's analytics caches and the calendar month of ``note``."""
+        invalidate_user_cache(self.request.user.id, [note.local_date])
 
     def perform_create(self, serializer):
         note = serializer.save(user=self.request.user)
-        self._run_ai_analysis(note)
-        self._invalidate_user_cache()
+        self._schedule_ai_analysis(note)
+        self._invalidate_user_cache(note)
         # Auto-check achievements
         try:
             from api.services.achievements import check_achievements
@@ -383,14 +403,28 @@ class MoodNoteViewSet(viewsets.ModelViewSet):
 
     def perform_update(self, serializer):
         note = serializer.save()
-        self._run_ai_analysis(note)
-        self._invalidate_user_cache()
+        # Metadata/pin-only edits (or re-sent identical text) keep the existing analysis
+        if note.content_changed:
+            self._schedule_ai_analysis(note)
+        else:
+            self._analysis_cache = 'skipped'
+        self._invalidate_user_cache(note)
 
     def create(self, request, *args, **kwargs):
         self._new_achievements = []
+        self._analysis_cache = None
         response = super().create(request, *args, **kwargs)
         if self._new_achievements:
             response['X-New-Achievements'] = ','.join(self._new_achievements)
+        if self._analysis_cache:
+            response['X-Analysis-Cache'] = self._analysis_cache
+        return response
+
+    def update(self, request, *args, **kwargs):
+        self._analysis_cache = None
+        response = super().update(request, *args, **kwargs)
+        if self._analysis_cache:
+            response['X-Analysis-Cache'] = self._analysis_cache
         return response
 
     @action(detail=True, methods=['post'])
@@ -411,7 +445,7 @@ class MoodNoteViewSet(viewsets.ModelViewSet):
         if image_urls and plaintext:
             try:
                 from api.services.ai_engine import ai_engine
-                result = ai_engine.analyze_with_images(plaintext, image_urls)
+                result = ai_engine.analyze_with_images(plaintext, image_urls, user_id=note.user_id)
                 note.sentiment_score = result['sentiment_score']
                 note.stress_index = result['stress_index']
                 note.ai_feedback = result['ai_feedback']
@@ -434,17 +468,39 @@ class MoodNoteViewSet(viewsets.ModelViewSet):
             return error_response('provide_note_ids', 'Please provide a list of note IDs to delete.')
         if len(ids) > MAX_BATCH_DELETE:
             return error_response('batch_delete_limit', f'Cannot delete more than {MAX_BATCH_DELETE} notes at once.')
-        updated = MoodNote.objects.filter(user=request.user, id__in=ids, is_deleted=False).update(
-            is_deleted=True, deleted_at=timezone.now()
-        )
+        with transaction.atomic():
+            updated = update_notes(
+                MoodNote.objects.filter(user=request.user, id__in=ids, is_deleted=False),
+                is_deleted=True, deleted_at=timezone.now(),
+            )
+            # Queryset updates bypass MoodNote.save, so drop the trashed notes' tags here
+            NoteTag.objects.filter(user=request.user, note_id__in=ids).delete()
         return Response({'deleted': updated})
 
+    @action(detail=False, methods=['get'], url_path='tags')
+    def tags(self, request):
+        """Tag autocomplete: the user's tags starting with ?q=, most used first."""
+        from django.db.models import Count
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 50)
+        except ValueError:
+            limit = 10
+        qs = NoteTag.objects.filter(user=request.user)
+        prefix = request.query_params.get('q', '').strip()
+        if prefix:
+            qs = qs.filter(tag__istartswith=prefix)
+        rows = qs.values('tag').annotate(count=Count('id')).order_by('-count', 'tag')[:limit]
+        return Response([{'tag': row['tag'], 'count': row['count']} for row in rows])
+
     @action(detail=False, methods=['get'])
     def trash(self, request):
-        """List soft-deleted notes (capped at 200)."""
-        qs = MoodNote.objects.filter(user=request.user, is_deleted=True).order_by('-deleted_at')[:200]
-        serializer = MoodNoteListSerializer(qs, many=True)
-        return Response(serializer.data)
+        """List soft-deleted notes, most recently deleted first (cursor-paginated)."""
+        qs = MoodNote.objects.filter(user=request.user, is_deleted=True).annotate(
+            trashed_at=Coalesce('deleted_at', 'updated_at'),
+        )
+        paginator = TrashPagination()
+        page = paginator.paginate_queryset(qs, request, view=self)
+        return paginator.get_paginated_response(MoodNoteListSerializer(page, many=True).data)
 
     @action(detail=True, methods=['post'])
     def restore(self, request, pk=None):
@@ -486,16 +542,12 @@ class AnalyticsView(APIView):
 
         qs = MoodNote.objects.filter(user=request.user, is_deleted=False)
 
-        # Calculate streaks (cap to last 366 dates for performance)
-        dates = list(
-            qs.values_list('created_at__date', flat=True)
-            .distinct()
-            .order_by('-created_at__date')[:366]
-        )
+        # Calculate streaks from the daily rollups (at most the last 366 active days)
+        dates = active_dates(request.user)
         current_streak = 0
         longest_streak = 0
         if dates:
-            today = timezone.localdate()
+            today = request.user.localdate()
             # Current streak: count consecutive days from today/yesterday
             streak = 0
             expected = today
@@ -523,10 +575,10 @@ class AnalyticsView(APIView):
                     run = 1
             longest_streak = best
 
-        gratitude = get_gratitude_stats(qs)
+        gratitude = get_gratitude_stats(qs, today=request.user.localdate())
 
         result = {
-            'mood_trends': get_mood_trends(qs, period=period, lookback_days=lookback_days),
+            'mood_trends': get_mood_trends(request.user, period=period, lookback_days=lookback_days),
             'weather_correlation': get_mood_weather_correlation(qs, lookback_days=lookback_days),
             'frequent_tags': get_frequent_tags(qs, lookback_days=lookback_days),
             'stress_by_tag': get_stress_by_tag(qs, lookback_days=lookback_days),
@@ -544,8 +596,9 @@ class AnalyticsView(APIView):
 class CalendarView(APIView):
     def get(self, request):
         try:
-            year = int(request.query_params.get('year', timezone.now().year))
-            month = int(request.query_params.get('month', timezone.now().month))
+            today = request.user.localdate()
+            year = int(request.query_params.get('year', today.year))
+            month = int(request.query_params.get('month', today.month))
         except (ValueError, TypeError):
             return error_response('invalid_year_month', 'Invalid year or month.')
         if not (1 <= month <= 12) or not (1900 <= year <= 2100):
@@ -556,8 +609,7 @@ class CalendarView(APIView):
         if cached is not None:
             return Response(cached)
 
-        qs = MoodNote.objects.filter(user=request.user, is_deleted=False)
-        days = get_calendar_data(qs, year, month)
+        days = get_calendar_data(request.user, year, month)
         result = {'year': year, 'month': month, 'days': days}
         cache.set(cache_key, result, CACHE_TTL_CALENDAR)
         return Response(result)
@@ -833,10 +885,12 @@ class AdminStatsView(APIView):
             **user_stats,
             **note_stats,
             'pending_counselors': pending_counselors,
+            'llm_circuits': breaker_metrics(),
         })
 
 
-class AdminUserPagination(rest_framework.pagination.PageNumberPagination):
+class AdminUserPagination(KeysetPagination):
+    ordering = ('-date_joined', '-id')
     page_size = 50
 
 
@@ -848,7 +902,7 @@ class AdminUserListView(generics.ListAPIView):
     search_fields = ['username', 'email']
 
     def get_queryset(self):
-        return User.objects.all().order_by('-date_joined')
+        return User.objects.all()
 
 
 class AdminUserDetailView(generics.RetrieveUpdateAPIView):
@@ -902,7 +956,7 @@ class AdminCounselorActionView(APIView):
 
 # ===== Notification Views =====
 
-class NotificationPagination(rest_framework.pagination.PageNumberPagination):
+class NotificationPagination(KeysetPagination):
     page_size = 50
 
 
@@ -911,7 +965,7 @@ class NotificationListView(generics.ListAPIView):
     pagination_class = NotificationPagination
 
     def get_queryset(self):
-        return Notification.objects.filter(user=self.request.user).order_by('-created_at')
+        return Notification.objects.filter(user=self.request.user)
 
 
 class NotificationReadView(APIView):
@@ -1050,13 +1104,19 @@ class AvailableSlotsView(APIView):
         return Response(available)
 
 
+class BookingPagination(KeysetPagination):
+    page_size = 50
+
+
 class BookingListView(APIView):
     def get(self, request):
         user = request.user
         bookings = Booking.objects.filter(
             Q(user=user) | Q(counselor=user)
-        ).select_related('user', 'counselor').order_by('-created_at')[:100]
-        return Response(BookingSerializer(bookings, many=True).data)
+        ).select_related('user', 'counselor')
+        paginator = BookingPagination()
+        page = paginator.paginate_queryset(bookings, request, view=self)
+        return paginator.get_paginated_response(BookingSerializer(page, many=True).data)
 
 
 class BookingCreateView(APIView):
@@ -1341,6 +1401,8 @@ class DeleteAccountView(APIView):
         if not request.user.check_password(password):
             return error_response('incorrect_password', 'Incorrect password.')
         log_action(request.user, 'account_delete', request)
+        # Crypto-shred first: note ciphertexts left in replicas or backups become unreadable
+        encryption_service.destroy_data_key(request.user.pk)
         request.user.delete()
         return Response({'status': 'ok'}, status=status.HTTP_200_OK)
 
@@ -1355,6 +1417,7 @@ class ExportDataView(APIView):
 
         user = request.user
         notes = MoodNote.objects.filter(user=user, is_deleted=False).order_by('-created_at')[:MAX_EXPORT_NOTES]
+        notes = MoodNote.prefetch_content(notes)
 
         data = {
             'user': {
@@ -1399,6 +1462,7 @@ class ExportCSVView(APIView):
 
         user = request.user
         notes = MoodNote.objects.filter(user=user, is_deleted=False).order_by('-created_at')[:MAX_EXPORT_NOTES]
+        notes = MoodNote.prefetch_content(notes)
 
         buf = io.StringIO()
         writer = csv.writer(buf)
@@ -1435,6 +1499,7 @@ class FeedbackCreateView(generics.CreateAPIView):
 class AdminFeedbackListView(generics.ListAPIView):
     serializer_class = FeedbackSerializer
     permission_classes = [permissions.IsAdminUser]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         return Feedback.objects.select_related('user').all()
@@ -1446,20 +1511,8 @@ class AIChatSessionListCreateView(APIView):
     """List all active sessions or create a new one."""
 
     def get(self, request):
-        from django.db.models import Count, Subquery, OuterRef
-        from django.db.models.functions import Substr
-        last_msg_subquery = (
-            AIChatMessage.objects.filter(session=OuterRef('pk'))
-            .order_by('-created_at')
-            .values('content')[:1]
-        )
-        sessions = (
-            AIChatSession.objects.filter(user=request.user, is_active=True)
-            .annotate(
-                _message_count=Count('messages'),
-                _last_message_preview=Substr(Subquery(last_msg_subquery), 1, 80),
-            )
-        )
+        # message_count / last_message_* are denormalized columns — no joins or subqueries
+        sessions = AIChatSession.objects.filter(user=request.user, is_active=True)
         return Response(AIChatSessionSerializer(sessions, many=True).data)
 
     def post(self, request):
@@ -1535,30 +1588,16 @@ class AIChatSendMessageView(APIView):
         if len(content) > MAX_AI_CHAT_MESSAGE_LENGTH:
             return error_response('message_too_long', f'Message cannot exceed {MAX_AI_CHAT_MESSAGE_LENGTH} characters.')
 
-        # Analyze sentiment locally
-        from .services.ai_chat import analyze_user_message, generate_ai_response, _get_lang
-        sentiment = analyze_user_message(content)
-
-        # Save user message
-        user_msg = AIChatMessage.objects.create(
-            session=session,
-            role='user',
-            content=content,
-            sentiment_score=sentiment['sentiment_score'],
-            stress_index=sentiment['stress_index'],
+        # Save user message (with local sentiment analysis)
+        from .services.ai_chat import (
+            _get_lang, generate_ai_response, load_context, save_user_message,
         )
+        from .services.analysis_queue import enqueue_summary
+        user_msg = save_user_message(session, content)
 
-        # Auto-set session title from first message
-        if session.messages.count() == 1:
-            session.title = content[:50]
-            session.save(update_fields=['title', 'updated_at'])
-        else:
-            session.save(update_fields=['updated_at'])
-
-        # Generate AI response
+        # Generate AI response — ws/ai-chat/<session_id>/ streams the same reply token by token
         lang = _get_lang(request.headers.get('Accept-Language', ''))
-        all_messages = list(session.messages.all())
-        ai_content = generate_ai_response(all_messages, lang)
+        ai_content = generate_ai_response(load_context(session), lang, session.summary)
 
         # Save assistant message
         ai_msg = AIChatMessage.objects.create(
@@ -1566,6 +1605,7 @@ class AIChatSendMessageView(APIView):
             role='assistant',
             content=ai_content,
         )
+        enqueue_summary(session)
 
         return Response({
             'user_message': AIChatMessageSerializer(user_msg).data,
@@ -1577,18 +1617,18 @@ class AIChatSendMessageView(APIView):
 
 class YearPixelsView(APIView):
     def get(self, request):
+        this_year = request.user.localdate().year
         try:
-            year = int(request.query_params.get('year', timezone.now().year))
+            year = int(request.query_params.get('year', this_year))
         except (ValueError, TypeError):
-            year = timezone.now().year
+            year = this_year
 
         cache_key = f'year_pixels_{request.user.id}_{year}'
         cached = cache.get(cache_key)
         if cached is not None:
             return Response({'year': year, 'pixels': cached})
 
-        qs = MoodNote.objects.filter(user=request.user, is_deleted=False)
-        pixels = get_year_pixels(qs, year)
+        pixels = get_year_pixels(request.user, year)
         cache.set(cache_key, pixels, CACHE_TTL_YEAR_PIXELS)
         return Response({'year': year, 'pixels': pixels})
 
@@ -1692,7 +1732,7 @@ class DailyPromptView(APIView):
             avg_s = recent['avg_s']
             avg_st = recent['avg_st']
 
-            client = _get_openai_client()
+            client = get_openai_client('daily_prompt')
             if client:
                 lang = request.headers.get('Accept-Language', 'zh-TW')
                 lang_map = {'zh-TW': 'Traditional Chinese', 'en': 'English', 'ja': 'Japanese'}
@@ -1703,22 +1743,22 @@ class DailyPromptView(APIView):
                 if avg_st is not None:
                     mood_ctx += f"Average stress level is {avg_st:.1f}/10. "
 
-                resp = client.chat.completions.create(
-                    model='gpt-4o-mini',
-                    messages=[{
-                        'role': 'system',
-                        'content': (
-                            f'You are a gentle journaling coach. {mood_ctx}'
-                            f'Generate one short, open-ended journaling prompt in {lang_name}. '
-                            f'Keep it to ONE simple question (under 20 words). '
-                            f'The prompt should be easy to start writing from directly. '
-                            f'Avoid long instructions or multi-part questions. No quotes or labels.'
-                        ),
-                    }],
-                    max_tokens=60,
-                    temperature=0.8,
-                    timeout=15,
-                )
+                with llm_guard('daily_prompt', model='gpt-4o-mini'):
+                    resp = client.chat.completions.create(
+                        model='gpt-4o-mini',
+                        messages=[{
+                            'role': 'system',
+                            'content': (
+                                f'You are a gentle journaling coach. {mood_ctx}'
+                                f'Generate one short, open-ended journaling prompt in {lang_name}. '
+                                f'Keep it to ONE simple question (under 20 words). '
+                                f'The prompt should be easy to start writing from directly. '
+                                f'Avoid long instructions or multi-part questions. No quotes or labels.'
+                            ),
+                        }],
+                        max_tokens=60,
+                        temperature=0.8,
+                    )
                 prompt_text = resp.choices[0].message.content.strip()
         except Exception as e:
             logger.warning('Daily prompt generation failed: %s', e)
@@ -1761,8 +1801,8 @@ class WeeklySummaryView(APIView):
         notes_qs = MoodNote.objects.filter(
             user=request.user,
             is_deleted=False,
-            created_at__date__gte=summary.week_start,
-            created_at__date__lte=week_end,
+            local_date__gte=summary.week_start,
+            local_date__lte=week_end,
         ).order_by('created_at')
         lang = request.query_params.get('lang') or request.headers.get('Accept-Language', 'zh-TW').split(',')[0].strip()
         buf = generate_weekly_summary_pdf(summary, notes_qs, request.user, lang=lang)
@@ -1805,10 +1845,7 @@ class WeeklySummaryView(APIView):
         if summary:
             # Always refresh note_count to reflect current actual count
             week_end = week_start + timedelta(days=6)
-            actual_count = MoodNote.objects.filter(
-                user=request.user, is_deleted=False,
-                created_at__date__gte=week_start, created_at__date__lte=week_end,
-            ).count()
+            actual_count = summarize(daily_rows(request.user, week_start, week_end))['count']
             if summary.note_count != actual_count:
                 summary.note_count = actual_count
                 summary.save(update_fields=['note_count'])
@@ -1819,30 +1856,25 @@ class WeeklySummaryView(APIView):
             notes = MoodNote.objects.filter(
                 user=request.user,
                 is_deleted=False,
-                created_at__date__gte=week_start,
-                created_at__date__lte=week_end,
+                local_date__gte=week_start,
+                local_date__lte=week_end,
             )
-            note_count = notes.count()
+            # Counts, averages and activities come from the week's (at most 7) rollup rows
+            totals = summarize(daily_rows(request.user, week_start, week_end))
+            note_count = totals['count']
             if note_count == 0:
                 return error_response('no_notes_this_week', 'No notes found for this week.', 404)
 
-            agg = notes.aggregate(avg_s=Avg('sentiment_score'), avg_st=Avg('stress_index'))
-
-            # Count activities
-            activity_counts = {}
-            for note in notes.values('metadata'):
-                meta = note.get('metadata') or {}
-                for act in meta.get('activities', []):
-                    activity_counts[act] = activity_counts.get(act, 0) + 1
+            agg = {'avg_s': totals['avg_sentiment'], 'avg_st': totals['avg_stress']}
             top_activities = sorted(
-                [{'name': k, 'count': v} for k, v in activity_counts.items()],
+                [{'name': k, 'count': v} for k, v in totals['activity_counts'].items()],
                 key=lambda x: x['count'], reverse=True,
             )[:5]
 
             # Generate AI summary
             ai_summary = ''
             try:
-                client = _get_openai_client()
+                client = get_openai_client('weekly_summary')
                 if client:
                     lang = request.headers.get('Accept-Language', 'zh-TW')
                     lang_map = {'zh-TW': 'Traditional Chinese', 'en': 'English', 'ja': 'Japanese'}
@@ -1874,13 +1906,13 @@ class WeeklySummaryView(APIView):
                     # Dynamic token limit: base 300 + 100 per diary entry, cap at 1500
                     max_tok = min(300 + note_count * 100, 1500)
 
-                    resp = client.chat.completions.create(
-                        model='gpt-4o-mini',
-                        messages=[{'role': 'system', 'content': content}],
-                        max_tokens=max_tok,
-                        temperature=0.7,
-                        timeout=30,
-                    )
+                    with llm_guard('weekly_summary', model='gpt-4o-mini'):
+                        resp = client.chat.completions.create(
+                            model='gpt-4o-mini',
+                            messages=[{'role': 'system', 'content': content}],
+                            max_tokens=max_tok,
+                            temperature=0.7,
+                        )
                     ai_summary = resp.choices[0].message.content.strip()
             except Exception as e:
                 logger.warning('Weekly summary AI generation failed: %s', e)
@@ -1926,7 +1958,7 @@ class DailySleepView(APIView):
             except ValueError:
                 return error_response('invalid_date_format', 'Invalid date format. Use YYYY-MM-DD.')
         else:
-            date = timezone.localdate()
+            date = request.user.localdate()
         try:
             record = DailySleep.objects.get(user=request.user, date=date)
             return Response(DailySleepSerializer(record).data)
@@ -1934,7 +1966,7 @@ class DailySleepView(APIView):
             return Response({'date': str(date), 'sleep_hours': None, 'sleep_quality': None})
 
     def post(self, request):
-        date = request.data.get('date', str(timezone.localdate()))
+        date = request.data.get('date', str(request.user.localdate()))
         record, _created = DailySleep.objects.update_or_create(
             user=request.user,
             date=date,
@@ -1967,8 +1999,8 @@ class TherapistReportCreateView(generics.CreateAPIView):
 
         notes = MoodNote.objects.filter(
             user=user, is_deleted=False,
-            created_at__date__gte=period_start,
-            created_at__date__lte=period_end,
+            local_date__gte=period_start,
+            local_date__lte=period_end,
             sentiment_score__isnull=False,
         )
 
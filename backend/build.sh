@@ -8,7 +8,13 @@ pip install -r ../requirements.txt
 echo "==> Collecting static files..."
 python manage.py collectstatic --noinput
 
+echo "==> Building jieba dictionary cache..."
+python manage.py build_jieba_cache
+
 echo "==> Running database migrations..."
 python manage.py migrate --noinput
 
+echo "==> Indexing notes missing from the search index..."
+python manage.py build_search_index --missing
+
 echo "==> Build complete!"
@@ -210,8 +210,99 @@ if ENCRYPTION_KEY:
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
 OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-4o-mini')
 
+# Shared OpenAI client pool (api/services/llm_client.py) — one keep-alive httpx pool
+# per process; timeouts (seconds) and retries are per use case.
+OPENAI_POOL_SIZE = int(os.getenv('OPENAI_POOL_SIZE', '20'))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv('OPENAI_KEEPALIVE_EXPIRY', '60'))
+OPENAI_MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', '2'))
+OPENAI_CALL_POLICIES = {
+    'default': {'timeout': float(os.getenv('OPENAI_TIMEOUT', '30'))},
+    'sentiment': {'timeout': 15, 'max_retries': 1},
+    'feedback': {'timeout': 20, 'max_retries': 1},
+    'analysis': {'timeout': 25, 'max_retries': 1},
+    'vision': {'timeout': 30, 'max_retries': 1},
+    'chat': {'timeout': 30},
+    'chat_summary': {'timeout': 20, 'max_retries': 1},
+    'daily_prompt': {'timeout': 15, 'max_retries': 1},
+    'weekly_summary': {'timeout': 30, 'max_retries': 1},
+}
+
+# AI chat context: newest AI_CHAT_CONTEXT_MESSAGES messages, trimmed to an estimated
+# AI_CHAT_CONTEXT_TOKEN_BUDGET, plus a rolling session summary that absorbs older messages
+# once AI_CHAT_SUMMARY_EVERY of them have fallen out of the window. Each refresh (see
+# CHAT_SUMMARY_ASYNC) folds at most AI_CHAT_SUMMARY_EVERY × AI_CHAT_SUMMARY_MAX_BATCHES
+# of the oldest such messages, so a long backlog is caught up in several bounded steps.
+AI_CHAT_CONTEXT_MESSAGES = int(os.getenv('AI_CHAT_CONTEXT_MESSAGES', '20'))
+AI_CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv('AI_CHAT_CONTEXT_TOKEN_BUDGET', '3000'))
+AI_CHAT_SUMMARY_EVERY = int(os.getenv('AI_CHAT_SUMMARY_EVERY', '10'))
+AI_CHAT_SUMMARY_MAX_BATCHES = int(os.getenv('AI_CHAT_SUMMARY_MAX_BATCHES', '3'))
+
+# Circuit breaker per (model, use case): opens when at least failure_rate of the calls in
+# the last window_seconds (min_calls or more) raised or exceeded slow_call_seconds; after
+# open_seconds one probe call is let through. shared=True mirrors the open state in the cache.
+LLM_BREAKER = {
+    'failure_rate': float(os.getenv('LLM_BREAKER_FAILURE_RATE', '0.5')),
+    'min_calls': int(os.getenv('LLM_BREAKER_MIN_CALLS', '5')),
+    'window_seconds': float(os.getenv('LLM_BREAKER_WINDOW_SECONDS', '60')),
+    'slow_call_seconds': float(os.getenv('LLM_BREAKER_SLOW_CALL_SECONDS', '12')),
+    'open_seconds': float(os.getenv('LLM_BREAKER_OPEN_SECONDS', '30')),
+    'shared': os.getenv('LLM_BREAKER_SHARED', 'False').lower() in ('true', '1', 'yes'),
+}
+
+# Note analysis queue — when enabled, note create/update only enqueue a
+# NoteAnalysisJob and `manage.py process_analysis_jobs` runs the AI analysis.
+NOTE_ANALYSIS_ASYNC = os.getenv('NOTE_ANALYSIS_ASYNC', 'False').lower() in ('true', '1', 'yes')
+# AI chat summary refreshes are queued as AIChatSummaryJob for the same worker, so the
+# summary completion never delays a chat reply. Without a worker, set False to refresh inline.
+CHAT_SUMMARY_ASYNC = os.getenv('CHAT_SUMMARY_ASYNC', 'True').lower() in ('true', '1', 'yes')
+NOTE_ANALYSIS_MAX_ATTEMPTS = int(os.getenv('NOTE_ANALYSIS_MAX_ATTEMPTS', '3'))
+NOTE_ANALYSIS_STALE_SECONDS = int(os.getenv('NOTE_ANALYSIS_STALE_SECONDS', '600'))
+# 'structured' = one completion for scores + feedback; 'two_call' = sentiment call then feedback call
+NOTE_ANALYSIS_MODE = os.getenv('NOTE_ANALYSIS_MODE', 'structured')
+# Once this many seconds have gone into LLM tiers, analyze() stops trying further
+# OpenAI fallbacks (two-call flow, RAG) and finishes with local analysis
+NOTE_ANALYSIS_LATENCY_BUDGET = float(os.getenv('NOTE_ANALYSIS_LATENCY_BUDGET', '20'))
+# LLM analysis results cached by keyed hash of (mode, model, plaintext)
+NOTE_ANALYSIS_CACHE_TTL = int(os.getenv('NOTE_ANALYSIS_CACHE_TTL', str(7 * 86400)))
+
+# jieba — JIEBA_PRELOAD warms the tokenizer in AppConfig.ready(); JIEBA_CACHE_DIR holds
+# the versioned prefix-dictionary cache written by `manage.py build_jieba_cache`.
+JIEBA_PRELOAD = os.getenv('JIEBA_PRELOAD', 'False').lower() in ('true', '1', 'yes')
+JIEBA_CACHE_DIR = os.getenv('JIEBA_CACHE_DIR', str(BASE_DIR / 'jieba_cache'))
+
+# EncryptionService.decrypt_many uses DECRYPT_WORKERS threads once a batch has at least
+# DECRYPT_PARALLEL_THRESHOLD unique tokens (0 disables the thread pool)
+DECRYPT_PARALLEL_THRESHOLD = int(os.getenv('DECRYPT_PARALLEL_THRESHOLD', '256'))
+DECRYPT_WORKERS = int(os.getenv('DECRYPT_WORKERS', '4'))
+# Envelope encryption: new note content is encrypted under a per-user data key wrapped by
+# ENCRYPTION_KEY. Unwrapped data keys stay in a per-process LRU for DATA_KEY_CACHE_TTL seconds.
+ENVELOPE_ENCRYPTION = os.getenv('ENVELOPE_ENCRYPTION', 'True').lower() in ('true', '1', 'yes')
+DATA_KEY_CACHE_SIZE = int(os.getenv('DATA_KEY_CACHE_SIZE', '1024'))
+DATA_KEY_CACHE_TTL = int(os.getenv('DATA_KEY_CACHE_TTL', '300'))
+# Storage format for new note ciphertexts: 'binary' (MoodNote.encrypted_blob: header byte +
+# raw Fernet token, zlib-compressed first when that helps) or 'text' (legacy base64 token).
+# Plaintexts shorter than CIPHERTEXT_COMPRESS_MIN_BYTES are never compressed.
+NOTE_CIPHERTEXT_FORMAT = os.getenv('NOTE_CIPHERTEXT_FORMAT', 'binary')
+CIPHERTEXT_COMPRESS_MIN_BYTES = int(os.getenv('CIPHERTEXT_COMPRESS_MIN_BYTES', '256'))
+
+# Note keyword search: 'blind' (hashed-term index over the full encrypted text, unranked) or
+# 'native' (pg_trgm on PostgreSQL / FTS5 on SQLite over search_text, relevance-ranked)
+NOTE_SEARCH_BACKEND = os.getenv('NOTE_SEARCH_BACKEND', 'blind')
+
+# Analytics correlations and binning run on small NumPy kernels; only inputs with at least
+# ANALYTICS_SCIPY_MIN_ROWS rows import and use scipy/pandas (0 = never)
+ANALYTICS_SCIPY_MIN_ROWS = int(os.getenv('ANALYTICS_SCIPY_MIN_ROWS', '50000'))
+
 # ChromaDB
 CHROMA_PERSIST_DIR = os.getenv('CHROMA_PERSIST_DIR', str(BASE_DIR / 'chroma_db'))
+# RAG retriever: 'chroma' (ChromaDB + OpenAI embeddings) or 'bm25' (offline memory-mapped
+# index in KB_INDEX_DIR, built by `manage.py load_knowledge_base`). RAG_HYBRID_WEIGHT blends
+# cosine similarity into BM25 ranking when the index stores embeddings (0 = BM25 only).
+RAG_RETRIEVER = os.getenv('RAG_RETRIEVER', 'chroma')
+KB_INDEX_DIR = os.getenv('KB_INDEX_DIR', str(BASE_DIR / 'kb_index'))
+RAG_HYBRID_WEIGHT = float(os.getenv('RAG_HYBRID_WEIGHT', '0.5'))
+# In-process LRU of RAG query embeddings + retrieved chunks, keyed by normalized note excerpt
+RAG_QUERY_CACHE_SIZE = int(os.getenv('RAG_QUERY_CACHE_SIZE', '256'))
 FRONTEND_URL = os.getenv('FRONTEND_URL', 'http://localhost:5173')
 
 # Email
@@ -8,8 +8,9 @@ const invalidateNotesCaches = () => {
   invalidate('analytics');
 };
 
-export const getNotes = (page = 1, filters = {}) => {
-  const params = new URLSearchParams({ page });
+/** One page of the journal feed. Pass the `cursor` from the previous page's `next` link; the first page also returns `count`. */
+export const getNotes = (cursor = null, filters = {}) => {
+  const params = new URLSearchParams(cursor ? { cursor } : { count: 1 });
   Object.entries(filters).forEach(([key, value]) => {
     if (value !== undefined && value !== null && value !== '') {
       params.append(key, value);
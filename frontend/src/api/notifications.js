@@ -1,11 +1,11 @@
 import api from './axios'
 import { getCached, setCache, invalidate } from './cache'
 
-export const getNotifications = (page = 1) => {
-  const key = `notifications:${page}`
+export const getNotifications = (cursor = null) => {
+  const key = `notifications:${cursor || 'first'}`
   const cached = getCached(key)
   if (cached) return Promise.resolve(cached)
-  return api.get(`/notifications/?page=${page}`).then(res => {
+  return api.get('/notifications/', { params: cursor ? { cursor } : {} }).then(res => {
     setCache(key, res, 30_000)
     return res
   })
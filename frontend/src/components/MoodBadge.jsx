@@ -13,6 +13,7 @@ const moodLabelKeys = {
   neutral: 'mood.neutral',
   negative: 'mood.negative',
   unknown: 'mood.unknown',
+  pending: 'mood.analyzing',
 }
 
 function getMoodLevel(score) {
@@ -22,11 +23,12 @@ function getMoodLevel(score) {
   return 'negative'
 }
 
-export default memo(function MoodBadge({ score }) {
+export default memo(function MoodBadge({ score, status }) {
   const { t } = useLang()
   const level = getMoodLevel(score)
   const color = moodColors[level]
-  const label = t(moodLabelKeys[level])
+  // A queued re-analysis keeps the old score until the worker pushes the new one
+  const label = t(moodLabelKeys[status === 'pending' ? 'pending' : level])
 
   return (
     <span className={`inline-flex items-center px-2.5 py-0.5 rounded-full text-xs font-medium border ${color}`}>
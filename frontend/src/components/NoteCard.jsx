@@ -36,7 +36,7 @@ export default memo(function NoteCard({ note, highlight }) {
               </span>
             )}
           </div>
-          <MoodBadge score={note.sentiment_score} />
+          <MoodBadge score={note.sentiment_score} status={note.analysis_status} />
         </div>
         <p className="text-sm leading-relaxed mb-3 opacity-80">
           <HighlightText text={stripHtml(note.content_preview) || '...'} keyword={highlight} />
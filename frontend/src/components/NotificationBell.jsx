@@ -4,6 +4,7 @@ import { useLang } from '../context/LanguageContext'
 import { getNotifications, markNotificationsRead } from '../api/notifications'
 import { getAccessToken } from '../utils/tokenStorage'
 import { LOCALE_MAP } from '../utils/locales'
+import { NOTE_ANALYSIS_EVENT } from '../hooks/useNoteAnalysis'
 
 const NOTIF_TYPE_KEYS = {
   message: 'notification.type.message',
@@ -119,6 +120,11 @@ export default memo(function NotificationBell() {
       if (data.error) {
         return
       }
+      // Background note analysis results are not user-facing notifications
+      if (data.type === 'note_analysis') {
+        window.dispatchEvent(new CustomEvent(NOTE_ANALYSIS_EVENT, { detail: data }))
+        return
+      }
       setNotifications((prev) => [data, ...prev])
       setUnreadCount((c) => c + 1)
     }
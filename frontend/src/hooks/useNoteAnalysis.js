@@ -0,0 +1,25 @@
+import { useEffect, useRef } from 'react'
+
+// NotificationBell re-dispatches background note analysis results as this window event
+export const NOTE_ANALYSIS_EVENT = 'heartbox:note-analysis'
+
+export function applyNoteAnalysis(note, result) {
+  return {
+    ...note,
+    analysis_status: result.analysis_status,
+    sentiment_score: result.sentiment_score,
+    stress_index: result.stress_index,
+    ai_feedback: result.ai_feedback,
+  }
+}
+
+export function useNoteAnalysis(onResult) {
+  const handlerRef = useRef(onResult)
+  handlerRef.current = onResult
+
+  useEffect(() => {
+    const listener = (e) => handlerRef.current(e.detail)
+    window.addEventListener(NOTE_ANALYSIS_EVENT, listener)
+    return () => window.removeEventListener(NOTE_ANALYSIS_EVENT, listener)
+  }, [])
+}
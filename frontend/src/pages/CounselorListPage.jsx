@@ -132,7 +132,7 @@ export default function CounselorListPage() {
       ])
       setCounselors(counselorRes.data.results || counselorRes.data)
       setConversations(convRes.data.results || convRes.data)
-      setBookings(bookingRes.data)
+      setBookings(bookingRes.data.results ?? bookingRes.data)
 
       try {
         const profileRes = await getMyCounselorProfile()
@@ -5,6 +5,7 @@ import { getAnalytics } from '../api/analytics'
 import { useLang } from '../context/LanguageContext'
 import { getDailyPrompt } from '../api/wellness'
 import { LOCALE_MAP } from '../utils/locales'
+import { applyNoteAnalysis, useNoteAnalysis } from '../hooks/useNoteAnalysis'
 import NoteForm from '../components/NoteForm'
 import NoteCard from '../components/NoteCard'
 import SkeletonCard from '../components/SkeletonCard'
@@ -42,6 +43,8 @@ export default function JournalPage() {
   const [dailyPrompt, setDailyPrompt] = useState('')
   const [promptContent, setPromptContent] = useState(null)
   const fetchIdRef = useRef(0)
+  // cursorsRef.current[p - 1] is the cursor that fetches page p (keyset pagination)
+  const cursorsRef = useRef([null])
 
   // Close context menu on click anywhere
   useEffect(() => {
@@ -51,6 +54,11 @@ export default function JournalPage() {
     return () => window.removeEventListener('click', handler)
   }, [contextMenu])
 
+  // Scores arrive over the notification socket once the background analysis finishes
+  useNoteAnalysis((result) => {
+    setNotes((prev) => prev.map((n) => n.id === result.note_id ? applyNoteAnalysis(n, result) : n))
+  })
+
   const handleContextMenu = useCallback((e, noteId) => {
     e.preventDefault()
     e.stopPropagation()
@@ -95,11 +103,13 @@ export default function JournalPage() {
     const id = ++fetchIdRef.current
     setLoading(true)
     try {
-      const { data } = await getNotes(p, f)
+      if (p === 1) cursorsRef.current = [null]
+      const { data } = await getNotes(cursorsRef.current[p - 1], f)
       if (id !== fetchIdRef.current) return
       setNotes(data.results || [])
       setHasNext(!!data.next)
-      setTotalCount(data.count || 0)
+      if (data.next) cursorsRef.current[p] = new URL(data.next).searchParams.get('cursor')
+      if (data.count !== undefined) setTotalCount(data.count)
       setPage(p)
     } catch (err) {
       if (id !== fetchIdRef.current) return
@@ -113,7 +123,7 @@ export default function JournalPage() {
     setTrashLoading(true)
     try {
       const { data } = await getTrashNotes()
-      setTrashNotes(data)
+      setTrashNotes(data.results ?? data)
     } catch { setTrashNotes([]) }
     finally { setTrashLoading(false) }
   }
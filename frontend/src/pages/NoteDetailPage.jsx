@@ -12,6 +12,7 @@ import ConfirmModal from '../components/ConfirmModal'
 import ShareNoteButton from '../components/ShareNoteButton'
 import EditorToolbar from '../components/EditorToolbar'
 import { useToast } from '../context/ToastContext'
+import { applyNoteAnalysis, useNoteAnalysis } from '../hooks/useNoteAnalysis'
 
 import { LOCALE_MAP, TZ_MAP } from '../utils/locales'
 
@@ -51,6 +52,12 @@ export default function NoteDetailPage() {
       .finally(() => setLoading(false))
   }, [id, navigate])
 
+  useNoteAnalysis((result) => {
+    if (String(result.note_id) === String(id)) {
+      setNote((prev) => prev && applyNoteAnalysis(prev, result))
+    }
+  })
+
   // Warn before leaving if editing
   useEffect(() => {
     const handler = (e) => {
@@ -151,7 +158,7 @@ export default function NoteDetailPage() {
         <div className="flex items-center justify-between">
           <span className="text-sm opacity-60">{date}</span>
           <div className="flex items-center gap-3">
-            <MoodBadge score={note.sentiment_score} />
+            <MoodBadge score={note.sentiment_score} status={note.analysis_status} />
             <button
               onClick={handleTogglePin}
               className={`text-xs px-2 py-1 rounded-lg border cursor-pointer transition-colors ${note.is_pinned ? 'bg-yellow-500/20 border-yellow-500/40 text-yellow-500' : 'border-white/10 opacity-60 hover:opacity-100'}`}